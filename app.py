@@ -1,19 +1,36 @@
-from itertools import combinations
-from math import comb
-import copy
+import os
 import time
 import streamlit as st
 
+from boardcode import (
+    apply_diff,
+    board_from_code,
+    board_to_code,
+    decode_board,
+    filled_board,
+    set_board_cell,
+    undo_diff,
+)
+from engine import COLORS, COLS, NORMAL_COLORS, ROWS
+from jobs import MAX_CONCURRENT_SEARCHES, SearchJob
+from liveanalysis import LiveAnalysis
+from mcsearch import MC_SAMPLES, run_mc_search
+from resultcache import ResultCache
+from search import (
+    ENGINES,
+    TOP_N,
+    count_patterns,
+    default_min_k,
+    estimate_search,
+    estimate_sweep,
+    run_search,
+    run_sweep,
+    suggest_paint_count,
+)
+
 # =========================================================
-# 基本設定
+# 表示設定
 # =========================================================
-ROWS = 6
-COLS = 8
-DIR4 = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-
-COLORS = ["赤", "青", "緑", "黄", "紫", "ハート", "空"]
-NORMAL_COLORS = ["赤", "青", "緑", "黄", "紫"]
-
 EMOJI = {
     "赤": "🟥",
     "青": "🟦",
@@ -22,311 +39,42 @@ EMOJI = {
     "紫": "🟪",
     "ハート": "💖",
     "空": "⬛",
+    "？": "❔",
 }
 
-MARK_PAINT = "🖌️"   # 塗り替えマーク（表示用）
-MARK_START = "✂️"   # 起点マーク（表示用）
-
-# =========================================================
-# 連結探索（指定色の連結サイズを数える）
-# =========================================================
-def count_component(field, sr, sc, color, blocked=None):
-    if blocked is None:
-        blocked = set()
-    if not (0 <= sr < ROWS and 0 <= sc < COLS):
-        return 0
-    if (sr, sc) in blocked:
-        return 0
-    if field[sr][sc] != color:
-        return 0
-
-    stack = [(sr, sc)]
-    seen = {(sr, sc)}
-    while stack:
-        r, c = stack.pop()
-        for dr, dc in DIR4:
-            nr, nc = r + dr, c + dc
-            if 0 <= nr < ROWS and 0 <= nc < COLS:
-                if (nr, nc) in blocked:
-                    continue
-                if (nr, nc) not in seen and field[nr][nc] == color:
-                    seen.add((nr, nc))
-                    stack.append((nr, nc))
-    return len(seen)
-
-# =========================================================
-# 「盤面全体で消えるものがあるか」
-# =========================================================
-def has_any_erase_global(field):
-    visited = [[False] * COLS for _ in range(ROWS)]
-    erase = set()
-
-    for r in range(ROWS):
-        for c in range(COLS):
-            if visited[r][c]:
-                continue
-            v = field[r][c]
-            if v in ("空", "ハート"):
-                visited[r][c] = True
-                continue
-
-            stack = [(r, c)]
-            visited[r][c] = True
-            comp = [(r, c)]
-            while stack:
-                cr, cc = stack.pop()
-                for dr, dc in DIR4:
-                    nr, nc = cr + dr, cc + dc
-                    if 0 <= nr < ROWS and 0 <= nc < COLS:
-                        if not visited[nr][nc] and field[nr][nc] == v:
-                            visited[nr][nc] = True
-                            stack.append((nr, nc))
-                            comp.append((nr, nc))
-
-            if len(comp) >= 4:
-                erase |= set(comp)
-
-    if not erase:
-        return False
-
-    # ハート巻き込み
-    for r in range(ROWS):
-        for c in range(COLS):
-            if field[r][c] == "ハート":
-                for dr, dc in DIR4:
-                    nr, nc = r + dr, c + dc
-                    if 0 <= nr < ROWS and 0 <= nc < COLS:
-                        if (nr, nc) in erase:
-                            return True
-    return True
-
-# =========================================================
-# 「塗り替え直後に消える」判定を局所だけで行う（高速）
-# =========================================================
-def local_has_erase_after_recolor(field, changed_cells):
-    focus = set()
-    for (r, c) in changed_cells:
-        focus.add((r, c))
-        for dr, dc in DIR4:
-            nr, nc = r + dr, c + dc
-            if 0 <= nr < ROWS and 0 <= nc < COLS:
-                focus.add((nr, nc))
-
-    checked = set()
-    for (r, c) in focus:
-        v = field[r][c]
-        if v in ("空", "ハート"):
-            continue
-        if (r, c, v) in checked:
-            continue
-        size = count_component(field, r, c, v)
-        if size >= 4:
-            return True
-        checked.add((r, c, v))
-
-    # ハート巻き込み（念のため）
-    for (r, c) in focus:
-        if field[r][c] != "ハート":
-            continue
-        for dr, dc in DIR4:
-            nr, nc = r + dr, c + dc
-            if 0 <= nr < ROWS and 0 <= nc < COLS:
-                v = field[nr][nc]
-                if v in ("空", "ハート"):
-                    continue
-                if count_component(field, nr, nc, v) >= 4:
-                    return True
-    return False
-
-# =========================================================
-# 消去1ステップ（消える前の色も返す）
-# =========================================================
-def erase_step_with_colors(field):
-    visited = [[False] * COLS for _ in range(ROWS)]
-    erase = set()
-
-    for r in range(ROWS):
-        for c in range(COLS):
-            if visited[r][c]:
-                continue
-            v = field[r][c]
-            if v in ("空", "ハート"):
-                visited[r][c] = True
-                continue
-
-            stack = [(r, c)]
-            visited[r][c] = True
-            comp = [(r, c)]
-            while stack:
-                cr, cc = stack.pop()
-                for dr, dc in DIR4:
-                    nr, nc = cr + dr, cc + dc
-                    if 0 <= nr < ROWS and 0 <= nc < COLS:
-                        if not visited[nr][nc] and field[nr][nc] == v:
-                            visited[nr][nc] = True
-                            stack.append((nr, nc))
-                            comp.append((nr, nc))
-
-            if len(comp) >= 4:
-                erase |= set(comp)
-
-    # ハート巻き込み
-    if erase:
-        heart_add = set()
-        for r in range(ROWS):
-            for c in range(COLS):
-                if field[r][c] == "ハート":
-                    for dr, dc in DIR4:
-                        nr, nc = r + dr, c + dc
-                        if 0 <= nr < ROWS and 0 <= nc < COLS:
-                            if (nr, nc) in erase:
-                                heart_add.add((r, c))
-        erase |= heart_add
-
-    if not erase:
-        return set(), {}, False
-
-    before = {(r, c): field[r][c] for (r, c) in erase}
-
-    for (r, c) in erase:
-        field[r][c] = "空"
-
-    # 落下
-    for c in range(COLS):
-        stack = []
-        for r in range(ROWS - 1, -1, -1):
-            if field[r][c] != "空":
-                stack.append(field[r][c])
-
-        idx = 0
-        for r in range(ROWS - 1, -1, -1):
-            if idx < len(stack):
-                field[r][c] = stack[idx]
-                idx += 1
-            else:
-                field[r][c] = "空"
-
-    return erase, before, True
-
-# =========================================================
-# 起点消し→連鎖→得点
-# =========================================================
-def simulate_with_start_scoring(field, nexts, recolored_cells_set, start_pos):
-    f = copy.deepcopy(field)
-
-    # ネクスト落下
-    for c, color in enumerate(nexts):
-        for r in range(ROWS):
-            if f[r][c] == "空":
-                f[r][c] = color
-                break
-
-    sr, sc = start_pos
-    if f[sr][sc] == "空":
-        return 0, 0, 0, False
-
-    # 起点消し（得点0）
-    f[sr][sc] = "空"
-
-    # 起点消し後 落下
-    for c in range(COLS):
-        stack = []
-        for r in range(ROWS - 1, -1, -1):
-            if f[r][c] != "空":
-                stack.append(f[r][c])
-        idx = 0
-        for r in range(ROWS - 1, -1, -1):
-            if idx < len(stack):
-                f[r][c] = stack[idx]
-                idx += 1
-            else:
-                f[r][c] = "空"
-
-    chains = 0
-    score = 0
-    maxsim = 0
-
-    while True:
-        erased_set, before_colors, ok = erase_step_with_colors(f)
-        if not ok:
-            break
-
-        chains += 1
-        maxsim = max(maxsim, len(erased_set))
-
-        # 得点：通常色のみ
-        for (r, c) in erased_set:
-            col = before_colors[(r, c)]
-            if col == "ハート":
-                continue
-            if (r, c) == (sr, sc):
-                continue
-            if (r, c) in recolored_cells_set:
-                continue
-            score += 1
-
-    return chains, score, maxsim, True
-
-# =========================================================
-# 起点候補の絞り込み（高速）
-# =========================================================
-def is_good_start_candidate(field, pos):
-    r, c = pos
-    if field[r][c] == "空":
-        return False
-
-    blocked = {pos}
-    for dr, dc in DIR4:
-        nr, nc = r + dr, c + dc
-        if 0 <= nr < ROWS and 0 <= nc < COLS:
-            v = field[nr][nc]
-            if v in ("空", "ハート"):
-                continue
-            if count_component(field, nr, nc, v, blocked=blocked) >= 4:
-                return True
-    return False
-
-def compute_start_candidates(field):
-    cands = []
-    for r in range(ROWS):
-        for c in range(COLS):
-            if is_good_start_candidate(field, (r, c)):
-                cands.append((r, c))
-    return cands
+PAINT_COLORS = NORMAL_COLORS + ["ハート"]
 
-# =========================================================
-# 塗り替え候補の列挙（単発で即消えるマスを除外）
-# =========================================================
-def compute_recolor_candidates(base_field, paint_color):
-    cands = []
-    for r in range(ROWS):
-        for c in range(COLS):
-            v = base_field[r][c]
-            if v == "空":
-                continue
-            if v == paint_color:
-                continue
+# 分からないネクスト（探索では None、期待値探索になる）
+UNKNOWN_NEXT = "？"
+NEXT_OPTIONS = NORMAL_COLORS + [UNKNOWN_NEXT]
 
-            tmp = [row[:] for row in base_field]
-            tmp[r][c] = paint_color
+MARK_PAINT = "🖌️"   # 塗り替えマーク（表示用）
+MARK_START = "✂️"   # 起点マーク（表示用）
 
-            if local_has_erase_after_recolor(tmp, {(r, c)}):
-                continue
+POLL_INTERVAL = 0.5   # 探索中に画面を読み直す間隔（秒）
 
-            cands.append((r, c))
-    return cands
+PHASE_LABELS = {
+    "recolor_check": "塗り替え直後の消去判定",
+    "start_expansion": "起点候補の追加判定",
+    "drop_nexts": "ネクスト落下・下詰め",
+    "simulate": "連鎖シミュレーション",
+    "total": "探索全体",
+}
 
 # =========================================================
 # Streamlit UI
 # =========================================================
 st.set_page_config(layout="wide")
+run_t0 = time.perf_counter()
 st.title("ぷよクエ 盤面エディタ＆探索（キーぷよ無し版）")
 
 # ---------------------
 # 状態
+#   盤面（field / fixed_field / save_slots）は boardcode の 48 バイト表現、
+#   history は Undo 用の差分の列。
 # ---------------------
 if "field" not in st.session_state:
-    st.session_state.field = [["空"] * COLS for _ in range(ROWS)]
+    st.session_state.field = filled_board("空")
 if "history" not in st.session_state:
     st.session_state.history = []
 if "current_color" not in st.session_state:
@@ -338,105 +86,193 @@ if "save_slots" not in st.session_state:
 if "next" not in st.session_state:
     st.session_state.next = ["赤"] * COLS
 
-def push_history():
-    st.session_state.history.append(copy.deepcopy(st.session_state.field))
+def set_field(new):
+    diff = undo_diff(st.session_state.field, new)
+    if not diff:
+        return
+    st.session_state.history.append(diff)
     if len(st.session_state.history) > 50:
         st.session_state.history.pop(0)
+    st.session_state.field = new
 
 def undo():
     if st.session_state.history:
-        st.session_state.field = st.session_state.history.pop()
+        st.session_state.field = apply_diff(st.session_state.field, st.session_state.history.pop())
 
 # ---------------------
-# パレット
+# 盤面エディタ（パレット・操作・保存・盤面）とネクストは別々の fragment
+#   st.fragment の中のウィジェットを押したときは、その fragment だけ再実行する
+#   （探索の欄まで作り直さない）。fragment が無い古い Streamlit では全体が再実行される。
+#   各 fragment（と画面全体）の描画にかかった時間を直近 LATENCY_WINDOW 回ぶん表示する。
 # ---------------------
-st.header("色パレット")
-pal_cols = st.columns(len(COLORS))
-for i, color in enumerate(COLORS):
-    with pal_cols[i]:
-        if st.button(EMOJI[color], key=f"pal_{color}"):
-            st.session_state.current_color = color
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
 
-st.markdown(f"### 選択中： {EMOJI[st.session_state.current_color]} {st.session_state.current_color}")
+# fragment の中から画面全体を再実行する（scope は st.fragment と同じ版から。
+# それより前の st.rerun は fragment の中でも全体を再実行する）
+def rerun_app():
+    if hasattr(st, "fragment"):
+        st.rerun(scope="app")
+    st.rerun()
 
-# ---------------------
-# 操作
-# ---------------------
-st.header("操作")
-b1, b2, b3, b4 = st.columns(4)
-
-with b1:
-    if st.button("🧹 盤面クリア"):
-        push_history()
-        st.session_state.field = [["空"] * COLS for _ in range(ROWS)]
-with b2:
-    if st.button("🎨 全塗り"):
-        push_history()
-        for r in range(ROWS):
-            for c in range(COLS):
-                st.session_state.field[r][c] = st.session_state.current_color
-with b3:
-    if st.button("↩ Undo"):
-        undo()
-with b4:
-    if st.button("📌 盤面確定"):
-        st.session_state.fixed_field = copy.deepcopy(st.session_state.field)
+LATENCY_WINDOW = 20
 
-# ---------------------
-# 保存
-# ---------------------
-st.header("保存")
-for i in range(3):
-    c1, c2 = st.columns(2)
-    with c1:
-        if st.button(f"保存{i+1}", key=f"save_{i}"):
-            st.session_state.save_slots[i] = copy.deepcopy(st.session_state.field)
-    with c2:
-        if st.button(f"読込{i+1}", key=f"load_{i}"):
-            if st.session_state.save_slots[i] is not None:
-                push_history()
-                st.session_state.field = copy.deepcopy(st.session_state.save_slots[i])
+def show_latency(name, t0):
+    hist = st.session_state.setdefault("latency", {}).setdefault(name, [])
+    hist.append((time.perf_counter() - t0) * 1000)
+    del hist[:-LATENCY_WINDOW]
+    st.caption(f"描画 {hist[-1]:.1f} ms（直近 {len(hist)} 回の平均 {sum(hist) / len(hist):.1f} ms）")
 
 # ---------------------
-# 盤面編集
+# その場で解析（編集中盤面の即消え・候補数・探索の大きさ）
+#   LiveAnalysis を session_state に持ち、盤面が変わったマスだけ差分で更新する。
+#   塗る色・塗り替え数は探索欄のウィジェットの値（key で session_state に入る）を使う。
 # ---------------------
-st.header("盤面（クリックで塗る）")
-for r in range(ROWS):
-    row_cols = st.columns(COLS)
-    for c in range(COLS):
-        with row_cols[c]:
-            label = EMOJI[st.session_state.field[r][c]]
-            if st.button(label, key=f"cell_{r}_{c}"):
-                push_history()
-                st.session_state.field[r][c] = st.session_state.current_color
-
-st.markdown("### 編集中盤面")
-for r in range(ROWS):
-    st.write(" ".join(EMOJI[st.session_state.field[r][c]] for c in range(COLS)))
+def live_panel():
+    live = st.session_state.get("live")
+    if live is None:
+        live = st.session_state.live = LiveAnalysis(st.session_state.field, PAINT_COLORS)
+    else:
+        live.update(st.session_state.field)
+
+    st.markdown("### その場で解析")
+    if live.erase:
+        st.warning("この盤面は4つ以上が成立して消える状態です（塗り替え前に消える）")
+        return
+
+    n_start = live.start_count()
+    count = int(st.session_state.get("paint_count", 12))
+    min_k = default_min_k(count)
+    if st.session_state.get("sweep"):
+        colors = PAINT_COLORS
+    else:
+        colors = [st.session_state.get("paint_color", PAINT_COLORS[0])]
+    st.write(f"起点候補: {n_start} / 48")
+    for color in colors:
+        n_recolor = live.recolor_count(color)
+        patterns = count_patterns(n_recolor, min_k, count)
+        st.write(
+            f"{EMOJI[color]} 塗り替え候補: {n_recolor} / 48"
+            f" / パターン: {patterns:,} / 試行(概算): {patterns * max(1, n_start):,}"
+        )
 
-# ---------------------
-# 確定盤面
-# ---------------------
-if st.session_state.fixed_field is not None:
-    st.markdown("## 📌 確定盤面")
+@fragment
+def board_editor():
+    t0 = time.perf_counter()
+
+    # ---------------------
+    # パレット
+    # ---------------------
+    st.header("色パレット")
+    pal_cols = st.columns(len(COLORS))
+    for i, color in enumerate(COLORS):
+        with pal_cols[i]:
+            if st.button(EMOJI[color], key=f"pal_{color}"):
+                st.session_state.current_color = color
+
+    st.markdown(f"### 選択中： {EMOJI[st.session_state.current_color]} {st.session_state.current_color}")
+
+    # ---------------------
+    # 操作
+    # ---------------------
+    st.header("操作")
+    b1, b2, b3, b4 = st.columns(4)
+
+    with b1:
+        if st.button("🧹 盤面クリア"):
+            set_field(filled_board("空"))
+    with b2:
+        if st.button("🎨 全塗り"):
+            set_field(filled_board(st.session_state.current_color))
+    with b3:
+        if st.button("↩ Undo"):
+            undo()
+    with b4:
+        if st.button("📌 盤面確定"):
+            st.session_state.fixed_field = st.session_state.field
+
+    # ---------------------
+    # 保存
+    # ---------------------
+    st.header("保存")
+    for i in range(3):
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button(f"保存{i+1}", key=f"save_{i}"):
+                st.session_state.save_slots[i] = st.session_state.field
+        with c2:
+            if st.button(f"読込{i+1}", key=f"load_{i}"):
+                if st.session_state.save_slots[i] is not None:
+                    set_field(st.session_state.save_slots[i])
+
+    # 共有コード（盤面を24文字で書き出し・読み込み）
+    st.code(board_to_code(st.session_state.field), language=None)
+    share_code = st.text_input("共有コードから読込", placeholder="共有コードを貼り付け")
+    if st.button("📥 コードを読込"):
+        try:
+            set_field(board_from_code(share_code))
+        except ValueError as e:
+            st.error(str(e))
+
+    # ---------------------
+    # 盤面編集
+    # ---------------------
+    st.header("盤面（クリックで塗る）")
+    field = decode_board(st.session_state.field)
+    for r in range(ROWS):
+        row_cols = st.columns(COLS)
+        for c in range(COLS):
+            with row_cols[c]:
+                if st.button(EMOJI[field[r][c]], key=f"cell_{r}_{c}"):
+                    set_field(set_board_cell(st.session_state.field, r, c, st.session_state.current_color))
+                    field = decode_board(st.session_state.field)
+
+    st.markdown("### 編集中盤面")
     for r in range(ROWS):
-        st.write(" ".join(EMOJI[st.session_state.fixed_field[r][c]] for c in range(COLS)))
+        st.write(" ".join(EMOJI[field[r][c]] for c in range(COLS)))
+
+    live_panel()
+
+    # ---------------------
+    # 確定盤面
+    # ---------------------
+    if st.session_state.fixed_field is not None:
+        st.markdown("## 📌 確定盤面")
+        fixed_field = decode_board(st.session_state.fixed_field)
+        for r in range(ROWS):
+            st.write(" ".join(EMOJI[fixed_field[r][c]] for c in range(COLS)))
+
+    show_latency("board_editor", t0)
+
+board_editor()
 
 # ---------------------
 # ネクスト
 # ---------------------
-st.header("ネクスト（手入力）")
-ncols = st.columns(COLS)
-for i in range(COLS):
-    with ncols[i]:
-        st.session_state.next[i] = st.selectbox(
-            f"n{i+1}",
-            NORMAL_COLORS,
-            index=NORMAL_COLORS.index(st.session_state.next[i]),
-            key=f"next_{i}",
-            label_visibility="collapsed",
-        )
-st.write(" ".join(EMOJI[c] for c in st.session_state.next))
+#   ？ を入れた／全部外したときは探索欄（期待値探索かどうか）が変わるので全体を再実行する
+@fragment
+def next_editor():
+    t0 = time.perf_counter()
+    was_unknown = UNKNOWN_NEXT in st.session_state.next
+
+    st.header("ネクスト（手入力）")
+    ncols = st.columns(COLS)
+    for i in range(COLS):
+        with ncols[i]:
+            st.session_state.next[i] = st.selectbox(
+                f"n{i+1}",
+                NEXT_OPTIONS,
+                index=NEXT_OPTIONS.index(st.session_state.next[i]),
+                key=f"next_{i}",
+                label_visibility="collapsed",
+            )
+    st.write(" ".join(EMOJI[c] for c in st.session_state.next))
+
+    if (UNKNOWN_NEXT in st.session_state.next) != was_unknown:
+        rerun_app()
+
+    show_latency("next_editor", t0)
+
+next_editor()
 
 # =========================================================
 # 探索UI
@@ -444,192 +280,324 @@ st.write(" ".join(EMOJI[c] for c in st.session_state.next))
 st.markdown("---")
 st.header("探索（塗り替え → 塗り替え直後は消えない → 起点1個消して連鎖）")
 
-paint_color = st.selectbox("塗り替え色（この色にする）", NORMAL_COLORS + ["ハート"])
-paint_count = st.number_input("塗り替え数（最大12）", min_value=0, max_value=12, value=12)
-
-min_k = max(0, int(paint_count) - 4)
+sweep = st.checkbox(
+    "全色まとめて探索", value=False, key="sweep",
+    help="塗り替え色を全色試して、全色まとめた上位と色ごとの上位を出します",
+)
+paint_color = st.selectbox("塗り替え色（この色にする）", PAINT_COLORS, disabled=sweep, key="paint_color")
+paint_count = st.number_input("塗り替え数（最大12）", min_value=0, max_value=12, value=12, key="paint_count")
+top_k = st.number_input(
+    "上位件数", min_value=1, max_value=100, value=TOP_N,
+    help="何件まで上位を出すか（探索中も見つかるたびに表示します）",
+)
+
+engine_name = st.selectbox(
+    "エンジン", list(ENGINES),
+    help="bitboard は list と同じ結果を高速に出します（numpy は numpy が入っていれば選べます）",
+)
+workers = st.number_input(
+    "並列プロセス数", min_value=1, max_value=os.cpu_count() or 1, value=1,
+    help="組み合わせを分けて複数プロセスで探索します（結果は1と同じ）",
+)
+tt_size = st.number_input(
+    "置換表サイズ（0で無効）", min_value=0, max_value=1_000_000, value=50_000, step=10_000,
+    disabled=engine_name != "bitboard",
+    help="起点消し後に同じ盤面になった連鎖を使い回します（bitboard のみ）",
+)
+time_budget = st.number_input(
+    "時間制限（秒、0で全探索）", min_value=0, max_value=3600, value=0, step=10,
+    help="見込みのある塗り替え候補から順に調べ、時間切れならそこまでの上位を出します",
+)
+use_profile = st.checkbox("工程ごとの計測を表示", value=False, help="少し遅くなります")
+use_prune = st.checkbox(
+    "塗り替え候補を絞り込む", value=False,
+    help="どの起点から連鎖しても届かないマスを塗り替え候補から外して列挙します"
+    "（結果は同じ。探索済みの割合は絞り込んだ組み合わせで数えます）",
+)
+verify_prune = st.checkbox(
+    "絞り込みを検証", value=False, disabled=not use_prune,
+    help="絞り込み無しでも探索し、上位が同じか確かめます（時間は倍以上かかります）",
+)
+use_cache = st.checkbox(
+    "保存済みの結果を使う", value=True,
+    help="同じ盤面・ネクスト・塗る色・塗り替え数の結果があればすぐ表示し、最後まで探索した結果は保存します",
+)
+
+min_k = default_min_k(int(paint_count))
 st.caption(f"枝切りA案: 塗り替え数は {min_k} ～ {paint_count} で探索")
 
-progress_bar = st.progress(0)
-status_text = st.empty()
+unknown_next = UNKNOWN_NEXT in st.session_state.next
+mc_samples = MC_SAMPLES
+if unknown_next:
+    mc_samples = st.number_input(
+        "サンプル数", min_value=1, max_value=10_000, value=MC_SAMPLES, step=50,
+        help="？のネクストに色を入れたネクスト列を何通り引くか",
+    )
+    st.caption(
+        "ネクストに ？ があるので期待値探索です（平均得点 → 連鎖確率 → 分散の小ささ の順。"
+        "エンジン・並列・置換表・時間制限・保存済みの結果は使いません）"
+    )
 
-# ---------------------
-# 探索本体
-# ---------------------
-def run_search(base_field, nexts, paint_color, paint_count, min_k):
-    if has_any_erase_global(base_field):
-        return [], {
-            "reason": "確定盤面の時点で4つ以上が成立して消える状態です（塗り替え前に消える）",
-            "recolor_candidates": None,
-            "start_candidates": None,
-        }
-
-    recolor_cands = compute_recolor_candidates(base_field, paint_color)
-    base_start_cands = compute_start_candidates(base_field)
-
-    info = {
-        "reason": None,
-        "recolor_candidates": len(recolor_cands),
-        "start_candidates": len(base_start_cands),
-    }
-
-    if len(recolor_cands) == 0:
-        info["reason"] = "塗り替え候補が0マスでした"
-        return [], info
-
-    total_patterns = 0
-    for k in range(min_k, paint_count + 1):
-        if k <= len(recolor_cands):
-            total_patterns += comb(len(recolor_cands), k)
-
-    if total_patterns == 0:
-        info["reason"] = "探索パターン数が0になりました"
-        return [], info
-
-    est_total_trials = total_patterns * max(1, len(base_start_cands))
-
-    best = []
-    done_patterns = 0
-    done_trials = 0
-
-    last_update = 0.0
-    last_pct = -1
-    t0 = time.time()
-
-    for k in range(min_k, paint_count + 1):
-        if k > len(recolor_cands):
-            continue
-
-        for combi in combinations(recolor_cands, k):
-            field = [row[:] for row in base_field]
-            changed = set(combi)
-
-            for (r, c) in combi:
-                field[r][c] = paint_color
-
-            # 必須：塗り替え直後に消えない
-            if local_has_erase_after_recolor(field, changed):
-                done_patterns += 1
-                continue
-
-            # 起点候補：ベース＋塗り替え近傍で増える分
-            start_cands = list(base_start_cands)
-            near = set()
-            for (r, c) in changed:
-                near.add((r, c))
-                for dr, dc in DIR4:
-                    nr, nc = r + dr, c + dc
-                    if 0 <= nr < ROWS and 0 <= nc < COLS:
-                        near.add((nr, nc))
-
-            base_set = set(base_start_cands)
-            for pos in near:
-                if pos in base_set:
-                    continue
-                if is_good_start_candidate(field, pos):
-                    start_cands.append(pos)
-
-            recolored_set = set(changed)
-
-            best_local = None
-
-            for sp in start_cands:
-                done_trials += 1
-                chains, score, maxsim, ok = simulate_with_start_scoring(
-                    field, nexts, recolored_set, sp
-                )
-                if not ok:
-                    continue
-
-                # 条件：連鎖が1以上
-                if chains >= 1:
-                    cand = {
-                        "chains": chains,
-                        "score": score,
-                        "maxsim": maxsim,
-                        "recolor": tuple(sorted(changed)),
-                        "start": sp,
-                    }
-                    if (best_local is None) or (cand["score"], cand["chains"], cand["maxsim"]) > (
-                        best_local["score"], best_local["chains"], best_local["maxsim"]
-                    ):
-                        best_local = cand
-
-            if best_local is not None:
-                best.append(best_local)
-                best = sorted(best, key=lambda x: (x["score"], x["chains"], x["maxsim"]), reverse=True)[:3]
-
-            done_patterns += 1
-
-            # 進捗（0.5秒ごと）
-            now = time.time()
-            pct = int(done_patterns / total_patterns * 100)
-            if now - last_update >= 0.5 and pct != last_pct:
-                progress_bar.progress(min(100, pct))
-                status_text.markdown(
-                    f"**進捗:** {pct}%\n\n"
-                    f"**パターン:** {done_patterns:,} / {total_patterns:,}\n\n"
-                    f"**試行中(概算):** {done_trials:,} / {est_total_trials:,}\n"
-                    f"**経過:** {int(now - t0)}s\n"
-                )
-                last_update = now
-                last_pct = pct
-
-    progress_bar.progress(100)
-
-    if not best:
-        info["reason"] = "条件を満たす結果が見つからなかった（塗り替え直後に消えない＆起点から連鎖が起きない）"
-
-    return best, info
+def show_progress(bar, text, done_patterns, total_patterns, done_trials, est_total_trials, elapsed):
+    pct = int(done_patterns / total_patterns * 100)
+    bar.progress(min(100, pct))
+    text.markdown(
+        f"**進捗:** {pct}%\n\n"
+        f"**パターン:** {done_patterns:,} / {total_patterns:,}\n\n"
+        f"**試行中(概算):** {done_trials:,} / {est_total_trials:,}\n"
+        f"**経過:** {int(elapsed)}s"
+        + (f" / **残り(概算):** {int(elapsed * (total_patterns - done_patterns) / done_patterns)}s\n"
+           if done_patterns else "\n")
+    )
+
+# =========================================================
+# 結果表示
+# =========================================================
+def show_info(info):
+    st.markdown(
+        f"### 塗り替え候補マス数: **{info['recolor_candidates']}** / 48\n"
+        f"### 起点候補マス数（確定盤面ベース）: **{info['start_candidates']}** / 48"
+    )
+
+    if info.get("pruned_candidates"):
+        st.caption(f"影響範囲の外で外した塗り替え候補: {info['pruned_candidates']} マス")
+
+    if info.get("verified"):
+        st.caption("絞り込み無しの探索と上位が一致しました")
+
+    if info.get("mc"):
+        mc = info["mc"]
+        st.caption(
+            f"サンプル {mc['samples']:,}（ネクスト列 {mc['distinct']:,} 通り）"
+            f" / 印つきの連鎖 {mc['wild_sims']:,} 回で {mc['shared_draws']:,} 試行ぶん"
+            f" / 個別シミュレーション {mc['full_sims']:,} 回"
+        )
+
+    if info.get("cached"):
+        st.caption(f"保存済みの結果です（探索時の所要 {info['elapsed']:.1f}s）")
+
+    if "coverage" in info and info["coverage"] < 1:
+        st.caption(f"探索済み: {info['coverage']:.2%}（{info['patterns']:,} パターン）")
+
+    if info.get("tt"):
+        tt = info["tt"]
+        lookups = tt["hits"] + tt["misses"]
+        rate = tt["hits"] / lookups * 100 if lookups else 0.0
+        st.caption(
+            f"置換表: ヒット {tt['hits']:,} / ミス {tt['misses']:,}（{rate:.1f}%）"
+            f" / 追い出し {tt['evictions']:,} / 件数 {tt['size']:,}"
+        )
+
+    if info.get("dedup"):
+        dedup = info["dedup"]
+        st.caption(
+            f"起点の同値類: {dedup['classes']:,} 盤面"
+            f" / 省略シミュレーション {dedup['saved_sims']:,}"
+        )
+
+    if info.get("profile"):
+        prof = info["profile"]
+        st.markdown("#### 工程ごとの計測")
+        st.table([
+            {"工程": PHASE_LABELS.get(name, name), "回数": p["calls"], "累積秒": round(p["seconds"], 3)}
+            for name, p in prof["phases"].items()
+        ])
+        st.caption(
+            f"評価した組み合わせ {prof['combinations']:,}"
+            f" / 塗り替え直後に消えて除外 {prof['recolor_rejected']:,}"
+            f" / 起点候補 平均 {prof['avg_start_candidates']:.2f} 個"
+            f" / 連鎖 平均 {prof['avg_chains']:.2f}（{prof['chain_sims']:,} 回）"
+        )
+
+    if info.get("reason"):
+        st.warning(info["reason"])
+
+def show_results(results, base_field, title="上位候補"):
+    if not results:
+        st.write("見つからず")
+        return
+
+    st.markdown(f"## {title}")
+    for i, r in enumerate(results, start=1):
+        st.markdown(f"### {i}位")
+        if "paint_color" in r:
+            st.write(f"塗り替え色: {EMOJI[r['paint_color']]} {r['paint_color']}")
+        if "mean_score" in r:
+            st.write(
+                f"平均得点: {r['mean_score']:.2f} / 分散: {r['score_var']:.2f}"
+                f" / 連鎖確率: {r['chain_prob']:.1%} / 平均連鎖: {r['mean_chains']:.2f}"
+            )
+        else:
+            st.write(f"得点: {r['score']} / 連鎖: {r['chains']} / 同時最大: {r['maxsim']}")
+        st.write(f"起点（消すマス）: {r['start']}  ※起点は得点0")
+        st.write(f"塗り替えマス数: {len(r['recolor'])}  ※塗り替えは得点0")
+        st.write(f"塗り替え座標: {r['recolor']}")
+
+        shown = [row[:] for row in base_field]
+        recolor_set = set(r["recolor"])
+        sr, sc = r["start"]
+
+        for rr in range(ROWS):
+            out = []
+            for cc in range(COLS):
+                cell = shown[rr][cc]
+                if (rr, cc) == (sr, sc):
+                    out.append(MARK_START)
+                elif (rr, cc) in recolor_set:
+                    out.append(MARK_PAINT)
+                else:
+                    out.append(EMOJI[cell])
+            st.write(" ".join(out))
+        st.markdown("---")
+
+def show_sweep(info, results, base_field):
+    if info.get("reason"):
+        st.warning(info["reason"])
+    show_results(results, base_field, title="全色の上位候補")
+    for color, entry in info["per_color"].items():
+        with st.expander(f"{EMOJI[color]} {color} の上位候補"):
+            show_info(entry["info"])
+            show_results(entry["results"], base_field)
+
+# =========================================================
+# 見積もり（解析開始の前に、組み合わせを少し試して所要時間を出す）
+# =========================================================
+eta_limit = st.number_input(
+    "見積もりの上限（秒）", min_value=1, max_value=3600, value=60, step=10,
+    help="見積もりがこれを超えたら、塗り替え数を減らすか時間制限つき探索をすすめます",
+)
+
+if st.button("⏱ 所要時間を見積もる"):
+    if st.session_state.fixed_field is None:
+        st.error("先に「📌 盤面確定」を押してね")
+        st.stop()
+    if unknown_next:
+        st.error("ネクストに ？ があると見積もれません")
+        st.stop()
+
+    with st.spinner("見積もり中…"):
+        # 全色まとめてなら色ごとの見積もりの合計
+        est = (estimate_sweep if sweep else estimate_search)(
+            decode_board(st.session_state.fixed_field), list(st.session_state.next),
+            PAINT_COLORS if sweep else paint_color,
+            int(paint_count), min_k, engine=engine_name, workers=int(workers), prune=use_prune,
+        )
+    if est is None:
+        st.warning("確定盤面の時点で4つ以上が成立して消える状態です（塗り替え前に消える）")
+    else:
+        st.markdown(
+            f"**有効パターン(推定):** {est['valid_patterns']:,} / {est['patterns']:,}\n\n"
+            f"**試行(推定):** {est['trials']:,}（1パターンあたり {est['trials_per_pattern']:.1f}）\n\n"
+            f"**所要時間(推定):** {est['seconds']:.1f}s"
+        )
+        if est["seconds"] > eta_limit:
+            count = suggest_paint_count(est, int(paint_count), eta_limit, int(workers))
+            tips = [f"時間制限を {int(eta_limit)} 秒にして見込みのある候補から調べる"]
+            if count is not None:
+                tips.insert(0, f"塗り替え数を {count} にする")
+            st.warning(f"見積もりが上限 {int(eta_limit)} 秒を超えています。" + " / ".join(tips))
 
 # =========================================================
 # 実行ボタン
+#   探索はバックグラウンドで走らせ、この画面は進捗を読みに来るだけ。
+#   探索中に他のウィジェットを触っても探索は止まらない。
 # =========================================================
+job = st.session_state.get("search_job")
+
 if st.button("解析開始"):
     if st.session_state.fixed_field is None:
         st.error("先に「📌 盤面確定」を押してね")
         st.stop()
 
-    base_field = [row[:] for row in st.session_state.fixed_field]
-    nexts = list(st.session_state.next)
+    if unknown_next and sweep:
+        st.error("ネクストに ？ があるときは全色まとめて探索できません（塗り替え色を1色選んでね）")
+        st.stop()
 
-    with st.spinner("探索中…"):
-        results, info = run_search(base_field, nexts, paint_color, int(paint_count), min_k)
+    if job is not None and not job.finished:
+        st.warning("探索中です。中断してから開始してね")
+    elif unknown_next:
+        base_field = decode_board(st.session_state.fixed_field)
+        nexts = [None if c == UNKNOWN_NEXT else c for c in st.session_state.next]
+        job = SearchJob(
+            base_field, nexts, paint_color, int(paint_count), min_k,
+            search=run_mc_search, samples=int(mc_samples), top_k=int(top_k),
+        ).start()
+        st.session_state.search_job = job
+    else:
+        base_field = decode_board(st.session_state.fixed_field)
+        nexts = list(st.session_state.next)
+        job = SearchJob(
+            base_field, nexts, PAINT_COLORS if sweep else paint_color, int(paint_count), min_k,
+            search=run_sweep if sweep else run_search,
+            engine=engine_name, workers=int(workers),
+            tt_size=int(tt_size) if engine_name == "bitboard" else 0,
+            profile=use_profile,
+            time_budget=int(time_budget) or None,
+            cache=ResultCache() if use_cache else None,
+            top_k=int(top_k),
+            prune=use_prune,
+            verify=use_prune and verify_prune,
+        ).start()
+        st.session_state.search_job = job
 
-    st.success("完了")
+# ---------------------
+# 探索中の進捗（POLL_INTERVAL 秒ごとにこの部分だけ読み直す）
+#   終わったら画面全体を読み直して結果を出す。
+#   fragment が無い古い Streamlit では、少し待って画面全体を読み直す。
+# ---------------------
+def polling_fragment(fn):
+    frag = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if frag is not None:
+        return frag(run_every=POLL_INTERVAL)(fn)
+
+    def run(*args):
+        fn(*args)
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+    return run
+
+
+@polling_fragment
+def job_progress(job):
+    if job.finished:
+        rerun_app()
+
+    if st.button("⏹ 中断", disabled=job.cancel_event.is_set()):
+        job.cancel()
+
+    bar = st.progress(0)
+    text = st.empty()
+    if job.status == "queued":
+        text.info(f"順番待ち中…（同時に探索できるのは {MAX_CONCURRENT_SEARCHES} 件まで）")
+    elif job.progress is not None:
+        show_progress(bar, text, *job.progress)
+    else:
+        text.markdown("探索中…")
 
-    st.markdown(
-        f"### 塗り替え候補マス数: **{info['recolor_candidates']}** / 48\n"
-        f"### 起点候補マス数（確定盤面ベース）: **{info['start_candidates']}** / 48"
-    )
+    show_results(job.best, job.args[0], title="途中の上位候補")
 
-    if info.get("reason"):
-        st.warning(info["reason"])
 
-    if not results:
-        st.write("見つからず")
+if job is not None:
+    base_field = job.args[0]
+
+    if not job.finished:
+        job_progress(job)
+
+    elif job.status == "error":
+        st.error(f"探索でエラーが発生しました: {job.error}")
+
     else:
-        st.markdown("## 上位候補（最大3件）")
-        for i, r in enumerate(results, start=1):
-            st.markdown(f"### {i}位")
-            st.write(f"得点: {r['score']} / 連鎖: {r['chains']} / 同時最大: {r['maxsim']}")
-            st.write(f"起点（消すマス）: {r['start']}  ※起点は得点0")
-            st.write(f"塗り替えマス数: {len(r['recolor'])}  ※塗り替えは得点0")
-            st.write(f"塗り替え座標: {r['recolor']}")
-
-            shown = [row[:] for row in base_field]
-            recolor_set = set(r["recolor"])
-            sr, sc = r["start"]
-
-            for rr in range(ROWS):
-                out = []
-                for cc in range(COLS):
-                    cell = shown[rr][cc]
-                    if (rr, cc) == (sr, sc):
-                        out.append(MARK_START)
-                    elif (rr, cc) in recolor_set:
-                        out.append(MARK_PAINT)
-                    else:
-                        out.append(EMOJI[cell])
-                st.write(" ".join(out))
-            st.markdown("---")
+        st.progress(100)
+        if job.status == "cancelled":
+            st.warning("中断しました")
+        else:
+            st.success("完了")
+        if "per_color" in job.info:
+            show_sweep(job.info, job.results, base_field)
+        else:
+            show_info(job.info)
+            show_results(job.results, base_field)
+
+# 画面全体の再実行にかかった時間（fragment だけの再実行と比べる用）
+st.markdown("---")
+show_latency("app", run_t0)
@@ -0,0 +1,221 @@
+# =========================================================
+# バッチ解析 CLI（Streamlit 不要）
+#   JSONL で盤面を読み、1行ずつ探索して結果を JSONL で書き出す。
+#   入力1行: {"id": 任意, "board": 6x8 の色名, "nexts": 8色,
+#             "paint_color": 色, "paint_count": 0～12, "min_k": 省略可}
+#            paint_color を色のリストにすると全色スイープ（run_sweep）になる。
+#            nexts に null（分からない列）があると期待値探索（run_mc_search）になり、
+#            "samples"（既定 200）・"seed"（既定 0）も指定できる（paint_color は1色のみ）。
+#   出力1行: {"id", "line", "results", "info", "elapsed"}
+#            不正な行は {"id", "line", "error"} を出して次へ進む。
+#
+#   python batch.py boards.jsonl -o results.jsonl --workers 4
+#   （入力・出力とも "-" で標準入出力）
+#   --cache FILE で結果を SQLite に保存し、同じ盤面は保存済みの結果を返す。
+#   --top-k N で上位 N 件を返す。--stream なら上位が変わるたびに
+#   {"id", "line", "best"} の行も出す（最後の行は通常どおり）。
+#   --prune なら影響範囲の外の塗り替え候補を外して列挙する（既定は全部）。
+#   --verify-prune なら絞り込み無しの結果とも比べ、違えばその行は error。
+#   --listen HOST:PORT でコーディネーターになり、つないできたワーカー
+#   （python cluster.py HOST:PORT）にシャードを配る（期待値探索の行は手元で回す）。
+#   --local-workers N なら手元にワーカーを N 個起動する（--listen 省略時は 127.0.0.1 の空きポート）。
+# =========================================================
+import argparse
+import json
+import sys
+import time
+
+from engine import COLORS, COLS, NORMAL_COLORS, ROWS
+from cluster import Coordinator, parse_address, start_workers
+from mcsearch import MC_SAMPLES, run_mc_search
+from resultcache import ResultCache
+from search import (
+    ENGINES,
+    TOP_N,
+    default_min_k,
+    run_search,
+    run_sweep,
+    stream_search,
+)
+
+PAINT_COLORS = NORMAL_COLORS + ["ハート"]
+MAX_PAINT_COUNT = 12
+
+# =========================================================
+# 入力チェック
+# =========================================================
+def is_int(x):
+    # JSON の true / false は Python では int の仲間なので除く
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+def parse_request(obj):
+    if not isinstance(obj, dict):
+        raise ValueError("1行は JSON オブジェクトにしてください")
+
+    board = obj.get("board")
+    if (not isinstance(board, list) or len(board) != ROWS
+            or any(not isinstance(row, list) or len(row) != COLS for row in board)):
+        raise ValueError(f"board は {ROWS}x{COLS} のリストにしてください")
+    for row in board:
+        for cell in row:
+            if cell not in COLORS:
+                raise ValueError(f"board に不明な色があります: {cell!r}")
+
+    nexts = obj.get("nexts")
+    if not isinstance(nexts, list) or len(nexts) != COLS:
+        raise ValueError(f"nexts は {COLS} 色のリストにしてください")
+    for color in nexts:
+        if color is not None and color not in NORMAL_COLORS:
+            raise ValueError(f"nexts に使えない色があります: {color!r}")
+
+    paint_color = obj.get("paint_color")
+    if isinstance(paint_color, list):
+        if not paint_color:
+            raise ValueError("paint_color のリストが空です")
+        for color in paint_color:
+            if color not in PAINT_COLORS:
+                raise ValueError(f"paint_color に使えない色です: {color!r}")
+    elif paint_color not in PAINT_COLORS:
+        raise ValueError(f"paint_color に使えない色です: {paint_color!r}")
+
+    paint_count = obj.get("paint_count")
+    if not is_int(paint_count) or not (0 <= paint_count <= MAX_PAINT_COUNT):
+        raise ValueError(f"paint_count は 0～{MAX_PAINT_COUNT} の整数にしてください")
+
+    min_k = obj.get("min_k", default_min_k(paint_count))
+    if not is_int(min_k) or not (0 <= min_k <= paint_count):
+        raise ValueError("min_k は 0～paint_count の整数にしてください")
+
+    # 分からないネクストがあれば期待値探索の設定（無ければ None）
+    mc = None
+    if None in nexts:
+        if isinstance(paint_color, list):
+            raise ValueError("nexts に null があるときは paint_color を1色にしてください")
+        mc = {"samples": obj.get("samples", MC_SAMPLES), "seed": obj.get("seed", 0)}
+        if not is_int(mc["samples"]) or mc["samples"] < 1:
+            raise ValueError("samples は 1 以上の整数にしてください")
+        if not is_int(mc["seed"]):
+            raise ValueError("seed は整数にしてください")
+
+    return board, nexts, paint_color, paint_count, min_k, mc
+
+# =========================================================
+# 実行
+# =========================================================
+def solve_lines(lines, out, engine="bitboard", workers=1, tt_size=0, profile=False,
+                time_budget=None, cache=None, top_k=TOP_N, stream=False, prune=False, verify=False,
+                cluster=None):
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        record = {"line": lineno}
+        try:
+            obj = json.loads(line)
+            if isinstance(obj, dict) and "id" in obj:
+                record["id"] = obj["id"]
+            board, nexts, paint_color, paint_count, min_k, mc = parse_request(obj)
+        except ValueError as e:
+            # json.JSONDecodeError も ValueError
+            record["error"] = str(e)
+        else:
+            t0 = time.time()
+            search = run_sweep if isinstance(paint_color, list) else run_search
+            args = (board, nexts, paint_color, paint_count, min_k)
+            kwargs = dict(
+                engine=engine, workers=workers, tt_size=tt_size, profile=profile,
+                time_budget=time_budget, cache=cache, top_k=top_k, prune=prune, verify=verify,
+                cluster=cluster,
+            )
+            if mc is not None:
+                # 期待値探索は直列・colboard のみ（エンジン・並列・置換表などの指定は使わない）
+                search = run_mc_search
+                kwargs = dict(top_k=top_k, **mc)
+            try:
+                if stream:
+                    for results, info in stream_search(*args, search=search, **kwargs):
+                        if info is None:
+                            out.write(json.dumps({**record, "best": results}, ensure_ascii=False) + "\n")
+                            out.flush()
+                else:
+                    results, info = search(*args, **kwargs)
+            except (AssertionError, RuntimeError) as e:
+                # 絞り込みの検証で上位が食い違った・ワーカーで失敗した（ほかの行は続ける）
+                record["error"] = str(e)
+            else:
+                record["results"] = results
+                record["info"] = info
+            record["elapsed"] = round(time.time() - t0, 3)
+
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ぷよクエ盤面のバッチ探索（JSONL → JSONL）")
+    parser.add_argument("input", help="入力 JSONL（- で標準入力）")
+    parser.add_argument("-o", "--output", default="-", help="出力 JSONL（既定: 標準出力）")
+    parser.add_argument("--engine", choices=list(ENGINES), default="bitboard")
+    parser.add_argument("--workers", type=int, default=1, help="1盤面あたりの並列プロセス数")
+    parser.add_argument("--tt-size", type=int, default=0, help="置換表サイズ（0で無効、bitboard のみ）")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="1盤面あたりの時間制限（秒）。見込みのある候補から順に調べる")
+    parser.add_argument("--profile", action="store_true", help="工程ごとの回数・時間を info.profile に出す")
+    parser.add_argument("--top-k", type=int, default=TOP_N, help=f"返す上位の件数（既定: {TOP_N}）")
+    parser.add_argument("--stream", action="store_true", help="上位が変わるたびに途中経過の行を出す")
+    parser.add_argument("--prune", action="store_true",
+                        help="影響範囲の外の塗り替え候補を外して列挙する（info.patterns は絞り込み後の数）")
+    parser.add_argument("--verify-prune", action="store_true",
+                        help="絞り込み無しでも探索し、上位が同じか確かめる（違えばその行は error）")
+    parser.add_argument("--cache", default=None, metavar="FILE",
+                        help="結果を保存する SQLite ファイル（同じ盤面・条件なら保存済みの結果を返す）")
+    parser.add_argument("--listen", default=None, metavar="HOST:PORT",
+                        help="コーディネーターとして待ち受け、つないできたワーカーにシャードを配る")
+    parser.add_argument("--local-workers", type=int, default=0, metavar="N",
+                        help="手元にワーカーを N 個起動してつなぐ")
+    parser.add_argument("--token", default=None, help="ワーカーに求める合言葉")
+    args = parser.parse_args(argv)
+
+    if args.engine != "bitboard" and args.tt_size:
+        parser.error("--tt-size は bitboard エンジンでのみ使えます")
+    if args.top_k < 1:
+        parser.error("--top-k は 1 以上にしてください")
+    if args.verify_prune and not args.prune:
+        parser.error("--verify-prune は --prune と一緒に使ってください")
+
+    listen = None
+    if args.listen:
+        try:
+            listen = parse_address(args.listen)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.local_workers > 0:
+        listen = ("127.0.0.1", 0)
+
+    cache = ResultCache(args.cache) if args.cache else None
+    cluster = Coordinator(listen, token=args.token) if listen else None
+    if cluster is not None and args.local_workers > 0:
+        start_workers(cluster.address, args.local_workers, args.token)
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        solve_lines(
+            src, dst, engine=args.engine, workers=max(1, args.workers),
+            tt_size=args.tt_size, profile=args.profile,
+            time_budget=args.time_budget, cache=cache, top_k=args.top_k, stream=args.stream,
+            prune=args.prune, verify=args.verify_prune, cluster=cluster,
+        )
+    finally:
+        if cluster is not None:
+            cluster.close()
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,559 @@
+# =========================================================
+# ベンチマーク（固定コーパス＋基準値で速度の劣化を検出）
+#   bench_corpus.jsonl の盤面（まばら／満杯／ハート多め／消える寸前）で
+#   候補計算・シミュレーション・探索全体の処理量（回/秒）を測り、
+#   bench_baseline.json の基準値より tolerance 以上遅ければ失敗（終了コード1）。
+#   あわせて探索結果の上位3件が元の実装（reference_search）と、シミュレーション結果が
+#   engine.py と同じか確かめる。
+#   今の起点の判定では消えない盤面に起点候補は無く、探索は何も試さずに終わるので、
+#   探索の計測・突き合わせでは盤面ごとに決まったマスを起点候補として渡す（bench_base）。
+#
+#   python bench.py                  # 計測して基準値と比較
+#   python bench.py --save-baseline  # 今回の値を基準値として保存
+#   python bench.py --make-corpus    # コーパスを作り直す（基準値も取り直すこと）
+# =========================================================
+from itertools import combinations
+from types import SimpleNamespace
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import bitboard
+import colboard
+import engine
+from engine import COLS, DIR4, NORMAL_COLORS, ROWS
+from search import TopK, default_min_k, merge_best, run_search, run_sweep
+
+try:
+    import numpy as np
+    import npsim
+except ImportError:
+    np = npsim = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(HERE, "bench_corpus.jsonl")
+BASELINE_PATH = os.path.join(HERE, "bench_baseline.json")
+
+CORPUS_SEED = 20240601
+BOARDS_PER_KIND = 3
+PAINT_COLORS = NORMAL_COLORS + ["ハート"]
+
+# 1項目あたりの最低計測時間（秒）と繰り返し回数（最速の回を採る。ほかの負荷で遅れた回を捨てる）
+MIN_TIME = 0.3
+ROUNDS = 3
+
+# 探索全体を測る (項目名, エンジン, 塗り替え数, run_search に足す引数)
+SEARCH_CASES = [
+    ("bitboard.search_pc1", "bitboard", 1, {}),
+    ("bitboard.search_pc2", "bitboard", 2, {}),
+    ("bitboard.search_pc3", "bitboard", 3, {}),
+    ("list.search_pc1", "list", 1, {}),
+    ("list.search_pc2", "list", 2, {}),
+    ("column.search_pc1", "column", 1, {}),
+    ("column.search_pc2", "column", 2, {}),
+    # 上位を多く取る（TopK のヒープが大きいとき）
+    ("bitboard.search_pc2_top100", "bitboard", 2, {"top_k": 100}),
+]
+# 上位の管理だけを測る (件数, 流す結果の数)
+TOPK_CASE = (100, 5000)
+# 元の実装と突き合わせる塗り替え数（元の実装は遅いので小さめ）
+CHECK_COUNTS = [1, 2]
+# 探索で起点候補として渡すマスの数（盤面ごと）
+SEARCH_STARTS = 6
+# 全色スイープと色ごとの別々の探索を比べる (塗り替え数, ワーカー数)。盤面は種類ごとに1つ
+SWEEP_CASE = (2, 2)
+
+DEFAULT_TOLERANCE = 0.25
+
+# 速度比として表示する (見出し, 速い方の項目, 比べる項目)。基準値の比較には使わない
+SPEEDUPS = [
+    ("bitboard / list simulate", "bitboard.simulate_per_sec", "list.simulate_per_sec"),
+    ("bitboard / list search_pc1", "bitboard.search_pc1.trials_per_sec",
+     "list.search_pc1.trials_per_sec"),
+    ("bitboard / list search_pc2", "bitboard.search_pc2.trials_per_sec",
+     "list.search_pc2.trials_per_sec"),
+    ("TopK / merge_best (k=100)", "topk.push_k100_per_sec", "topk.merge_best_k100_per_sec"),
+    ("search_pc2 top_k=100 / top_k=3", "bitboard.search_pc2_top100.trials_per_sec",
+     "bitboard.search_pc2.trials_per_sec"),
+    ("sweep / separate (pc2, 2 workers)", "bitboard.sweep_pc2_w2.patterns_per_sec",
+     "bitboard.separate_pc2_w2.patterns_per_sec"),
+]
+
+# =========================================================
+# コーパス作成
+#   どれも下詰め済みで、確定盤面の時点では消えない盤面にする。
+# =========================================================
+def random_board(rng, min_height, max_height, heart_rate):
+    field = [["空"] * COLS for _ in range(ROWS)]
+    for c in range(COLS):
+        h = rng.randint(min_height, max_height)
+        for r in range(ROWS - h, ROWS):
+            field[r][c] = "ハート" if rng.random() < heart_rate else rng.choice(NORMAL_COLORS)
+    return field
+
+
+def count_triples(field):
+    # 3個ちょうどの塊の数（あと1個で消える塊）
+    seen = set()
+    triples = 0
+    for r in range(ROWS):
+        for c in range(COLS):
+            if field[r][c] == "空" or (r, c) in seen:
+                continue
+            color = field[r][c]
+            stack = [(r, c)]
+            group = {(r, c)}
+            while stack:
+                cr, cc = stack.pop()
+                for dr, dc in DIR4:
+                    nr, nc = cr + dr, cc + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS and (nr, nc) not in group \
+                            and field[nr][nc] == color:
+                        group.add((nr, nc))
+                        stack.append((nr, nc))
+            seen |= group
+            if len(group) == 3:
+                triples += 1
+    return triples
+
+
+CORPUS_KINDS = {
+    "sparse": lambda rng: random_board(rng, 1, 3, 0.05),
+    "dense": lambda rng: random_board(rng, ROWS, ROWS, 0.05),
+    "heart": lambda rng: random_board(rng, 3, ROWS, 0.35),
+    "near_erase": lambda rng: random_board(rng, 4, ROWS, 0.05),
+}
+
+
+def make_corpus(seed=CORPUS_SEED, per_kind=BOARDS_PER_KIND):
+    rng = random.Random(seed)
+    corpus = []
+    for kind, gen in CORPUS_KINDS.items():
+        made = 0
+        while made < per_kind:
+            field = gen(rng)
+            if engine.has_any_erase_global(field):
+                continue
+            if kind == "near_erase" and count_triples(field) < 5:
+                continue
+            corpus.append({
+                "id": f"{kind}-{made}",
+                "kind": kind,
+                "board": field,
+                "nexts": [rng.choice(NORMAL_COLORS) for _ in range(COLS)],
+                "paint_color": rng.choice(PAINT_COLORS),
+            })
+            made += 1
+    return corpus
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# 埋まっているマスから間隔をあけて最大 n 個（上の行から順）
+def spread_cells(field, n):
+    occupied = [(r, c) for r in range(ROWS) for c in range(COLS) if field[r][c] != "空"]
+    return occupied[::max(1, len(occupied) // n)][:n]
+
+
+# 探索に渡す確定盤面の下調べ（run_search の base=）。起点候補だけ差し替える
+def bench_base(field, n=SEARCH_STARTS):
+    return SimpleNamespace(erase=False, start_cands=spread_cells(field, n))
+
+# =========================================================
+# 元の実装（app.py にあった探索ループそのまま。結果の突き合わせ用）
+#   base_start_cands を渡すと確定盤面の起点候補の代わりに使う（bench_base と同じ）
+# =========================================================
+def reference_search(base_field, nexts, paint_color, paint_count, min_k, base_start_cands=None):
+    if engine.has_any_erase_global(base_field):
+        return []
+
+    recolor_cands = engine.compute_recolor_candidates(base_field, paint_color)
+    if base_start_cands is None:
+        base_start_cands = engine.compute_start_candidates(base_field)
+
+    best = []
+    for k in range(min_k, paint_count + 1):
+        if k > len(recolor_cands):
+            continue
+
+        for combi in combinations(recolor_cands, k):
+            field = [row[:] for row in base_field]
+            changed = set(combi)
+
+            for (r, c) in combi:
+                field[r][c] = paint_color
+
+            if engine.local_has_erase_after_recolor(field, changed):
+                continue
+
+            start_cands = list(base_start_cands)
+            near = set()
+            for (r, c) in changed:
+                near.add((r, c))
+                for dr, dc in DIR4:
+                    nr, nc = r + dr, c + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS:
+                        near.add((nr, nc))
+
+            base_set = set(base_start_cands)
+            for pos in near:
+                if pos in base_set:
+                    continue
+                if engine.is_good_start_candidate(field, pos):
+                    start_cands.append(pos)
+
+            best_local = None
+            for sp in start_cands:
+                chains, score, maxsim, ok = engine.simulate_with_start_scoring(
+                    field, nexts, set(changed), sp
+                )
+                if not ok or chains < 1:
+                    continue
+                cand = {
+                    "chains": chains,
+                    "score": score,
+                    "maxsim": maxsim,
+                    "recolor": tuple(sorted(changed)),
+                    "start": sp,
+                }
+                if (best_local is None) or (cand["score"], cand["chains"], cand["maxsim"]) > (
+                    best_local["score"], best_local["chains"], best_local["maxsim"]
+                ):
+                    best_local = cand
+
+            if best_local is not None:
+                best.append(best_local)
+                best = sorted(best, key=lambda x: (x["score"], x["chains"], x["maxsim"]), reverse=True)[:3]
+
+    return best
+
+# =========================================================
+# 計測
+# =========================================================
+def throughput(fn, units):
+    # fn() 1回で units 回分の処理。MIN_TIME 以上まわして 回/秒 を返す（ROUNDS 回の最速）
+    fn()
+    best = 0.0
+    for _ in range(ROUNDS):
+        n = 0
+        t0 = time.perf_counter()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.perf_counter() - t0
+            if elapsed >= MIN_TIME:
+                break
+        best = max(best, n * units / elapsed)
+    return best
+
+
+def sim_cases(corpus):
+    # 各盤面で、埋まっているマスを最大8個起点にし、塗り替え候補の先頭2個を塗った扱いにする
+    cases = []
+    for item in corpus:
+        field = item["board"]
+        recolored = engine.compute_recolor_candidates(field, item["paint_color"])[:2]
+        for sp in spread_cells(field, 8):
+            cases.append((field, item["nexts"], recolored, sp))
+    return cases
+
+
+def bench_micro(corpus):
+    metrics = {}
+    boards = [item["board"] for item in corpus]
+    colors = [item["paint_color"] for item in corpus]
+    encoded = [bitboard.encode(f) for f in boards]
+    cases = sim_cases(corpus)
+    col_cases = [(colboard.encode(f), nexts, set(rec), sp) for f, nexts, rec, sp in cases]
+    bb_cases = [
+        (bitboard.encode(f), nexts, bitboard.cells_mask(rec), sp) for f, nexts, rec, sp in cases
+    ]
+
+    def list_recolor():
+        for f, color in zip(boards, colors):
+            engine.compute_recolor_candidates(f, color)
+
+    def bb_recolor():
+        for b, color in zip(encoded, colors):
+            bitboard.compute_recolor_candidates(b, color)
+
+    def list_start():
+        for f in boards:
+            engine.compute_start_candidates(f)
+
+    def bb_start():
+        for b in encoded:
+            bitboard.compute_start_candidates(b)
+
+    def list_sim():
+        for f, nexts, rec, sp in cases:
+            engine.simulate_with_start_scoring(f, nexts, set(rec), sp)
+
+    def col_sim():
+        for cols, nexts, rec, sp in col_cases:
+            colboard.simulate_with_start_scoring(cols, nexts, rec, sp)
+
+    def bb_sim():
+        for b, nexts, rec, sp in bb_cases:
+            bitboard.simulate_with_start_scoring(b, nexts, rec, sp)
+
+    metrics["list.recolor_candidates_per_sec"] = throughput(list_recolor, len(boards))
+    metrics["bitboard.recolor_candidates_per_sec"] = throughput(bb_recolor, len(boards))
+    metrics["list.start_candidates_per_sec"] = throughput(list_start, len(boards))
+    metrics["bitboard.start_candidates_per_sec"] = throughput(bb_start, len(boards))
+    metrics["list.simulate_per_sec"] = throughput(list_sim, len(cases))
+    metrics["column.simulate_per_sec"] = throughput(col_sim, len(col_cases))
+    metrics["bitboard.simulate_per_sec"] = throughput(bb_sim, len(bb_cases))
+
+    if npsim is not None:
+        # 全ケースを (B, 6, 8) にまとめて1回で
+        np_boards = npsim.encode_fields([f for f, _, _, _ in cases])
+        np_nexts = np.stack([npsim.encode_colors(nexts) for _, nexts, _, _ in cases])
+        np_starts = [sp for _, _, _, sp in cases]
+        np_recolored = np.stack([npsim.mask_to_array(rec) for _, _, rec, _ in bb_cases])
+
+        def np_sim():
+            npsim.simulate_batch(np_boards, np_nexts, np_starts, np_recolored)
+
+        metrics["numpy.simulate_batch_per_sec"] = throughput(np_sim, len(cases))
+    return metrics
+
+
+def bench_topk(case=TOPK_CASE):
+    # 見つかった結果を1件ずつ上位に入れる：TopK と、毎回並べ直す merge_best
+    k, n = case
+    rng = random.Random(CORPUS_SEED)
+    results = [
+        ((2, i), {"score": rng.randint(0, 40), "chains": rng.randint(1, 6), "maxsim": rng.randint(4, 12)})
+        for i in range(n)
+    ]
+
+    def push():
+        top = TopK(k)
+        for order, res in results:
+            top.push(order, res)
+        return top.best()
+
+    def merge():
+        best = []
+        for entry in results:
+            best = merge_best(best, [entry], k)
+        return best
+
+    assert push() == merge()
+    return {
+        f"topk.push_k{k}_per_sec": throughput(push, n),
+        f"topk.merge_best_k{k}_per_sec": throughput(merge, n),
+    }
+
+
+def bench_search(corpus, cases=SEARCH_CASES):
+    metrics = {}
+    bases = [bench_base(item["board"]) for item in corpus]
+    for name, eng, paint_count, kwargs in cases:
+        elapsed = None
+        for _ in range(ROUNDS):
+            patterns = trials = 0
+            t_round = 0.0
+            for item, base in zip(corpus, bases):
+                t0 = time.perf_counter()
+                _, info = run_search(
+                    item["board"], item["nexts"], item["paint_color"],
+                    paint_count, default_min_k(paint_count), engine=eng, base=base, **kwargs,
+                )
+                t_round += time.perf_counter() - t0
+                patterns += info.get("patterns", 0)
+                trials += info.get("trials", 0)
+            elapsed = t_round if elapsed is None else min(elapsed, t_round)
+        metrics[f"{name}.patterns_per_sec"] = patterns / elapsed
+        metrics[f"{name}.trials_per_sec"] = trials / elapsed
+    return metrics
+
+
+def bench_sweep(corpus, case=SWEEP_CASE):
+    # run_sweep（全色のシャードを1つのプールに）と、色ごとに run_search を呼ぶのとを比べる
+    paint_count, workers = case
+    items = corpus[::BOARDS_PER_KIND]
+    bases = [bench_base(item["board"]) for item in items]
+    min_k = default_min_k(paint_count)
+
+    def sweep():
+        for item, base in zip(items, bases):
+            run_sweep(item["board"], item["nexts"], PAINT_COLORS, paint_count, min_k,
+                      workers=workers, base=base)
+
+    def separate():
+        for item, base in zip(items, bases):
+            for color in PAINT_COLORS:
+                run_search(item["board"], item["nexts"], color, paint_count, min_k,
+                           workers=workers, base=base)
+
+    patterns = sum(
+        run_sweep(item["board"], item["nexts"], PAINT_COLORS, paint_count, min_k, base=base)[1]["patterns"]
+        for item, base in zip(items, bases)
+    )
+    metrics = {}
+    for name, fn in (("sweep", sweep), ("separate", separate)):
+        elapsed = None
+        for _ in range(ROUNDS):
+            t0 = time.perf_counter()
+            fn()
+            t = time.perf_counter() - t0
+            elapsed = t if elapsed is None else min(elapsed, t)
+        metrics[f"bitboard.{name}_pc{paint_count}_w{workers}.patterns_per_sec"] = patterns / elapsed
+    return metrics
+
+
+# 探索の上位3件を元の実装と突き合わせる（起点候補は bench_base）。
+# 戻り値: (食い違い [(盤面, 塗り替え数, エンジン)], 結果が1件以上あった探索の数)
+def cross_check(corpus, counts=CHECK_COUNTS):
+    mismatches = []
+    found = 0
+    for item in corpus:
+        base = bench_base(item["board"])
+        for paint_count in counts:
+            args = (item["board"], item["nexts"], item["paint_color"],
+                    paint_count, default_min_k(paint_count))
+            expected = reference_search(*args, base_start_cands=base.start_cands)
+            found += bool(expected)
+            for eng in ("bitboard", "list", "column"):
+                results, _ = run_search(*args, engine=eng, base=base)
+                if results != expected:
+                    mismatches.append((item["id"], paint_count, eng))
+    return mismatches, found
+
+
+# シミュレーションを engine.py と突き合わせる（sim_cases の全ケース、エンジンごと）。
+# 戻り値: (食い違い [(エンジン, ケース番号)], 連鎖が起きたケースの数)
+def check_simulate(corpus):
+    cases = sim_cases(corpus)
+    expected = [
+        engine.simulate_with_start_scoring(f, nexts, set(rec), sp) for f, nexts, rec, sp in cases
+    ]
+    got = {
+        "column": [
+            colboard.simulate_with_start_scoring(colboard.encode(f), nexts, set(rec), sp)
+            for f, nexts, rec, sp in cases
+        ],
+        "bitboard": [
+            bitboard.simulate_with_start_scoring(
+                bitboard.encode(f), nexts, bitboard.cells_mask(rec), sp
+            )
+            for f, nexts, rec, sp in cases
+        ],
+    }
+    if npsim is not None:
+        res = npsim.simulate_batch(
+            npsim.encode_fields([f for f, _, _, _ in cases]),
+            np.stack([npsim.encode_colors(nexts) for _, nexts, _, _ in cases]),
+            [sp for _, _, _, sp in cases],
+            np.stack([npsim.mask_to_array(bitboard.cells_mask(rec)) for _, _, rec, _ in cases]),
+        )
+        got["numpy"] = list(zip(*(a.tolist() for a in res)))
+
+    mismatches = []
+    for eng, sims in got.items():
+        for i, (a, b) in enumerate(zip(expected, sims)):
+            if tuple(a) != tuple(b):
+                mismatches.append((eng, i))
+    return mismatches, sum(1 for res in expected if res[0] >= 1)
+
+# =========================================================
+# 基準値との比較
+# =========================================================
+def compare(metrics, baseline, tolerance):
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        now = metrics.get(name)
+        if now is None:
+            print(f"  (基準値のみ) {name}")
+            continue
+        if now < base * (1 - tolerance):
+            regressions.append((name, base, now))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="探索エンジンのベンチマーク")
+    parser.add_argument("--make-corpus", action="store_true", help="コーパスを作り直して終了")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の値を基準値として保存")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="基準値からの許容低下率（既定 0.25 = 25%%）")
+    parser.add_argument("--no-check", action="store_true", help="元の実装との突き合わせを省く")
+    args = parser.parse_args(argv)
+
+    if args.make_corpus:
+        with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+            for item in make_corpus():
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        print(f"コーパスを書き出しました: {CORPUS_PATH}")
+        return 0
+
+    corpus = load_corpus()
+    print(f"コーパス: {len(corpus)} 盤面")
+
+    metrics = bench_micro(corpus)
+    metrics.update(bench_topk())
+    metrics.update(bench_search(corpus))
+    metrics.update(bench_sweep(corpus))
+    for name in sorted(metrics):
+        print(f"  {name:45s} {metrics[name]:14,.1f}")
+    for label, fast, slow in SPEEDUPS:
+        if fast in metrics and slow in metrics:
+            print(f"  {label:45s} {metrics[fast] / metrics[slow]:13.1f}x")
+
+    failed = False
+
+    if not args.no_check:
+        mismatches, found = cross_check(corpus)
+        if mismatches:
+            failed = True
+            print("上位3件が元の実装と一致しません:")
+            for board_id, paint_count, eng in mismatches:
+                print(f"  {board_id} paint_count={paint_count} engine={eng}")
+        else:
+            print(f"上位3件: 元の実装と一致（結果あり {found} 探索）")
+
+        mismatches, chained = check_simulate(corpus)
+        if mismatches:
+            failed = True
+            print("シミュレーション結果が engine.py と一致しません:")
+            for eng, i in mismatches:
+                print(f"  engine={eng} case={i}")
+        else:
+            print(f"シミュレーション: engine.py と一致（連鎖あり {chained} ケース）")
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "machine": platform.platform(),
+                "python": platform.python_version(),
+                "metrics": {name: round(value, 1) for name, value in sorted(metrics.items())},
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基準値を保存しました: {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(metrics, baseline["metrics"], args.tolerance)
+        if regressions:
+            failed = True
+            print(f"基準値より {args.tolerance:.0%} 以上遅くなった項目:")
+            for name, base, now in regressions:
+                print(f"  {name}: {base:,.1f} → {now:,.1f}（{now / base - 1:+.0%}）")
+        else:
+            print(f"基準値との比較: OK（許容低下 {args.tolerance:.0%}）")
+    else:
+        print("基準値がありません（--save-baseline で保存）")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,513 @@
+# =========================================================
+# ビットボード版エンジン
+#   盤面を「色ごとの48ビット整数マスク」で持ち、
+#   連結探索・4つ消し・ハート巻き込み・落下をビット演算で行う。
+#   app.py のリスト版と同じ結果を返す（高速化専用）。
+# =========================================================
+from functools import lru_cache
+import random
+
+from engine import COLS, ROWS
+
+# 1列 = 8ビット（下から高さ0..5、上位2ビットは番兵）
+STRIDE = 8
+COL_MASK = (1 << ROWS) - 1
+
+# マスクの並び順（空はどのマスクにも立たない）
+COLOR_ORDER = ["赤", "青", "緑", "黄", "紫", "ハート"]
+COLOR_INDEX = {color: i for i, color in enumerate(COLOR_ORDER)}
+HEART = COLOR_INDEX["ハート"]
+NORMAL_IDX = range(HEART)
+
+FULL = 0
+ONES = 0   # 各列の高さ0（最下段）
+for _c in range(COLS):
+    FULL |= COL_MASK << (_c * STRIDE)
+    ONES |= 1 << (_c * STRIDE)
+
+# BIT[r][c]：(r, c) のビット（r=0 が最上段）
+BIT = [[1 << (c * STRIDE + (ROWS - 1 - r)) for c in range(COLS)] for r in range(ROWS)]
+
+# PEXT[occ << ROWS | bits]：列の占有ビット occ に沿って bits を下詰めした値
+PEXT = [0] * (1 << (2 * ROWS))
+for _occ in range(1 << ROWS):
+    for _bits in range(1 << ROWS):
+        if _bits & ~_occ:
+            continue
+        _out = 0
+        _k = 0
+        for _h in range(ROWS):
+            if _occ >> _h & 1:
+                if _bits >> _h & 1:
+                    _out |= 1 << _k
+                _k += 1
+        PEXT[_occ << ROWS | _bits] = _out
+
+
+def pos_bit(pos):
+    r, c = pos
+    return BIT[r][c]
+
+
+def cells_mask(cells):
+    m = 0
+    for (r, c) in cells:
+        m |= BIT[r][c]
+    return m
+
+
+def neighbors(m):
+    return ((m << 1) | (m >> 1) | (m << STRIDE) | (m >> STRIDE)) & FULL
+
+
+def flood(seed, mask):
+    comp = seed
+    while True:
+        grown = (comp | (comp << 1) | (comp >> 1) | (comp << STRIDE) | (comp >> STRIDE)) & mask
+        if grown == comp:
+            return comp
+        comp = grown
+
+
+# =========================================================
+# 変換（field ⇔ board）
+# =========================================================
+def encode(field):
+    board = [0] * len(COLOR_ORDER)
+    for r in range(ROWS):
+        for c in range(COLS):
+            i = COLOR_INDEX.get(field[r][c])
+            if i is not None:
+                board[i] |= BIT[r][c]
+    return board
+
+
+def decode(board):
+    field = [["空"] * COLS for _ in range(ROWS)]
+    for i, m in enumerate(board):
+        for r in range(ROWS):
+            for c in range(COLS):
+                if m & BIT[r][c]:
+                    field[r][c] = COLOR_ORDER[i]
+    return field
+
+
+def set_cell(board, r, c, color):
+    b = BIT[r][c]
+    for i in range(len(board)):
+        board[i] &= ~b
+    i = COLOR_INDEX.get(color)
+    if i is not None:
+        board[i] |= b
+
+
+def occupied(board):
+    occ = 0
+    for m in board:
+        occ |= m
+    return occ
+
+
+# =========================================================
+# 連結探索・消去判定
+# =========================================================
+def count_component(board, sr, sc, color, blocked=None):
+    if not (0 <= sr < ROWS and 0 <= sc < COLS):
+        return 0
+    i = COLOR_INDEX.get(color)
+    mask = FULL & ~occupied(board) if i is None else board[i]
+    if blocked:
+        mask &= ~cells_mask(blocked)
+    seed = BIT[sr][sc]
+    if not mask & seed:
+        return 0
+    return flood(seed, mask).bit_count()
+
+
+# 4つ以上の塊に必ず含まれ、3つ以下の塊には含まれないマスを返す。
+# 4マス以上の連結な塊には「同色の隣が3つ以上のマス」か
+# 「同色の隣が2つ以上のマス同士の隣接」が必ずあり、3マス以下の塊には無い。
+def big_component_seeds(m):
+    u = m & (m >> 1)
+    d = m & (m << 1)
+    l = m & (m << STRIDE)
+    r = m & (m >> STRIDE)
+    ud = u | d
+    lr = l | r
+    deg2 = (u & d) | (ud & lr) | (l & r)
+    if not deg2:
+        return 0
+    deg3 = (u & d & lr) | (l & r & ud)
+    return deg3 | (deg2 & neighbors(deg2))
+
+
+def erase_mask(board):
+    erase = 0
+    for i in NORMAL_IDX:
+        # big_component_seeds() を展開したもの（最内ループなので関数呼び出しを省く）
+        m = board[i]
+        u = m & (m >> 1)
+        d = m & (m << 1)
+        l = m & (m << STRIDE)
+        r = m & (m >> STRIDE)
+        ud = u | d
+        lr = l | r
+        deg2 = (u & d) | (ud & lr) | (l & r)
+        if not deg2:
+            continue
+        seeds = (u & d & lr) | (l & r & ud) | (deg2 & neighbors(deg2))
+        if seeds:
+            erase |= flood(seeds, m)
+
+    # ハート巻き込み
+    if erase:
+        erase |= board[HEART] & neighbors(erase)
+    return erase
+
+
+def erases_at(board, r, c):
+    b = BIT[r][c]
+    for i in NORMAL_IDX:
+        if board[i] & b:
+            return flood(b, board[i]).bit_count() >= 4
+    return False
+
+
+def has_any_erase_global(board):
+    return erase_mask(board) != 0
+
+
+def local_has_erase_after_recolor(board, changed_cells):
+    # 元盤面に消える塊は無い前提なので、塗り替えマスを含む塊だけ見れば十分
+    changed = cells_mask(changed_cells)
+    focus = changed | neighbors(changed)
+    # ハート巻き込み（念のため）：focus 内ハートの隣も見る
+    focus |= neighbors(board[HEART] & focus)
+    for i in NORMAL_IDX:
+        m = board[i]
+        if not m & focus:
+            continue
+        seeds = big_component_seeds(m)
+        if seeds and flood(seeds, m) & focus:
+            return True
+    return False
+
+
+# 色ごとの、4つ以上の通常色の塊（消える塊）をまとめたマスク
+def big_components(board):
+    bigs = []
+    for i in NORMAL_IDX:
+        m = board[i]
+        seeds = big_component_seeds(m)
+        bigs.append(flood(seeds, m) if seeds else 0)
+    return bigs
+
+
+# 起点 b（埋まっているマス）を抜いても、隣に4つ以上の塊が残るか
+def good_start_bit(b, bigs):
+    near = neighbors(b)
+    for big in bigs:
+        if not big & near:
+            continue
+        if not big & b:
+            # 起点と別の塊は、起点を抜いても変わらない
+            return True
+        # 起点を含む塊だけ抜いて数え直す（隣の同色はみなこの塊）
+        comp = flood(b, big) & ~b
+        seeds = big_component_seeds(comp)
+        if seeds and flood(seeds, comp) & near:
+            return True
+    return False
+
+
+def is_good_start_candidate(board, pos):
+    b = pos_bit(pos)
+    return bool(occupied(board) & b) and good_start_bit(b, big_components(board))
+
+
+def filter_start_candidates(board, positions):
+    # 起点を抜いて4つ以上が残るには、抜く前から4つ以上の塊が必要
+    bigs = big_components(board)
+    if not any(bigs):
+        return []
+    occ = occupied(board)
+    return [pos for pos in positions if occ & pos_bit(pos) and good_start_bit(pos_bit(pos), bigs)]
+
+
+def compute_start_candidates(board):
+    bigs = big_components(board)
+    big = 0
+    for m in bigs:
+        big |= m
+    # 4つ以上の塊の隣のマスだけ調べる
+    near = occupied(board) & neighbors(big)
+    if not near:
+        return []
+    cands = []
+    for r in range(ROWS):
+        for c in range(COLS):
+            b = BIT[r][c]
+            if near & b and good_start_bit(b, bigs):
+                cands.append((r, c))
+    return cands
+
+
+def compute_recolor_candidates(board, paint_color):
+    cands = []
+    p = COLOR_INDEX[paint_color]
+    occ = occupied(board)
+    for r in range(ROWS):
+        for c in range(COLS):
+            b = BIT[r][c]
+            if not occ & b or board[p] & b:
+                continue
+            tmp = board[:]
+            set_cell(tmp, r, c, paint_color)
+            if local_has_erase_after_recolor(tmp, {(r, c)}):
+                continue
+            cands.append((r, c))
+    return cands
+
+
+# =========================================================
+# 落下
+# =========================================================
+def apply_gravity(board):
+    occ = occupied(board)
+    # 列ごとに occ+1 して occ と AND：下詰め済みでない列だけビットが残る
+    # （番兵ビットがあるので桁あふれは列を越えない）
+    uns = occ & (occ + ONES)
+    while uns:
+        low = uns & -uns
+        sh = (low.bit_length() - 1) & ~(STRIDE - 1)
+        uns &= ~(COL_MASK << sh)
+
+        base = ((occ >> sh) & COL_MASK) << ROWS
+        clear = ~(COL_MASK << sh)
+        for i, m in enumerate(board):
+            bits = (m >> sh) & COL_MASK
+            if bits:
+                board[i] = (m & clear) | (PEXT[base | bits] << sh)
+
+
+# 各列の「上から最初の空き」マス（満杯の列は無し）をまとめたマスク
+def next_drop_bits(board):
+    s = FULL & ~occupied(board)
+    # 列内で下方向に塗り広げ、最上位ビットだけ残す（2ビット以下のシフトは番兵で止まる）
+    s |= (s >> 1) & FULL
+    s |= (s >> 2) & FULL
+    s |= (s >> 2) & FULL
+    return s & ~(s >> 1) & FULL
+
+
+# ネクスト（tuple）を色ごとの列マスクにしたもの
+@lru_cache(maxsize=64)
+def next_color_masks(nexts):
+    masks = [0] * len(COLOR_ORDER)
+    for c, color in enumerate(nexts):
+        masks[COLOR_INDEX[color]] |= COL_MASK << (c * STRIDE)
+    return tuple(masks)
+
+
+def drop_nexts(board, nexts):
+    tops = next_drop_bits(board)
+    if tops:
+        for i, m in enumerate(next_color_masks(tuple(nexts))):
+            if m:
+                board[i] |= tops & m
+
+
+# =========================================================
+# 連鎖（b を書き換える）
+#   steps は各連鎖で消えた通常色マスのマスク。得点は除外マスを引いて数える
+#   （塗り替えマス・起点マスは位置で除外するので、盤面だけでは決まらない）。
+# =========================================================
+def run_chain(b):
+    chains = 0
+    maxsim = 0
+    steps = []
+
+    while True:
+        erase = erase_mask(b)
+        if not erase:
+            break
+
+        chains += 1
+        n = erase.bit_count()
+        if n > maxsim:
+            maxsim = n
+
+        keep = ~erase
+        normal = 0
+        for i in NORMAL_IDX:
+            normal |= b[i] & erase
+            b[i] &= keep
+        b[HEART] &= keep
+        steps.append(normal)
+
+        apply_gravity(b)
+
+    return chains, maxsim, tuple(steps)
+
+
+def steps_score(steps, excl):
+    # 得点：通常色のみ（除外マスの位置で消えた分は0点）
+    score = 0
+    keep = ~excl
+    for m in steps:
+        score += (m & keep).bit_count()
+    return score
+
+
+# =========================================================
+# 起点消し→連鎖→得点
+#   ネクスト落下と下詰めは起点によらないので、同じ盤面で起点だけ変える時は
+#   prepare_start_trials を1回呼んで simulate_prepared を起点ごとに呼ぶ。
+# =========================================================
+# recolored_mask は cells_mask() で作った塗り替えマスのマスク
+def simulate_prepared(prep, recolored_mask, start_pos):
+    post = start_removed(prep, start_pos)
+    if post is None:
+        return 0, 0, 0, False
+
+    chains, maxsim, steps = run_chain(post)
+    sr, sc = start_pos
+    return chains, steps_score(steps, recolored_mask | BIT[sr][sc]), maxsim, True
+
+
+# 1回だけ試すとき用（落下・下詰めを1度で済ませる）
+def simulate_with_start_scoring(board, nexts, recolored_mask, start_pos):
+    b = board[:]
+
+    # ネクスト落下
+    drop_nexts(b, nexts)
+
+    sr, sc = start_pos
+    sbit = BIT[sr][sc]
+    for i in range(len(b)):
+        if b[i] & sbit:
+            # 起点消し（得点0）→ 落下
+            b[i] &= ~sbit
+            break
+    else:
+        return 0, 0, 0, False
+    apply_gravity(b)
+
+    chains, maxsim, steps = run_chain(b)
+    return chains, steps_score(steps, recolored_mask | sbit), maxsim, True
+
+
+# =========================================================
+# 置換表つきシミュレーション
+#   起点消し後の盤面 = 「ネクスト落下後を全列下詰めした盤面」の起点列だけを
+#   「起点を抜いて下詰めした列」に差し替えたもの（落下は列ごとに独立）。
+#   なので組み合わせごとに prepare_start_trials() を1回作れば、
+#   起点ごとのハッシュは起点列の差分だけで求まる。
+# =========================================================
+_zobrist_rng = random.Random(20240601)
+# ZOBRIST[色][列][列の6ビット]（空の列は0）
+ZOBRIST = [
+    [[0] + [_zobrist_rng.getrandbits(64) for _ in range(1, 1 << ROWS)] for _c in range(COLS)]
+    for _i in COLOR_ORDER
+]
+
+
+def column_hash(board, c):
+    sh = c * STRIDE
+    h = 0
+    for i, m in enumerate(board):
+        h ^= ZOBRIST[i][c][(m >> sh) & COL_MASK]
+    return h
+
+
+def zobrist_hash(board):
+    h = 0
+    for c in range(COLS):
+        h ^= column_hash(board, c)
+    return h
+
+
+def prepare_start_trials(board, nexts):
+    dropped = board[:]
+    drop_nexts(dropped, nexts)
+    settled = dropped[:]
+    apply_gravity(settled)
+    return dropped, settled, zobrist_hash(settled)
+
+
+# 起点消し後の盤面（起点の列以外は settled のまま、起点の列だけ落とし直す）
+def start_removed(prep, start_pos):
+    dropped, settled, _ = prep
+    sr, sc = start_pos
+    sbit = BIT[sr][sc]
+    if not occupied(dropped) & sbit:
+        return None
+
+    col = COL_MASK << (sc * STRIDE)
+    keep = col & ~sbit
+    post = [(s & ~col) | (d & keep) for s, d in zip(settled, dropped)]
+    apply_gravity(post)
+    return post
+
+
+def post_start_board(prep, start_pos):
+    post = start_removed(prep, start_pos)
+    if post is None:
+        return None, 0
+    settled, h = prep[1], prep[2]
+    sc = start_pos[1]
+    return post, h ^ column_hash(settled, sc) ^ column_hash(post, sc)
+
+
+def simulate_with_tt(prep, recolored_mask, start_pos, tt):
+    post, key = post_start_board(prep, start_pos)
+    if post is None:
+        return 0, 0, 0, False
+
+    state = tuple(post)
+    value = tt.get(key, state)
+    if value is None:
+        value = run_chain(post)
+        tt.put(key, state, value)
+
+    chains, maxsim, steps = value
+    sr, sc = start_pos
+    return chains, steps_score(steps, recolored_mask | BIT[sr][sc]), maxsim, True
+
+
+# =========================================================
+# 起点の同値類まとめ
+#   同じ列で同色が縦に続くマスなど、どれを消しても起点消し後の盤面が同じになる
+#   起点がある。連鎖は盤面だけで決まるので盤面ごとに1回だけ回し、
+#   得点は起点ごとの除外（その起点の位置）で数え直す。
+#   tt があれば盤面ごとの連鎖は置換表も使う。
+#   戻り値: (起点ごとの (chains, score, maxsim, ok), 盤面の種類数)
+# =========================================================
+def simulate_start_classes(prep, recolored_mask, starts, tt=None):
+    results = []
+    classes = {}
+    for sp in starts:
+        if tt is not None:
+            post, key = post_start_board(prep, sp)
+        else:
+            post = start_removed(prep, sp)
+        if post is None:
+            results.append((0, 0, 0, False))
+            continue
+
+        state = tuple(post)
+        value = classes.get(state)
+        if value is None:
+            if tt is not None:
+                value = tt.get(key, state)
+                if value is None:
+                    value = run_chain(post)
+                    tt.put(key, state, value)
+            else:
+                value = run_chain(post)
+            classes[state] = value
+
+        chains, maxsim, steps = value
+        sr, sc = sp
+        results.append((chains, steps_score(steps, recolored_mask | BIT[sr][sc]), maxsim, True))
+    return results, len(classes)
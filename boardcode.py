@@ -0,0 +1,73 @@
+# =========================================================
+# 盤面の詰めた表現（セッションの保存・共有コード・Undo 用）
+#   盤面 = 48 バイトの bytes（1マス1バイト、値は COLORS の添字、行優先）。
+#   bytes は書き換えられないので、保存・確定・読込はコピー無しで渡せる。
+#   共有コードは1マス3ビットに詰めて base64（URL 安全、24文字）にしたもの。
+#   Undo は盤面そのものではなく、変わったマスの (位置, 元の値) の列で持つ。
+# =========================================================
+import base64
+
+from engine import COLORS, COLS, ROWS
+
+CELLS = ROWS * COLS
+COLOR_CODE = {color: i for i, color in enumerate(COLORS)}
+
+CODE_BITS = 3
+CODE_BYTES = CELLS * CODE_BITS // 8
+
+
+def filled_board(color):
+    return bytes([COLOR_CODE[color]]) * CELLS
+
+
+def encode_board(field):
+    return bytes(COLOR_CODE[v] for row in field for v in row)
+
+
+def decode_board(data):
+    return [[COLORS[data[r * COLS + c]] for c in range(COLS)] for r in range(ROWS)]
+
+
+def set_board_cell(data, r, c, color):
+    i = r * COLS + c
+    return data[:i] + bytes([COLOR_CODE[color]]) + data[i + 1:]
+
+# =========================================================
+# 共有コード
+# =========================================================
+def board_to_code(data):
+    n = 0
+    for v in reversed(data):
+        n = (n << CODE_BITS) | v
+    return base64.urlsafe_b64encode(n.to_bytes(CODE_BYTES, "little")).decode("ascii")
+
+
+def board_from_code(code):
+    try:
+        raw = base64.urlsafe_b64decode(code.strip().encode("ascii"))
+    except (ValueError, UnicodeEncodeError):
+        # binascii.Error も ValueError
+        raise ValueError("共有コードが読めません") from None
+    if len(raw) != CODE_BYTES:
+        raise ValueError("共有コードの長さが違います")
+
+    n = int.from_bytes(raw, "little")
+    mask = (1 << CODE_BITS) - 1
+    data = bytes((n >> (CODE_BITS * i)) & mask for i in range(CELLS))
+    if any(v >= len(COLORS) for v in data):
+        raise ValueError("共有コードに不明な色があります")
+    return data
+
+# =========================================================
+# Undo 用の差分
+# =========================================================
+def undo_diff(old, new):
+    # new → old に戻すための (位置, 元の値)
+    return tuple((i, a) for i, (a, b) in enumerate(zip(old, new)) if a != b)
+
+
+def apply_diff(data, diff):
+    buf = bytearray(data)
+    for i, v in diff:
+        buf[i] = v
+    return bytes(buf)
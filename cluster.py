@@ -0,0 +1,500 @@
+# =========================================================
+# 複数マシンでの探索（コーディネーター／ワーカー、TCP で JSON を1行ずつ）
+#   run_search / run_sweep に cluster=Coordinator(...) を渡すと、プロセスプールの
+#   代わりに、つないできたワーカーへシャード（塗る色・k・順位範囲）を配る。
+#   上位の統合・進捗・置換表や計測の集計は並列時と同じ（結果もワーカー数によらず同じ）。
+#   ワーカーは探索条件（spec）から prepare_search で ctx を作り直して search_shard を回す
+#   （pickle は送らない。条件が同じなら塗り替え候補の並びも同じになるので照合だけする。
+#   起点候補は盤面から求め直さず spec で送る＝run_search の base= もそのまま効く）。
+#   ワーカーが切れたとき・HEARTBEAT_TIMEOUT 秒なにも言ってこないときは、
+#   走っていたシャードを最初からほかのワーカーに回す。
+#   ワーカーが1つもいないあいだは、シャードを積んだままつないでくるのを待つ。
+#
+#   コーディネーター: python batch.py boards.jsonl --listen 0.0.0.0:5555
+#   ワーカー        : python cluster.py HOST:5555 --procs 4
+#   （1台で試すなら python batch.py boards.jsonl --local-workers 3）
+#
+#   やりとり（1行1 JSON、"type" で種類を分ける）
+#     ワーカー → : hello {name, version, token} / progress {job, patterns, trials}
+#                  / result {job, best, patterns, trials, stats} / cancelled {job}
+#                  / error {job, message}
+#     → ワーカー : welcome / reject {message}
+#                  / job {job, spec, k, lo, hi, remaining} / cancel {job}
+# =========================================================
+import argparse
+from collections import deque
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+from resultcache import ENGINE_VERSION, decode_results
+from search import CANCEL_POLL, SearchCancelled, prepare_search, search_shard
+
+# 走っているワーカーからこれだけ何も来なければ、落ちたとみなす（秒）
+HEARTBEAT_TIMEOUT = 60.0
+
+# ワーカーが途中経過（生存確認を兼ねる）を送る間隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+# 同じシャードでワーカーがこれだけ落ちたら、探索をエラーにする
+MAX_SHARD_ATTEMPTS = 3
+
+# ワーカーが覚えておく ctx の数（探索条件ごと）
+CTX_CACHE_SIZE = 16
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"アドレスは HOST:PORT で指定してください: {text!r}")
+    return host, int(port)
+
+
+def send_message(sock, msg):
+    sock.sendall((json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def read_messages(sock):
+    with sock.makefile("rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# =========================================================
+# 探索条件（ワーカーが ctx を作り直すのに要るもの）
+# =========================================================
+def shard_spec(ctx):
+    return {
+        "base_field": ctx.base_field,
+        "nexts": ctx.nexts,
+        "paint_color": ctx.paint_color,
+        "paint_count": ctx.paint_count,
+        "min_k": ctx.min_k,
+        "engine": ctx.engine,
+        "tt_size": ctx.tt_size,
+        "profile": ctx.profile,
+        "top_k": ctx.top_k,
+        "prune": ctx.prune,
+        "anytime": ctx.deadline is not None,
+        # 呼び出し側が base= で渡した起点候補もそのまま使う（盤面から求め直さない）
+        "start_cands": [list(pos) for pos in ctx.base_start_cands],
+        # 照合用（版が違うと並びが変わり、順位範囲が別の組み合わせを指してしまう）
+        "recolor_cands": [list(pos) for pos in ctx.recolor_cands],
+    }
+
+
+def build_ctx(spec):
+    plan = prepare_search(
+        spec["base_field"], spec["nexts"], spec["paint_color"], spec["paint_count"], spec["min_k"],
+        SimpleNamespace(erase=False, start_cands=[tuple(pos) for pos in spec["start_cands"]]),
+        spec["engine"], 1, spec["tt_size"], spec["profile"],
+        0 if spec["anytime"] else None, spec["top_k"], time.time(), spec["prune"],
+    )
+    ctx = plan.ctx
+    if ctx is None or [list(pos) for pos in ctx.recolor_cands] != spec["recolor_cands"]:
+        raise RuntimeError("塗り替え候補がコーディネーターと合いません（版が違う？）")
+    return ctx
+
+# =========================================================
+# ワーカー
+#   1接続で1シャードずつ受け取って回す。コーディネーターが閉じたら戻る。
+# =========================================================
+def run_worker(address, name=None, token=None):
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    sock = socket.create_connection(address)
+    try:
+        send_message(sock, {"type": "hello", "name": name, "version": ENGINE_VERSION, "token": token})
+        messages = read_messages(sock)
+        reply = next(messages, None)
+        if reply is None or reply["type"] != "welcome":
+            raise RuntimeError(f"コーディネーターに断られました: {reply and reply.get('message')}")
+
+        # 受信は別スレッド（シャードを回しているあいだも cancel を受け取れるように）
+        jobs = queue.Queue()
+        cancelled = set()
+
+        def receive():
+            try:
+                for msg in messages:
+                    if msg["type"] == "job":
+                        jobs.put(msg)
+                    elif msg["type"] == "cancel":
+                        cancelled.add(msg["job"])
+            except (OSError, ValueError):
+                pass
+            jobs.put(None)
+
+        threading.Thread(target=receive, daemon=True).start()
+
+        ctxs = {}
+        while True:
+            msg = jobs.get()
+            if msg is None:
+                return
+            send_message(sock, run_job(sock, msg, ctxs, cancelled))
+    finally:
+        sock.close()
+
+
+def run_job(sock, msg, ctxs, cancelled):
+    job = msg["job"]
+    try:
+        key = json.dumps(msg["spec"], sort_keys=True, ensure_ascii=False)
+        ctx = ctxs.get(key)
+        if ctx is None:
+            if len(ctxs) >= CTX_CACHE_SIZE:
+                ctxs.clear()
+            ctx = ctxs[key] = build_ctx(msg["spec"])
+        # 時間制限つきなら残り時間から締め切りを作る（マシン間の時計のずれに依らないように）
+        remaining = msg["remaining"]
+        ctx.deadline = time.time() + remaining if remaining is not None else None
+
+        done = {"patterns": 0, "trials": 0}
+        last = time.time()
+
+        def tick(patterns, trials, top):
+            nonlocal last
+            done["patterns"] += patterns
+            done["trials"] += trials
+            if job in cancelled:
+                raise SearchCancelled
+            now = time.time()
+            if now - last >= PROGRESS_INTERVAL:
+                send_message(sock, {"type": "progress", "job": job, **done})
+                last = now
+
+        best, patterns, trials, stats = search_shard(ctx, msg["k"], msg["lo"], msg["hi"], tick)
+    except SearchCancelled:
+        return {"type": "cancelled", "job": job}
+    except Exception as e:
+        return {"type": "error", "job": job, "message": f"{type(e).__name__}: {e}"}
+    return {
+        "type": "result", "job": job,
+        "best": [[list(order), res] for order, res in best],
+        "patterns": patterns, "trials": trials, "stats": stats,
+    }
+
+
+def _worker_process(address, name, token):
+    try:
+        run_worker(address, name, token)
+    except (OSError, KeyboardInterrupt):
+        pass
+
+
+def start_workers(address, procs, token=None, name=None):
+    # ワーカーを procs 個のプロセスで起動する（1台で試すときにも使う）
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(procs):
+        label = f"{name or socket.gethostname()}#{i}"
+        p = ctx.Process(target=_worker_process, args=(tuple(address), label, token), daemon=True)
+        p.start()
+        workers.append(p)
+    return workers
+
+# =========================================================
+# コーディネーター
+#   受け付け・ワーカーごとの受信・生存確認はそれぞれスレッドで動く。
+#   run_shards は search.run_shards と同じ形で、探索側のスレッドから呼ぶ
+#   （いくつ同時に呼んでもよい。シャードは来た順に空いたワーカーへ配る）。
+# =========================================================
+class Coordinator:
+    def __init__(self, address=("127.0.0.1", 0), token=None, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.token = token
+        self.heartbeat_timeout = heartbeat_timeout
+        self.server = socket.create_server(tuple(address))
+        self.address = self.server.getsockname()[:2]
+        self.lock = threading.Lock()
+        self.workers = []
+        self.idle = deque()
+        self.pending = deque()
+        self.next_job = 0
+        self.totals = {"shards": 0, "reassigned": 0, "workers_lost": 0}
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.closed = True
+        self.server.close()
+        with self.lock:
+            for w in list(self.workers):
+                self._kill(w)
+
+    def size(self):
+        with self.lock:
+            return len(self.workers)
+
+    # シャードの分け方（plan_shards の workers）。ワーカーが少なくても
+    # 落ちたときに回し直す単位が大きくなりすぎないよう2以上にする
+    def shard_workers(self):
+        return max(2, self.size())
+
+    # ワーカーごとの様子（名前・走っているシャード・その途中のパターン数・終えたシャード数）
+    def status(self):
+        with self.lock:
+            return [
+                {
+                    "name": w.name,
+                    "shard": None if w.shard is None else [w.shard.spec["paint_color"], w.shard.k, w.shard.lo, w.shard.hi],
+                    "patterns": w.patterns,
+                    "done_shards": w.done_shards,
+                }
+                for w in self.workers
+            ]
+
+    # ---------------------
+    # 探索側
+    #   jobs は (タグ, ctx, k, lo, hi) の列。終わったシャードごとに on_done(タグ, 戻り値)。
+    #   戻り値: この呼び出しの集計 {"shards", "reassigned", "workers"}
+    # ---------------------
+    def run_shards(self, jobs, on_done, check_cancel, deadline=None):
+        run = SimpleNamespace(events=queue.Queue(), active=True, deadline=deadline,
+                              reassigned=0, workers=set())
+        specs = {}
+        shards = []
+        with self.lock:
+            for tag, ctx, k, lo, hi in jobs:
+                if id(ctx) not in specs:
+                    specs[id(ctx)] = shard_spec(ctx)
+                shards.append(SimpleNamespace(
+                    job=self.next_job, run=run, tag=tag, spec=specs[id(ctx)],
+                    k=k, lo=lo, hi=hi, attempts=0,
+                ))
+                self.next_job += 1
+            self.pending.extend(shards)
+            self.totals["shards"] += len(shards)
+            self._dispatch()
+
+        outstanding = len(shards)
+        try:
+            while outstanding:
+                check_cancel()
+                if deadline is not None and time.time() >= deadline:
+                    # 時間切れ：まだ配っていないシャードは取り消す
+                    # （走っているシャードは残り時間を見てすぐ戻る）
+                    with self.lock:
+                        outstanding -= self._withdraw(run)
+                    if not outstanding:
+                        break
+                try:
+                    kind, shard, out = run.events.get(timeout=CANCEL_POLL)
+                except queue.Empty:
+                    continue
+                outstanding -= 1
+                if kind == "error":
+                    raise RuntimeError(out)
+                on_done(shard.tag, out)
+        finally:
+            with self.lock:
+                run.active = False
+                self._withdraw(run)
+                for w in self.workers:
+                    if w.shard is not None and w.shard.run is run:
+                        self._send(w, {"type": "cancel", "job": w.shard.job})
+
+        return {"shards": len(shards), "reassigned": run.reassigned, "workers": len(run.workers)}
+
+    # ---------------------
+    # ここから下はロックを持って呼ぶ
+    # ---------------------
+    def _withdraw(self, run):
+        keep = [shard for shard in self.pending if shard.run is not run]
+        n = len(self.pending) - len(keep)
+        self.pending = deque(keep)
+        return n
+
+    def _send(self, w, msg):
+        try:
+            send_message(w.sock, msg)
+            return True
+        except OSError:
+            self._kill(w)
+            return False
+
+    def _kill(self, w):
+        # 受信スレッドが抜けて _drop する
+        try:
+            w.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _dispatch(self):
+        while self.idle and self.pending:
+            shard = self.pending.popleft()
+            if not shard.run.active:
+                continue
+            remaining = None
+            if shard.run.deadline is not None:
+                remaining = shard.run.deadline - time.time()
+                if remaining <= 0:
+                    # 時間切れ：配らずに終わったことにする
+                    shard.run.events.put(("done", shard, ([], 0, 0, {})))
+                    continue
+            w = self.idle.popleft()
+            w.shard = shard
+            w.patterns = 0
+            w.last_seen = time.time()
+            msg = {
+                "type": "job", "job": shard.job, "spec": shard.spec,
+                "k": shard.k, "lo": shard.lo, "hi": shard.hi, "remaining": remaining,
+            }
+            if not self._send(w, msg):
+                w.shard = None
+                self.pending.appendleft(shard)
+
+    def _requeue(self, shard, reason):
+        shard.attempts += 1
+        if shard.attempts >= MAX_SHARD_ATTEMPTS:
+            shard.run.events.put(("error", shard, (
+                f"シャード（{shard.spec['paint_color']} k={shard.k} {shard.lo}～{shard.hi}）で"
+                f"ワーカーが {shard.attempts} 回落ちました（{reason}）"
+            )))
+            return
+        shard.run.reassigned += 1
+        self.totals["reassigned"] += 1
+        self.pending.appendleft(shard)
+
+    def _drop(self, w):
+        if w not in self.workers:
+            return
+        self.workers.remove(w)
+        if w in self.idle:
+            self.idle.remove(w)
+        shard, w.shard = w.shard, None
+        if shard is not None:
+            self.totals["workers_lost"] += 1
+            if shard.run.active:
+                self._requeue(shard, f"{w.name} が切れた")
+        try:
+            w.sock.close()
+        except OSError:
+            pass
+        self._dispatch()
+
+    def _on_message(self, w, msg):
+        w.last_seen = time.time()
+        kind = msg.get("type")
+        shard = w.shard
+        if shard is None or msg.get("job") != shard.job:
+            return
+        if kind == "progress":
+            w.patterns = msg["patterns"]
+            return
+        if kind not in ("result", "cancelled", "error"):
+            return
+
+        w.shard = None
+        w.patterns = 0
+        self.idle.append(w)
+        if kind == "result":
+            w.done_shards += 1
+            shard.run.workers.add(w.name)
+            best = [(tuple(order), res) for (order, _), res in zip(
+                msg["best"], decode_results([res for _, res in msg["best"]])
+            )]
+            shard.run.events.put(("done", shard, (best, msg["patterns"], msg["trials"], msg["stats"])))
+        elif kind == "error":
+            shard.run.events.put(("error", shard, f"ワーカー {w.name} でエラー: {msg['message']}"))
+        self._dispatch()
+
+    # ---------------------
+    # スレッド
+    # ---------------------
+    def _accept(self):
+        while not self.closed:
+            try:
+                sock, addr = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock, addr), daemon=True).start()
+
+    def _serve(self, sock, addr):
+        messages = read_messages(sock)
+        try:
+            hello = next(messages, None)
+            if hello is None or hello.get("type") != "hello":
+                sock.close()
+                return
+            if hello.get("version") != ENGINE_VERSION:
+                send_message(sock, {"type": "reject", "message": f"版が違います（{ENGINE_VERSION} が必要）"})
+                sock.close()
+                return
+            if self.token is not None and hello.get("token") != self.token:
+                send_message(sock, {"type": "reject", "message": "token が違います"})
+                sock.close()
+                return
+        except (OSError, ValueError):
+            sock.close()
+            return
+
+        w = SimpleNamespace(
+            sock=sock, name=hello.get("name") or f"{addr[0]}:{addr[1]}",
+            shard=None, patterns=0, done_shards=0, last_seen=time.time(),
+        )
+        with self.lock:
+            self.workers.append(w)
+            if not self._send(w, {"type": "welcome"}):
+                self._drop(w)
+                return
+            self.idle.append(w)
+            self._dispatch()
+
+        try:
+            for msg in messages:
+                with self.lock:
+                    self._on_message(w, msg)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                self._drop(w)
+
+    def _monitor(self):
+        while not self.closed:
+            time.sleep(min(1.0, self.heartbeat_timeout / 4))
+            now = time.time()
+            with self.lock:
+                for w in self.workers:
+                    if w.shard is not None and now - w.last_seen > self.heartbeat_timeout:
+                        self._kill(w)
+
+# =========================================================
+# ワーカーの CLI
+#   python cluster.py HOST:PORT [--procs N] [--token TOKEN] [--name NAME]
+# =========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ぷよクエ盤面探索のワーカー（コーディネーターにつなぐ）")
+    parser.add_argument("address", help="コーディネーターの HOST:PORT")
+    parser.add_argument("--procs", type=int, default=os.cpu_count() or 1, help="起動するワーカープロセス数")
+    parser.add_argument("--token", default=None, help="コーディネーターと同じ合言葉")
+    parser.add_argument("--name", default=None, help="ワーカー名の頭（既定: ホスト名）")
+    args = parser.parse_args(argv)
+
+    try:
+        address = parse_address(args.address)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workers = start_workers(address, max(1, args.procs), args.token, args.name)
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# =========================================================
+# 列詰め版の盤面（盤面 = 8列ぶんの int のリスト）
+#   1列6マスを1つの int に詰める：行 r のマスは下から (ROWS-1-r) 番目の3ビット
+#   （最下段が下位ビット）。値は CODE_COLORS の添字（0 = 空）。
+#   落下（下詰め）とネクスト落下は列の値で表を引くだけにし、
+#   連鎖中は消えたマスのある列だけ直す。
+#   engine.py の field（6x8 の色名リスト）とは encode / decode で行き来できる。
+#   結果は engine.simulate_with_start_scoring と同じ。
+# =========================================================
+from engine import COLORS, COLS, DIR4, ROWS
+
+CELL_BITS = 3
+CELL_MASK = (1 << CELL_BITS) - 1
+
+CODE_COLORS = ["空"] + [color for color in COLORS if color != "空"]
+CODE = {color: i for i, color in enumerate(CODE_COLORS)}
+HEART = CODE["ハート"]
+
+# SHIFT[r]：行 r のマスの列内での位置
+SHIFT = [CELL_BITS * (ROWS - 1 - r) for r in range(ROWS)]
+
+# NEIGHBORS[i]：マス i = r*COLS + c の上下左右（盤内）
+NEIGHBORS = [
+    tuple(
+        (r + dr) * COLS + (c + dc)
+        for dr, dc in DIR4
+        if 0 <= r + dr < ROWS and 0 <= c + dc < COLS
+    )
+    for r in range(ROWS)
+    for c in range(COLS)
+]
+
+# =========================================================
+# 変換
+# =========================================================
+def encode(field):
+    cols = []
+    for c in range(COLS):
+        code = 0
+        for r in range(ROWS):
+            code |= CODE[field[r][c]] << SHIFT[r]
+        cols.append(code)
+    return cols
+
+
+def decode(cols):
+    return [
+        [CODE_COLORS[(cols[c] >> SHIFT[r]) & CELL_MASK] for c in range(COLS)]
+        for r in range(ROWS)
+    ]
+
+
+def cells(cols):
+    # マス i = r*COLS + c の色コードの平らなリスト
+    return [(cols[c] >> SHIFT[r]) & CELL_MASK for r in range(ROWS) for c in range(COLS)]
+
+# =========================================================
+# 列ごとの表（初めて出た列の値で埋め、以後は引くだけ）
+#   GRAVITY[code]  : 空きを詰めて下に寄せた列
+#   TOP_EMPTY[code]: 一番上の空きマスの位置（空きが無ければ -1）
+# =========================================================
+GRAVITY = {}
+TOP_EMPTY = {}
+
+
+def settle(code):
+    out = GRAVITY.get(code)
+    if out is None:
+        out = 0
+        k = 0
+        for h in range(ROWS):
+            v = (code >> (CELL_BITS * h)) & CELL_MASK
+            if v:
+                out |= v << (CELL_BITS * k)
+                k += 1
+        GRAVITY[code] = out
+    return out
+
+
+def top_empty(code):
+    sh = TOP_EMPTY.get(code)
+    if sh is None:
+        sh = -1
+        for r in range(ROWS):
+            if not (code >> SHIFT[r]) & CELL_MASK:
+                sh = SHIFT[r]
+                break
+        TOP_EMPTY[code] = sh
+    return sh
+
+# =========================================================
+# 消去1ステップ（消えたマスと消える前の色を返し、消えた列だけ下詰めする）
+# =========================================================
+def erase_step(cols):
+    cell = cells(cols)
+    seen = [False] * (ROWS * COLS)
+    erase = []
+
+    for i, v in enumerate(cell):
+        if seen[i] or not v or v == HEART:
+            continue
+        seen[i] = True
+        comp = [i]
+        j = 0
+        while j < len(comp):
+            for n in NEIGHBORS[comp[j]]:
+                if not seen[n] and cell[n] == v:
+                    seen[n] = True
+                    comp.append(n)
+            j += 1
+        if len(comp) >= 4:
+            erase += comp
+
+    if not erase:
+        return []
+
+    # ハート巻き込み
+    erased = set(erase)
+    for i, v in enumerate(cell):
+        if v == HEART and any(n in erased for n in NEIGHBORS[i]):
+            erase.append(i)
+
+    clear = [0] * COLS
+    for i in erase:
+        r, c = divmod(i, COLS)
+        clear[c] |= CELL_MASK << SHIFT[r]
+    for c in range(COLS):
+        if clear[c]:
+            cols[c] = settle(cols[c] & ~clear[c])
+
+    return [(i, cell[i]) for i in erase]
+
+# =========================================================
+# 起点消し→連鎖→得点（engine.prepare_start_trials / simulate_prepared と同じ形）
+#   prep = (dropped, settled)：ネクストを落とした列と、それを下詰めした列
+# =========================================================
+def prepare_start_trials(cols, nexts):
+    dropped = []
+    for code, color in zip(cols, nexts):
+        sh = top_empty(code)
+        dropped.append(code | (CODE[color] << sh) if sh >= 0 else code)
+    return dropped, [settle(code) for code in dropped]
+
+
+def simulate_prepared(prep, recolored_cells_set, start_pos):
+    dropped, settled = prep
+
+    sr, sc = start_pos
+    sh = SHIFT[sr]
+    if not (dropped[sc] >> sh) & CELL_MASK:
+        return 0, 0, 0, False
+
+    # 起点消し（得点0）→ 起点の列だけ落下
+    cols = list(settled)
+    cols[sc] = settle(dropped[sc] & ~(CELL_MASK << sh))
+
+    chains = 0
+    score = 0
+    maxsim = 0
+
+    while True:
+        erased = erase_step(cols)
+        if not erased:
+            break
+
+        chains += 1
+        maxsim = max(maxsim, len(erased))
+
+        # 得点：通常色のみ（起点・塗り替えの位置は0）
+        for i, v in erased:
+            if v == HEART:
+                continue
+            pos = divmod(i, COLS)
+            if pos == (sr, sc) or pos in recolored_cells_set:
+                continue
+            score += 1
+
+    return chains, score, maxsim, True
+
+
+def simulate_with_start_scoring(cols, nexts, recolored_cells_set, start_pos):
+    return simulate_prepared(prepare_start_trials(cols, nexts), recolored_cells_set, start_pos)
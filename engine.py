@@ -0,0 +1,438 @@
+# =========================================================
+# リスト版エンジン（盤面 = 6x8 の色名リスト）
+#   Streamlit に依存しない。探索の基準実装。
+# =========================================================
+
+# =========================================================
+# 基本設定
+# =========================================================
+ROWS = 6
+COLS = 8
+DIR4 = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+COLORS = ["赤", "青", "緑", "黄", "紫", "ハート", "空"]
+NORMAL_COLORS = ["赤", "青", "緑", "黄", "紫"]
+
+# =========================================================
+# 連結探索（指定色の連結サイズを数える）
+# =========================================================
+def count_component(field, sr, sc, color, blocked=None):
+    if blocked is None:
+        blocked = set()
+    if not (0 <= sr < ROWS and 0 <= sc < COLS):
+        return 0
+    if (sr, sc) in blocked:
+        return 0
+    if field[sr][sc] != color:
+        return 0
+
+    stack = [(sr, sc)]
+    seen = {(sr, sc)}
+    while stack:
+        r, c = stack.pop()
+        for dr, dc in DIR4:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < ROWS and 0 <= nc < COLS:
+                if (nr, nc) in blocked:
+                    continue
+                if (nr, nc) not in seen and field[nr][nc] == color:
+                    seen.add((nr, nc))
+                    stack.append((nr, nc))
+    return len(seen)
+
+# =========================================================
+# 連結成分の索引（通常色の塊ごとにラベルと大きさを持つ）
+#   最初に1回だけ全部の塊を数え、set_cell では変わるマスの塊と
+#   隣の同色の塊だけ付け直す（塗り替え・戻しのたびに全体を数え直さない）。
+#   「塗ると4つ以上になるか」「起点を消しても隣が4つ以上か」が引くだけで分かる。
+# =========================================================
+def is_normal(v):
+    return v not in ("空", "ハート")
+
+
+def in_board_neighbors(r, c):
+    for dr, dc in DIR4:
+        nr, nc = r + dr, c + dc
+        if 0 <= nr < ROWS and 0 <= nc < COLS:
+            yield nr, nc
+
+
+class ComponentIndex:
+    def __init__(self, field):
+        self.field = [row[:] for row in field]
+        self.label = [[-1] * COLS for _ in range(ROWS)]
+        self.members = {}   # ラベル → 塊のマス
+        self.next_label = 0
+        for r in range(ROWS):
+            for c in range(COLS):
+                if self.label[r][c] < 0 and is_normal(self.field[r][c]):
+                    self._flood(r, c)
+
+    def _flood(self, sr, sc):
+        color = self.field[sr][sc]
+        lab = self.next_label
+        self.next_label += 1
+        self.label[sr][sc] = lab
+        cells = [(sr, sc)]
+        i = 0
+        while i < len(cells):
+            r, c = cells[i]
+            i += 1
+            for nr, nc in in_board_neighbors(r, c):
+                if self.label[nr][nc] < 0 and self.field[nr][nc] == color:
+                    self.label[nr][nc] = lab
+                    cells.append((nr, nc))
+        self.members[lab] = cells
+
+    def size(self, r, c):
+        lab = self.label[r][c]
+        return len(self.members[lab]) if lab >= 0 else 0
+
+    # 付け直したマス（(r, c) の元の塊と、つながった隣の塊）を返す
+    def set_cell(self, r, c, color):
+        if self.field[r][c] == color:
+            return []
+        # 付け直すのは (r, c) の今の塊（分かれうる）と、隣の新しい色の塊（つながる）
+        cells = []
+        for tr, tc in [(r, c)] + [
+            (nr, nc) for nr, nc in in_board_neighbors(r, c) if self.field[nr][nc] == color
+        ]:
+            lab = self.label[tr][tc]
+            if lab >= 0 and lab in self.members:
+                cells += self.members.pop(lab)
+        for cr, cc in cells:
+            self.label[cr][cc] = -1
+
+        self.field[r][c] = color
+        if is_normal(color):
+            self._flood(r, c)
+        for cr, cc in cells:
+            if self.label[cr][cc] < 0 and is_normal(self.field[cr][cc]):
+                self._flood(cr, cc)
+        return cells
+
+    def erases_at(self, r, c):
+        return self.size(r, c) >= 4
+
+    # local_has_erase_after_recolor と同じ判定（塗り替え済みの索引で）
+    def has_erase_near(self, changed_cells):
+        focus = set()
+        for (r, c) in changed_cells:
+            focus.add((r, c))
+            focus.update(in_board_neighbors(r, c))
+
+        for (r, c) in focus:
+            if self.size(r, c) >= 4:
+                return True
+            if self.field[r][c] == "ハート":
+                for nr, nc in in_board_neighbors(r, c):
+                    if self.size(nr, nc) >= 4:
+                        return True
+        return False
+
+    # is_good_start_candidate と同じ判定
+    def is_good_start_candidate(self, pos):
+        r, c = pos
+        v = self.field[r][c]
+        if v == "空":
+            return False
+        for nr, nc in in_board_neighbors(r, c):
+            n = self.size(nr, nc)
+            if n < 4:
+                continue
+            if self.field[nr][nc] != v:
+                # 起点と別の色の塊は、起点を消しても変わらない
+                return True
+            # 同じ色の塊は起点を含む：消すと分かれうるので数え直す
+            if n >= 5 and count_component(self.field, nr, nc, v, blocked={pos}) >= 4:
+                return True
+        return False
+
+    def filter_start_candidates(self, positions):
+        return [pos for pos in positions if self.is_good_start_candidate(pos)]
+
+# =========================================================
+# 「盤面全体で消えるものがあるか」
+# =========================================================
+def has_any_erase_global(field):
+    visited = [[False] * COLS for _ in range(ROWS)]
+    erase = set()
+
+    for r in range(ROWS):
+        for c in range(COLS):
+            if visited[r][c]:
+                continue
+            v = field[r][c]
+            if v in ("空", "ハート"):
+                visited[r][c] = True
+                continue
+
+            stack = [(r, c)]
+            visited[r][c] = True
+            comp = [(r, c)]
+            while stack:
+                cr, cc = stack.pop()
+                for dr, dc in DIR4:
+                    nr, nc = cr + dr, cc + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS:
+                        if not visited[nr][nc] and field[nr][nc] == v:
+                            visited[nr][nc] = True
+                            stack.append((nr, nc))
+                            comp.append((nr, nc))
+
+            if len(comp) >= 4:
+                erase |= set(comp)
+
+    if not erase:
+        return False
+
+    # ハート巻き込み
+    for r in range(ROWS):
+        for c in range(COLS):
+            if field[r][c] == "ハート":
+                for dr, dc in DIR4:
+                    nr, nc = r + dr, c + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS:
+                        if (nr, nc) in erase:
+                            return True
+    return True
+
+# =========================================================
+# 「塗り替え直後に消える」判定を局所だけで行う（高速）
+# =========================================================
+def local_has_erase_after_recolor(field, changed_cells):
+    focus = set()
+    for (r, c) in changed_cells:
+        focus.add((r, c))
+        for dr, dc in DIR4:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < ROWS and 0 <= nc < COLS:
+                focus.add((nr, nc))
+
+    checked = set()
+    for (r, c) in focus:
+        v = field[r][c]
+        if v in ("空", "ハート"):
+            continue
+        if (r, c, v) in checked:
+            continue
+        size = count_component(field, r, c, v)
+        if size >= 4:
+            return True
+        checked.add((r, c, v))
+
+    # ハート巻き込み（念のため）
+    for (r, c) in focus:
+        if field[r][c] != "ハート":
+            continue
+        for dr, dc in DIR4:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < ROWS and 0 <= nc < COLS:
+                v = field[nr][nc]
+                if v in ("空", "ハート"):
+                    continue
+                if count_component(field, nr, nc, v) >= 4:
+                    return True
+    return False
+
+# =========================================================
+# 消去1ステップ（消える前の色も返す）
+# =========================================================
+def erase_step_with_colors(field):
+    visited = [[False] * COLS for _ in range(ROWS)]
+    erase = set()
+
+    for r in range(ROWS):
+        for c in range(COLS):
+            if visited[r][c]:
+                continue
+            v = field[r][c]
+            if v in ("空", "ハート"):
+                visited[r][c] = True
+                continue
+
+            stack = [(r, c)]
+            visited[r][c] = True
+            comp = [(r, c)]
+            while stack:
+                cr, cc = stack.pop()
+                for dr, dc in DIR4:
+                    nr, nc = cr + dr, cc + dc
+                    if 0 <= nr < ROWS and 0 <= nc < COLS:
+                        if not visited[nr][nc] and field[nr][nc] == v:
+                            visited[nr][nc] = True
+                            stack.append((nr, nc))
+                            comp.append((nr, nc))
+
+            if len(comp) >= 4:
+                erase |= set(comp)
+
+    # ハート巻き込み
+    if erase:
+        heart_add = set()
+        for r in range(ROWS):
+            for c in range(COLS):
+                if field[r][c] == "ハート":
+                    for dr, dc in DIR4:
+                        nr, nc = r + dr, c + dc
+                        if 0 <= nr < ROWS and 0 <= nc < COLS:
+                            if (nr, nc) in erase:
+                                heart_add.add((r, c))
+        erase |= heart_add
+
+    if not erase:
+        return set(), {}, False
+
+    before = {(r, c): field[r][c] for (r, c) in erase}
+
+    for (r, c) in erase:
+        field[r][c] = "空"
+
+    # 落下
+    for c in range(COLS):
+        settle_column(field, c)
+
+    return erase, before, True
+
+# =========================================================
+# 起点消し→連鎖→得点
+#   ネクスト落下と下詰めは起点によらないので、同じ盤面で起点だけ変える時は
+#   prepare_start_trials を1回呼んで simulate_prepared を起点ごとに呼ぶ。
+# =========================================================
+def settle_column(f, c):
+    stack = []
+    for r in range(ROWS - 1, -1, -1):
+        if f[r][c] != "空":
+            stack.append(f[r][c])
+    idx = 0
+    for r in range(ROWS - 1, -1, -1):
+        if idx < len(stack):
+            f[r][c] = stack[idx]
+            idx += 1
+        else:
+            f[r][c] = "空"
+
+
+def prepare_start_trials(field, nexts):
+    dropped = [row[:] for row in field]
+
+    # ネクスト落下
+    for c, color in enumerate(nexts):
+        for r in range(ROWS):
+            if dropped[r][c] == "空":
+                dropped[r][c] = color
+                break
+
+    # 起点の列以外は、起点消し後の落下と同じ
+    settled = [row[:] for row in dropped]
+    for c in range(COLS):
+        settle_column(settled, c)
+    return dropped, settled
+
+
+def simulate_prepared(prep, recolored_cells_set, start_pos):
+    dropped, settled = prep
+
+    sr, sc = start_pos
+    if dropped[sr][sc] == "空":
+        return 0, 0, 0, False
+
+    # 起点消し（得点0）→ 起点の列だけ落下
+    f = [row[:] for row in settled]
+    for r in range(ROWS):
+        f[r][sc] = dropped[r][sc]
+    f[sr][sc] = "空"
+    settle_column(f, sc)
+
+    chains = 0
+    score = 0
+    maxsim = 0
+
+    while True:
+        erased_set, before_colors, ok = erase_step_with_colors(f)
+        if not ok:
+            break
+
+        chains += 1
+        maxsim = max(maxsim, len(erased_set))
+
+        # 得点：通常色のみ
+        for (r, c) in erased_set:
+            col = before_colors[(r, c)]
+            if col == "ハート":
+                continue
+            if (r, c) == (sr, sc):
+                continue
+            if (r, c) in recolored_cells_set:
+                continue
+            score += 1
+
+    return chains, score, maxsim, True
+
+
+def simulate_with_start_scoring(field, nexts, recolored_cells_set, start_pos):
+    return simulate_prepared(prepare_start_trials(field, nexts), recolored_cells_set, start_pos)
+
+# =========================================================
+# 起点候補の絞り込み（高速）
+# =========================================================
+def is_good_start_candidate(field, pos):
+    r, c = pos
+    if field[r][c] == "空":
+        return False
+
+    blocked = {pos}
+    for dr, dc in DIR4:
+        nr, nc = r + dr, c + dc
+        if 0 <= nr < ROWS and 0 <= nc < COLS:
+            v = field[nr][nc]
+            if v in ("空", "ハート"):
+                continue
+            if count_component(field, nr, nc, v, blocked=blocked) >= 4:
+                return True
+    return False
+
+def compute_start_candidates(field):
+    index = ComponentIndex(field)
+    cands = []
+    for r in range(ROWS):
+        for c in range(COLS):
+            if index.is_good_start_candidate((r, c)):
+                cands.append((r, c))
+    return cands
+
+# =========================================================
+# 塗り替え候補の列挙（単発で即消えるマスを除外）
+# =========================================================
+def compute_recolor_candidates(base_field, paint_color):
+    index = ComponentIndex(base_field)
+    cands = []
+    for r in range(ROWS):
+        for c in range(COLS):
+            v = base_field[r][c]
+            if v == "空":
+                continue
+            if v == paint_color:
+                continue
+
+            # 1マス塗って判定し、元に戻す
+            index.set_cell(r, c, paint_color)
+            erased = index.has_erase_near({(r, c)})
+            index.set_cell(r, c, v)
+            if erased:
+                continue
+
+            cands.append((r, c))
+    return cands
+
+# =========================================================
+# 探索用の小物
+# =========================================================
+def copy_field(field):
+    return [row[:] for row in field]
+
+def erases_at(field, r, c):
+    v = field[r][c]
+    if v in ("空", "ハート"):
+        return False
+    return count_component(field, r, c, v) >= 4
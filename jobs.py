@@ -0,0 +1,77 @@
+# =========================================================
+# バックグラウンド探索（Streamlit のセッションごとに1つ）
+#   run_search（全色スイープなら search=run_sweep）を別スレッドで走らせ、
+#   画面は進捗・途中の上位を読みに来るだけにする。
+#   サーバー全体の同時探索数は MAX_CONCURRENT_SEARCHES まで（超えた分は待機）。
+#   上限は環境変数 PUYO_MAX_SEARCHES で変えられる。
+# =========================================================
+import os
+import threading
+import time
+
+from search import run_search
+
+MAX_CONCURRENT_SEARCHES = max(1, int(os.environ.get("PUYO_MAX_SEARCHES", "2")))
+
+# モジュールはサーバープロセスで1回だけ読まれるので、全セッション共通になる
+_search_slots = threading.BoundedSemaphore(MAX_CONCURRENT_SEARCHES)
+
+# 待機中に中断を確かめる間隔（秒）
+QUEUE_POLL = 0.2
+
+
+class SearchJob:
+    # status: queued（空き待ち）/ running / done / cancelled / error
+    def __init__(self, *args, search=run_search, **kwargs):
+        self.search = search
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.status = "queued"
+        self.progress = None   # on_progress の引数そのまま
+        self.best = []         # 途中の上位
+        self.results = None
+        self.info = None
+        self.error = None
+        self.submitted = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "cancelled", "error")
+
+    def _on_progress(self, *progress):
+        self.progress = progress
+
+    def _on_best(self, best):
+        self.best = best
+
+    def _run(self):
+        while not _search_slots.acquire(timeout=QUEUE_POLL):
+            if self.cancel_event.is_set():
+                self.results = []
+                self.info = {
+                    "cancelled": True, "reason": "開始前に中断しました",
+                    "recolor_candidates": None, "start_candidates": None,
+                }
+                self.status = "cancelled"
+                return
+        try:
+            self.status = "running"
+            self.results, self.info = self.search(
+                *self.args, on_progress=self._on_progress, on_best=self._on_best,
+                cancel=self.cancel_event, **self.kwargs,
+            )
+            self.status = "cancelled" if self.info.get("cancelled") else "done"
+        except Exception as e:
+            self.error = e
+            self.status = "error"
+        finally:
+            _search_slots.release()
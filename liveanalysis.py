@@ -0,0 +1,121 @@
+# =========================================================
+# 編集中の盤面の下調べ（盤面エディタの「その場で解析」欄）
+#   即消え（has_any_erase_global）・塗る色ごとの塗り替え候補・起点候補を、
+#   盤面確定を待たずにマスを塗るたびに出す。
+#   1マス変わったときは ComponentIndex をそのマスだけ付け直し、
+#   候補かどうかは付け直した塊から2マス以内のマスだけ判定し直す
+#   （どちらの判定も、そのマスから2マス以内に触れる塊だけで決まる）。
+#   クリア・全塗り・読込のように多くのマスが一度に変わったときは作り直す。
+#   即消えの盤面は探索しないので候補は数えず、消えなくなったときにまとめて数え直す。
+#   数え方は compute_recolor_candidates / compute_start_candidates と同じ。
+# =========================================================
+from boardcode import decode_board
+from engine import COLORS, COLS, ROWS, ComponentIndex, in_board_neighbors
+
+# 一度に変わったマスがこれより多ければ作り直す
+REBUILD_CELLS = 8
+
+# NEAR2[(r, c)]：(r, c) から上下左右に2歩以内のマス（自分を含む）
+NEAR2 = {
+    (r, c): [
+        (nr, nc)
+        for nr in range(ROWS)
+        for nc in range(COLS)
+        if abs(nr - r) + abs(nc - c) <= 2
+    ]
+    for r in range(ROWS)
+    for c in range(COLS)
+}
+
+ALL_CELLS = [(r, c) for r in range(ROWS) for c in range(COLS)]
+
+
+class LiveAnalysis:
+    # data は boardcode の 48 バイト表現
+    def __init__(self, data, paint_colors):
+        self.paint_colors = list(paint_colors)
+        self._build(data)
+
+    def _build(self, data):
+        self.data = data
+        self.index = ComponentIndex(decode_board(data))
+        # 4つ以上の塊の数（1つでもあれば確定盤面の時点で消える）
+        self.big = sum(1 for cells in self.index.members.values() if len(cells) >= 4)
+        self.start = set()
+        self.recolor = {color: set() for color in self.paint_colors}
+        self.stale = True
+        self._refresh(ALL_CELLS)
+
+    @property
+    def erase(self):
+        return self.big > 0
+
+    # 即消えの盤面では None（prepare_search の info と同じ）
+    def start_count(self):
+        return None if self.erase else len(self.start)
+
+    def recolor_count(self, paint_color):
+        return None if self.erase else len(self.recolor[paint_color])
+
+    def update(self, data):
+        changed = [i for i, (a, b) in enumerate(zip(self.data, data)) if a != b]
+        if not changed:
+            return
+        if len(changed) > REBUILD_CELLS:
+            self._build(data)
+            return
+
+        dirty = set()
+        for i in changed:
+            r, c = divmod(i, COLS)
+            for pos in self._set_cell(r, c, COLORS[data[i]]):
+                dirty.update(NEAR2[pos])
+        self.data = data
+        self._refresh(dirty)
+
+    def _labels_near(self, r, c):
+        label = self.index.label
+        labs = {label[r][c]}
+        labs.update(label[nr][nc] for nr, nc in in_board_neighbors(r, c))
+        labs.discard(-1)
+        return labs
+
+    def _count_big(self, labs):
+        members = self.index.members
+        return sum(1 for lab in labs if len(members[lab]) >= 4)
+
+    # 付け直した塊はどれも (r, c) か隣のマスを含むので、4つ以上の塊の数はそこだけ数え直す
+    def _set_cell(self, r, c, color):
+        self.big -= self._count_big(self._labels_near(r, c))
+        relabeled = self.index.set_cell(r, c, color)
+        self.big += self._count_big(self._labels_near(r, c))
+        return relabeled + [(r, c)]
+
+    def _refresh(self, cells):
+        if self.erase:
+            self.stale = True
+            return
+        if self.stale:
+            cells = ALL_CELLS
+            self.stale = False
+
+        index = self.index
+        for pos in cells:
+            if index.is_good_start_candidate(pos):
+                self.start.add(pos)
+            else:
+                self.start.discard(pos)
+
+            r, c = pos
+            v = index.field[r][c]
+            for color in self.paint_colors:
+                ok = False
+                if v != "空" and v != color:
+                    # 1マス塗って判定し、元に戻す
+                    index.set_cell(r, c, color)
+                    ok = not index.has_erase_near({pos})
+                    index.set_cell(r, c, v)
+                if ok:
+                    self.recolor[color].add(pos)
+                else:
+                    self.recolor[color].discard(pos)
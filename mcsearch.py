@@ -0,0 +1,314 @@
+# =========================================================
+# ネクストが分からないときの期待値探索（モンテカルロ）
+#   nexts のうち None の列は「未知」とし、NORMAL_COLORS から一様に引いた
+#   ネクスト列を samples 通り作って、塗り替え組み合わせ×起点ごとに
+#   平均得点・得点の分散・連鎖が起きる確率 を出す。
+#   上位は 平均得点 → 連鎖確率 → 分散の小ささ の順（同点は run_search と同じく先に出た方）。
+#
+#   サンプルを1つずつシミュレーションし直さない：
+#   ・同じネクスト列は1つにまとめて回数で重みをつける
+#   ・塗り替え後の盤面（colboard の列）と既知の列のネクスト落下は組み合わせごとに1回
+#   ・起点ごとに、未知のネクストを「どの色ともつながらない印（WILD）」にした盤面で
+#     1回だけ連鎖を進め、各段で印の隣にある塊を覚える。
+#     印に入る色がどの段でも4個以上の塊を作らないサンプルは、印が消えずに
+#     落ちるだけなので結果はこの1回と同じ → まとめて足し込む。
+#     4個以上になりうるサンプルだけ、ネクスト列ごとに（起点をまたいで落下済みの列を
+#     使い回して）シミュレーションする。
+#   盤面・塗り替え候補・起点候補の決め方は run_search と同じ（列挙も同じ順）。
+# =========================================================
+from collections import Counter
+import random
+import time
+
+import colboard
+from colboard import CELL_MASK, CODE, HEART, NEIGHBORS, SHIFT
+from engine import COLS, NORMAL_COLORS, ROWS
+from search import (
+    ENGINES,
+    TOP_N,
+    SearchCancelled,
+    analyze_base,
+    combination_starts,
+    finish_search,
+    iter_recolor_combinations,
+    prepare_search,
+    TopK,
+)
+
+MC_SAMPLES = 200   # 既定のサンプル数
+
+# 未知のネクストの印（空・通常色・ハートのどれでもない色コード）
+WILD = CELL_MASK
+assert len(colboard.CODE_COLORS) <= WILD
+
+# 大きいほど上：平均得点・連鎖確率が大きく、分散が小さい
+def mc_key(res):
+    return (res["mean_score"], res["chain_prob"], -res["score_var"])
+
+# =========================================================
+# ネクスト列のサンプル
+#   戻り値: (未知の列の番号, [(未知の列に入る色コードの tuple, 回数), ...])
+#   並びは初めて引いた順（seed が同じなら同じ）
+# =========================================================
+def sample_nexts(nexts, samples, seed=0, colors=NORMAL_COLORS):
+    rng = random.Random(seed)
+    unknown = [c for c, color in enumerate(nexts) if color is None]
+    codes = [CODE[color] for color in colors]
+    draws = Counter(tuple(rng.choice(codes) for _ in unknown) for _ in range(samples))
+    return unknown, list(draws.items())
+
+# =========================================================
+# 印つきの連鎖（colboard.simulate_prepared と同じ流れ）
+#   印に色 x が入ると、印と隣の x の塊がつながる。つながった大きさが4未満で、
+#   ほかの印と同じ塊にならなければ、その段で消えるマスは印のままと同じ。
+#   forbidden[i]: 未知の列 unknown[i] の印に入ると、どこかの段で4個以上になる色コード
+#   pairs       : (i, j, x) 印 i と j に同じ色が入ると（x があれば色 x のとき）
+#                 つながるかもしれない組（横に隣り合う／同じ塊に触れる）
+# =========================================================
+def erase_step_wild(cols, col_index, forbidden, pairs):
+    cell = colboard.cells(cols)
+
+    # 通常色の塊（label[i] は塊の先頭マス、size はその大きさ）
+    label = [-1] * (ROWS * COLS)
+    size = {}
+    erase = []
+
+    for i, v in enumerate(cell):
+        if label[i] >= 0 or not v or v == HEART or v == WILD:
+            continue
+        label[i] = i
+        comp = [i]
+        j = 0
+        while j < len(comp):
+            for n in NEIGHBORS[comp[j]]:
+                if label[n] < 0 and cell[n] == v:
+                    label[n] = i
+                    comp.append(n)
+            j += 1
+        size[i] = len(comp)
+        if len(comp) >= 4:
+            erase += comp
+
+    # 印の隣を調べる（この段の消去前の盤面で）
+    touched = {}
+    for c, i in col_index.items():
+        code = cols[c]
+        for r in range(ROWS):
+            if (code >> SHIFT[r]) & CELL_MASK == WILD:
+                near = {}
+                for n in NEIGHBORS[r * COLS + c]:
+                    if cell[n] == WILD:
+                        j = col_index[n % COLS]
+                        pairs.add((min(i, j), max(i, j), None))
+                    elif label[n] >= 0:
+                        near.setdefault(cell[n], set()).add(label[n])
+                for v, labs in near.items():
+                    if 1 + sum(size[lab] for lab in labs) >= 4:
+                        forbidden[i].add(v)
+                    for lab in labs:
+                        for j in touched.setdefault(lab, []):
+                            pairs.add((j, i, v))
+                        touched[lab].append(i)
+                break
+
+    if not erase:
+        return []
+
+    # ハート巻き込み
+    erased = set(erase)
+    for i, v in enumerate(cell):
+        if v == HEART and any(n in erased for n in NEIGHBORS[i]):
+            erase.append(i)
+
+    clear = [0] * COLS
+    for i in erase:
+        r, c = divmod(i, COLS)
+        clear[c] |= CELL_MASK << SHIFT[r]
+    for c in range(COLS):
+        if clear[c]:
+            cols[c] = colboard.settle(cols[c] & ~clear[c])
+
+    return [(i, cell[i]) for i in erase]
+
+
+def simulate_wild(prep, recolored_cells_set, start_pos, col_index):
+    dropped, settled = prep
+    forbidden = {i: set() for i in col_index.values()}
+    pairs = set()
+
+    sr, sc = start_pos
+    sh = SHIFT[sr]
+    if not (dropped[sc] >> sh) & CELL_MASK:
+        return (0, 0, 0, False), forbidden, pairs
+
+    cols = list(settled)
+    cols[sc] = colboard.settle(dropped[sc] & ~(CELL_MASK << sh))
+
+    chains = 0
+    score = 0
+    maxsim = 0
+
+    while True:
+        erased = erase_step_wild(cols, col_index, forbidden, pairs)
+        if not erased:
+            break
+
+        chains += 1
+        maxsim = max(maxsim, len(erased))
+
+        for i, v in erased:
+            if v == HEART:
+                continue
+            pos = divmod(i, COLS)
+            if pos == (sr, sc) or pos in recolored_cells_set:
+                continue
+            score += 1
+
+    return (chains, score, maxsim, True), forbidden, pairs
+
+# =========================================================
+# 1組み合わせの評価（起点候補ごとに全サンプル）
+#   cols は塗り替え済みの盤面（colboard の列）、next_codes は既知の列の色コード
+#   （未知の列は WILD）。stats["mc"] に共有できた回数などを足す。
+#   戻り値: その組み合わせの最良（連鎖確率 0 の起点は除く。無ければ None）
+# =========================================================
+def drop_code(code, color_code):
+    sh = colboard.top_empty(code)
+    return code | (color_code << sh) if sh >= 0 else code
+
+
+def evaluate_samples(cols, next_codes, unknown, draws, samples, recolored, starts, stats):
+    dropped = [drop_code(code, v) for code, v in zip(cols, next_codes)]
+    wild_prep = (dropped, [colboard.settle(code) for code in dropped])
+    # 印が落ちた列だけ見張る（列が埋まっていてネクストが落ちない列は色によらない）
+    col_index = {c: i for i, c in enumerate(unknown) if dropped[c] != cols[c]}
+
+    preps = {}
+
+    def prep_for(draw):
+        prep = preps.get(draw)
+        if prep is None:
+            d = list(dropped)
+            s = list(wild_prep[1])
+            for c, v in zip(unknown, draw):
+                d[c] = drop_code(cols[c], v)
+                s[c] = colboard.settle(d[c])
+            prep = preps[draw] = (d, s)
+        return prep
+
+    mc = stats["mc"]
+    best = None
+
+    for sp in starts:
+        wild, forbidden, pairs = simulate_wild(wild_prep, recolored, sp, col_index)
+        mc["wild_sims"] += 1
+        if not wild[3]:
+            continue
+
+        s1 = s2 = chain_w = c1 = 0
+        for draw, w in draws:
+            hit = any(draw[i] in forbidden[i] for i in col_index.values()) or any(
+                draw[i] == draw[j] and x in (None, draw[i]) for i, j, x in pairs
+            )
+            if hit:
+                chains, score, _, _ = colboard.simulate_prepared(prep_for(draw), recolored, sp)
+                mc["full_sims"] += 1
+            else:
+                chains, score = wild[0], wild[1]
+                mc["shared_draws"] += 1
+            s1 += w * score
+            s2 += w * score * score
+            c1 += w * chains
+            if chains >= 1:
+                chain_w += w
+
+        if not chain_w:
+            continue
+        cand = {
+            "mean_score": s1 / samples,
+            "score_var": (samples * s2 - s1 * s1) / (samples * samples),
+            "chain_prob": chain_w / samples,
+            "mean_chains": c1 / samples,
+            "recolor": tuple(sorted(recolored)),
+            "start": sp,
+        }
+        if best is None or mc_key(cand) > mc_key(best):
+            best = cand
+
+    return best
+
+# =========================================================
+# 探索本体（直列）
+#   引数・on_progress / on_best / cancel は run_search と同じ。
+#   samples 通りのネクスト列を seed で引く（nexts に None が無ければ1通り）。
+#   info["mc"] = {"samples", "distinct", "wild_sims", "full_sims", "shared_draws"}
+#   （shared_draws は印つきの1回で済んだ サンプル×起点 の数）
+# =========================================================
+def run_mc_search(base_field, nexts, paint_color, paint_count, min_k, samples=MC_SAMPLES, seed=0,
+                  on_progress=None, on_best=None, cancel=None, base=None, top_k=TOP_N):
+    if samples < 1:
+        raise ValueError("samples は 1 以上にしてください")
+    if base is None:
+        base = analyze_base(base_field)
+
+    t0 = time.time()
+    # 影響範囲の絞り込みは既知のネクストが前提なので使わない
+    plan = prepare_search(
+        base_field, nexts, paint_color, paint_count, min_k, base,
+        "column", 1, 0, False, None, top_k, t0, prune=False,
+    )
+    ctx = plan.ctx
+    info = plan.info
+    if ctx is None:
+        return [], info
+
+    unknown, draws = sample_nexts(nexts, samples, seed)
+    next_codes = [WILD if color is None else CODE[color] for color in nexts]
+    stats = {"mc": {
+        "samples": samples, "distinct": len(draws),
+        "wild_sims": 0, "full_sims": 0, "shared_draws": 0,
+    }}
+
+    eng = ENGINES["column"]
+    field = eng.encode(ctx.base_field)
+    top = TopK(top_k, key=mc_key)
+    seen_version = 0
+    done_patterns = 0
+    done_trials = 0
+    last_update = 0.0
+
+    try:
+        for k, lo, hi in plan.shards:
+            for combi, rank, skipped in iter_recolor_combinations(
+                eng, field, ctx.base_field, ctx.recolor_cands, k, paint_color, lo, hi
+            ):
+                done_patterns += skipped
+                if combi is not None:
+                    changed = set(combi)
+                    starts = combination_starts(eng, ctx, field, changed)
+                    if starts:
+                        best_local = evaluate_samples(
+                            colboard.encode(field.field), next_codes, unknown, draws, samples,
+                            changed, starts, stats,
+                        )
+                        if best_local is not None:
+                            top.push((k, rank), best_local)
+                    done_patterns += 1
+                    done_trials += len(starts)
+
+                if top.version != seen_version:
+                    seen_version = top.version
+                    if on_best is not None:
+                        on_best([res for _, res in top.best()])
+                if cancel is not None and cancel.is_set():
+                    raise SearchCancelled
+                now = time.time()
+                if on_progress is not None and now - last_update >= 0.5:
+                    on_progress(done_patterns, plan.total_patterns, done_trials,
+                                plan.est_total_trials, now - t0)
+                    last_update = now
+    except SearchCancelled:
+        info["cancelled"] = True
+
+    results = finish_search(plan, top.best(), stats, done_patterns, done_trials, t0)
+    return results, info
@@ -0,0 +1,170 @@
+# =========================================================
+# NumPy 版まとめシミュレーション（盤面 = (B, 6, 8) の uint8）
+#   B 枚の盤面について、ネクスト落下 → 起点消し → 下詰め → 連鎖（4個以上消去、
+#   ハート巻き込み、下詰め）→ 得点 を配列演算でいっぺんに進める。
+#   結果は engine.simulate_with_start_scoring を B 回呼んだのと同じ。
+#   色コード: 0=空, 1～5=通常色（bitboard.COLOR_ORDER 順）, 6=ハート
+# =========================================================
+import numpy as np
+
+import bitboard
+from engine import COLS, ROWS
+
+CODES = {"空": 0}
+CODES.update({color: i + 1 for i, color in enumerate(bitboard.COLOR_ORDER)})
+HEART = CODES["ハート"]
+
+CELLS = ROWS * COLS
+
+# ビットボードのビット位置（bitboard.BIT と同じ並び）
+SHIFT = np.array(
+    [[bitboard.BIT[r][c].bit_length() - 1 for c in range(COLS)] for r in range(ROWS)],
+    dtype=np.uint64,
+)
+
+# =========================================================
+# 変換
+# =========================================================
+def encode_fields(fields):
+    # 色名の 6x8 リストの列 → (B, 6, 8)
+    return np.array([[[CODES[v] for v in row] for row in f] for f in fields], dtype=np.uint8)
+
+
+def encode_colors(colors):
+    return np.array([CODES[c] for c in colors], dtype=np.uint8)
+
+
+def mask_to_array(mask):
+    return ((np.uint64(mask) >> SHIFT) & np.uint64(1)).astype(bool)
+
+
+def from_bitboard(board):
+    out = np.zeros((ROWS, COLS), dtype=np.uint8)
+    for i, m in enumerate(board):
+        if m:
+            out[mask_to_array(m)] = i + 1
+    return out
+
+# =========================================================
+# 盤面操作（どれも B 枚まとめて）
+# =========================================================
+def settle(boards):
+    # 各列で空でないマスを下に詰める（並びは保つ）
+    order = np.argsort(boards != 0, axis=1, kind="stable")
+    return np.take_along_axis(boards, order, axis=1)
+
+
+def drop_nexts(boards, nexts):
+    # 各列の一番上の空きマスにネクストを置く（元の実装と同じく上から探す）
+    empty = boards == 0
+    top = empty.argmax(axis=1)
+    b, c = np.nonzero(empty.any(axis=1))
+    boards[b, top[b, c], c] = nexts[b, c]
+
+
+def near(mask):
+    # 上下左右どれかが mask のマス
+    out = np.zeros_like(mask)
+    out[:, 1:, :] |= mask[:, :-1, :]
+    out[:, :-1, :] |= mask[:, 1:, :]
+    out[:, :, 1:] |= mask[:, :, :-1]
+    out[:, :, :-1] |= mask[:, :, 1:]
+    return out
+
+
+def component_sizes(boards, normal):
+    # 通常色の連結成分の大きさ（ラベルを隣の同色マスの最小値で広げて求める）
+    same_v = normal[:, 1:, :] & (boards[:, 1:, :] == boards[:, :-1, :])
+    same_h = normal[:, :, 1:] & (boards[:, :, 1:] == boards[:, :, :-1])
+
+    labels = np.where(normal, np.arange(CELLS).reshape(ROWS, COLS), CELLS)
+    while True:
+        m = labels.copy()
+        np.minimum(m[:, 1:, :], np.where(same_v, labels[:, :-1, :], CELLS), out=m[:, 1:, :])
+        np.minimum(m[:, :-1, :], np.where(same_v, labels[:, 1:, :], CELLS), out=m[:, :-1, :])
+        np.minimum(m[:, :, 1:], np.where(same_h, labels[:, :, :-1], CELLS), out=m[:, :, 1:])
+        np.minimum(m[:, :, :-1], np.where(same_h, labels[:, :, 1:], CELLS), out=m[:, :, :-1])
+        if np.array_equal(m, labels):
+            break
+        labels = m
+
+    B = boards.shape[0]
+    keys = labels.reshape(B, -1) + (np.arange(B) * (CELLS + 1))[:, None]
+    counts = np.bincount(keys.ravel(), minlength=B * (CELLS + 1))
+    return counts[keys].reshape(boards.shape)
+
+
+def erase_mask(boards):
+    normal = (boards != 0) & (boards != HEART)
+    erase = normal & (component_sizes(boards, normal) >= 4)
+    # ハート巻き込み
+    erase |= (boards == HEART) & near(erase)
+    return erase, normal
+
+# =========================================================
+# 起点消し→連鎖→得点（B 枚まとめて）
+#   boards   : (B, 6, 8) uint8（書き換えない）
+#   nexts    : (8,) か (B, 8) の色コード
+#   starts   : (B, 2) 起点の (r, c)
+#   recolored: (6, 8) か (B, 6, 8) の bool。塗り替えたマス（得点0）
+#   戻り値   : chains, score, maxsim, ok（どれも (B,) の配列）
+# =========================================================
+def simulate_batch(boards, nexts, starts, recolored=None):
+    boards = np.array(boards, dtype=np.uint8)
+    B = boards.shape[0]
+    nexts = np.broadcast_to(np.asarray(nexts, dtype=np.uint8), (B, COLS))
+    starts = np.asarray(starts, dtype=np.intp).reshape(B, 2)
+
+    excl = np.zeros((B, ROWS, COLS), dtype=bool)
+    if recolored is not None:
+        excl |= recolored
+
+    chains = np.zeros(B, dtype=np.int64)
+    score = np.zeros(B, dtype=np.int64)
+    maxsim = np.zeros(B, dtype=np.int64)
+
+    drop_nexts(boards, nexts)
+
+    ar = np.arange(B)
+    sr, sc = starts[:, 0], starts[:, 1]
+    ok = boards[ar, sr, sc] != 0
+
+    # 起点消し（得点0）
+    boards[ar, sr, sc] = 0
+    excl[ar, sr, sc] = True
+
+    live = ar[ok]
+    cur = settle(boards[live])
+    excl = excl[live]
+
+    while live.size:
+        erase, normal = erase_mask(cur)
+        n = erase.sum(axis=(1, 2))
+        hit = n > 0
+        if not hit.all():
+            live, cur, excl, erase, normal, n = (
+                live[hit], cur[hit], excl[hit], erase[hit], normal[hit], n[hit]
+            )
+            if not live.size:
+                break
+
+        chains[live] += 1
+        maxsim[live] = np.maximum(maxsim[live], n)
+        # 得点：通常色のみ（起点・塗り替えの位置は0）
+        score[live] += (erase & normal & ~excl).sum(axis=(1, 2))
+
+        cur = settle(np.where(erase, 0, cur).astype(np.uint8))
+
+    return chains, score, maxsim, ok
+
+# =========================================================
+# 探索用（numpy エンジン）：1つの盤面で起点だけ違う試行をまとめて
+#   bitboard の盤面を受け取り、(chains, score, maxsim, ok) のリストを返す。
+# =========================================================
+def simulate_starts(board, nexts, recolored_mask, starts):
+    if not starts:
+        return []
+    base = from_bitboard(board)
+    boards = np.repeat(base[None], len(starts), axis=0)
+    res = simulate_batch(boards, encode_colors(nexts), starts, mask_to_array(recolored_mask))
+    return list(zip(*(a.tolist() for a in res)))
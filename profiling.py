@@ -0,0 +1,99 @@
+# =========================================================
+# 計測（run_search の profile=True 用）
+#   エンジンの関数を包んで、工程ごとの呼び出し回数と累積時間を数える。
+#   集計は "工程.calls" / "工程.seconds" などの平らな dict で持ち、
+#   並列時はワーカーごとの値を足し合わせてから profile_summary で整える。
+# =========================================================
+from types import SimpleNamespace
+import time
+
+# 工程名 → 包むエンジン関数
+PHASES = {
+    "recolor_check": ["erases_at"],
+    "start_expansion": ["filter_start_candidates"],
+    "drop_nexts": ["prepare_start_trials"],
+    "simulate": [
+        "simulate_with_start_scoring", "simulate_prepared", "simulate_with_tt",
+        "simulate_starts", "simulate_start_classes",
+    ],
+}
+
+
+def new_counters():
+    counters = {}
+    for phase in list(PHASES) + ["total"]:
+        counters[f"{phase}.calls"] = 0
+        counters[f"{phase}.seconds"] = 0.0
+    for name in ("combinations", "recolor_rejected", "start_candidates",
+                 "chain_sims", "chain_steps"):
+        counters[name] = 0
+    return counters
+
+
+def timed(fn, counters, phase):
+    calls = f"{phase}.calls"
+    seconds = f"{phase}.seconds"
+
+    def wrapper(*args):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        counters[seconds] += time.perf_counter() - t0
+        counters[calls] += 1
+        return out
+    return wrapper
+
+
+# 起点をまとめて受ける関数：結果のリストの取り出し方
+BATCH_RESULTS = {
+    "simulate_starts": lambda out: out,
+    "simulate_start_classes": lambda out: out[0],
+}
+
+
+def timed_simulate(fn, counters, results=None):
+    wrapped = timed(fn, counters, "simulate")
+
+    def wrapper(*args):
+        out = wrapped(*args)
+        for chains, _, _, ok in (results(out) if results else [out]):
+            if ok:
+                counters["chain_sims"] += 1
+                counters["chain_steps"] += chains
+        return out
+    return wrapper
+
+
+def profiled_engine(eng, counters):
+    # eng（モジュールか SimpleNamespace）の計測版。元の eng は変えない
+    view = SimpleNamespace(**vars(eng))
+    for phase, names in PHASES.items():
+        for name in names:
+            fn = getattr(eng, name, None)
+            if fn is None:
+                continue
+            if phase == "simulate":
+                setattr(view, name, timed_simulate(fn, counters, BATCH_RESULTS.get(name)))
+            else:
+                setattr(view, name, timed(fn, counters, phase))
+    return view
+
+
+def profile_summary(counters):
+    # JSON にそのまま出せる形に整える
+    phases = {}
+    for phase in list(PHASES) + ["total"]:
+        phases[phase] = {
+            "calls": counters[f"{phase}.calls"],
+            "seconds": round(counters[f"{phase}.seconds"], 6),
+        }
+    combinations = counters["combinations"]
+    chain_sims = counters["chain_sims"]
+    return {
+        "phases": phases,
+        "combinations": combinations,
+        "recolor_rejected": counters["recolor_rejected"],
+        "start_candidates": counters["start_candidates"],
+        "avg_start_candidates": counters["start_candidates"] / combinations if combinations else 0.0,
+        "chain_sims": chain_sims,
+        "avg_chains": counters["chain_steps"] / chain_sims if chain_sims else 0.0,
+    }
@@ -0,0 +1,94 @@
+# =========================================================
+# 探索結果の保存（SQLite ファイル）
+#   同じ確定盤面・ネクスト・塗る色・塗り替え数で解析し直したとき、
+#   前回の上位 K 件と info をすぐ返す（Streamlit の再実行や別の日でも）。
+#   キーは (盤面, nexts, paint_color, paint_count, min_k, top_k, 起点候補) を JSON にした文字列。
+#   起点候補は run_search の base= で盤面と別に渡せるので、盤面から求めた分もキーに入れる。
+#   エンジン・並列数・置換表などは結果を変えないのでキーに入れない。
+#   最後まで探索した結果だけ保存する（中断・時間切れは保存しない）。
+#   件数上限を超えたら一番古く使われたものから捨てる（LRU）。
+#   ENGINE_VERSION が違う行は使わない（次の保存時に消す）。
+# =========================================================
+from contextlib import closing
+import json
+import os
+import sqlite3
+import time
+
+# 連鎖・得点のルールや結果の形を変えたら上げる
+ENGINE_VERSION = 1
+
+DEFAULT_PATH = os.environ.get("PUYO_RESULT_CACHE", "result_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = max(1, int(os.environ.get("PUYO_RESULT_CACHE_MAX", "1000")))
+
+# 保存する info のキー（tt / dedup / profile などは探索の仕方で変わるので持たない）
+INFO_KEYS = (
+    "reason", "recolor_candidates", "start_candidates",
+    "patterns", "trials", "elapsed", "coverage",
+)
+
+
+def cache_key(base_field, nexts, paint_color, paint_count, min_k, top_k, start_cands):
+    return json.dumps(
+        [[list(row) for row in base_field], list(nexts), paint_color, paint_count, min_k, top_k,
+         [list(pos) for pos in start_cands]],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+
+
+def decode_results(results):
+    # JSON で list になった座標を tuple に戻す（run_search の戻り値と同じ形）
+    return [
+        {**r, "recolor": tuple(tuple(p) for p in r["recolor"]), "start": tuple(r["start"])}
+        for r in results
+    ]
+
+
+class ResultCache:
+    # 接続は呼ぶたびに開く（探索スレッド・別プロセスからも使えるように）
+    def __init__(self, path=DEFAULT_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " results TEXT NOT NULL,"
+                " info TEXT NOT NULL,"
+                " used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT results, info FROM results WHERE key = ? AND version = ?",
+                (key, ENGINE_VERSION),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        results, info = row
+        info = json.loads(info)
+        info["cached"] = True
+        return decode_results(json.loads(results)), info
+
+    def put(self, key, results, info):
+        info = {name: info[name] for name in INFO_KEYS if name in info}
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM results WHERE version != ?", (ENGINE_VERSION,))
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, version, results, info, used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, ENGINE_VERSION, json.dumps(results, ensure_ascii=False),
+                 json.dumps(info, ensure_ascii=False), time.time()),
+            )
+            db.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
@@ -0,0 +1,1336 @@
+# =========================================================
+# 探索本体（塗り替え → 塗り替え直後は消えない → 起点1個消して連鎖）
+#   Streamlit に依存しない。進捗は on_progress で受け取る。
+# =========================================================
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from importlib.util import find_spec
+from itertools import combinations, zip_longest
+from math import comb
+from types import SimpleNamespace
+import heapq
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import uuid
+
+import bitboard
+import colboard
+from engine import (
+    COLS,
+    DIR4,
+    NORMAL_COLORS,
+    ROWS,
+    ComponentIndex,
+    compute_recolor_candidates,
+    compute_start_candidates,
+    copy_field,
+    has_any_erase_global,
+    in_board_neighbors,
+    prepare_start_trials,
+    simulate_prepared,
+    simulate_with_start_scoring,
+)
+from profiling import new_counters, profile_summary, profiled_engine
+from resultcache import cache_key
+from ttable import TranspositionTable, merge_tt_stats
+
+TOP_N = 3   # 上位何件を返すか（run_search の top_k の既定値）
+
+# 並列時、1つの k をワーカー1つあたり何分割するか（枝刈りで重さが偏るので細かめ）
+SHARDS_PER_WORKER = 8
+MIN_SHARD_PATTERNS = 256
+
+# 並列時に中断を確かめる間隔（秒）
+CANCEL_POLL = 0.2
+
+# 時間制限つき探索で1つの k を何分割して、k をまたいで順番に回すか
+ANYTIME_SLICES_PER_K = 64
+
+# 枝切りA案：塗り替え数は paint_count-4 ～ paint_count だけ探索する
+def default_min_k(paint_count):
+    return max(0, paint_count - 4)
+
+# 塗り替え候補 n マスから min_k ～ paint_count マス選ぶ組み合わせの数（探索パターン数）
+def count_patterns(n, min_k, paint_count):
+    return sum(comb(n, k) for k in range(min_k, min(paint_count, n) + 1))
+
+# =========================================================
+# エンジン選択（list: engine.py のリスト版 / bitboard: ビットボード版
+#   / column: 候補は list と同じ、シミュレーションは colboard の列詰め版）
+# =========================================================
+list_engine = SimpleNamespace(
+    encode=ComponentIndex,
+    set_cell=ComponentIndex.set_cell,
+    cells_mask=set,
+    erases_at=ComponentIndex.erases_at,
+    filter_start_candidates=ComponentIndex.filter_start_candidates,
+    prepare_start_trials=lambda board, nexts: prepare_start_trials(board.field, nexts),
+    simulate_prepared=simulate_prepared,
+    simulate_with_start_scoring=simulate_with_start_scoring,
+)
+
+column_engine = SimpleNamespace(**{
+    **vars(list_engine),
+    "prepare_start_trials": lambda board, nexts: colboard.prepare_start_trials(
+        colboard.encode(board.field), nexts
+    ),
+    "simulate_prepared": colboard.simulate_prepared,
+    "simulate_with_start_scoring": colboard.simulate_with_start_scoring,
+})
+
+ENGINES = {
+    "bitboard": bitboard,
+    "list": list_engine,
+    "column": column_engine,
+}
+
+# numpy: 列挙・候補は bitboard、1組み合わせの全起点を npsim でまとめてシミュレーション
+#   numpy の読み込みは重い（0.1 秒ほど）ので、初めて使うときに npsim を読む。
+#   numpy が無ければ numpy エンジンは使えない（ほかは動く）
+def numpy_engine():
+    import npsim
+    return SimpleNamespace(**vars(bitboard), simulate_starts=npsim.simulate_starts)
+
+
+# 使うときに作るエンジン（ENGINES には名前だけ None で入れておく）
+LAZY_ENGINES = {}
+if find_spec("numpy") is not None:
+    LAZY_ENGINES["numpy"] = numpy_engine
+    ENGINES["numpy"] = None
+
+
+def get_engine(name):
+    eng = ENGINES[name]
+    if eng is None:
+        eng = ENGINES[name] = LAZY_ENGINES[name]()
+    return eng
+
+class SearchCancelled(Exception):
+    pass
+
+# =========================================================
+# 塗り替え組み合わせの列挙（深さ優先・枝刈りつき）
+#   field を1マスずつ塗り替え／戻しながら combinations(cands, k) と同じ順で作る。
+#   元盤面に消える塊は無いので、塗り替えで消えるのは塗った色の塊だけで、
+#   塗るマスを増やしてもその塊は大きくなるだけ → 途中で消えたら部分木ごと飛ばす。
+#   lo / hi で辞書順の順位（rank）の範囲 [lo, hi) だけに絞れる。
+#   counts を渡すと、塗り替え直後に消えて飛ばした組み合わせ数を
+#   counts["recolor_rejected"] に足す（計測用）。
+#   yield (combi, rank, skipped)：combi は field に塗り替え済みの組み合わせ
+#   （None なら飛ばした分の報告のみ）、skipped は直前までに飛ばした組み合わせ数
+# =========================================================
+def iter_recolor_combinations(eng, field, base_field, cands, k, paint_color, lo=0, hi=None,
+                              counts=None):
+    n = len(cands)
+    if hi is None:
+        hi = comb(n, k)
+    if k == 0:
+        if lo < hi:
+            yield (), 0, 0
+        return
+
+    idx = []
+    i = 0
+    rank = 0       # 今見ている部分木の先頭の順位
+    skipped = 0
+    while True:
+        if rank >= hi:
+            break
+        if n - i >= k - len(idx):
+            sub = comb(n - 1 - i, k - len(idx) - 1)
+            if rank + sub <= lo:
+                # 範囲より前の部分木
+                rank += sub
+                i += 1
+                continue
+
+            r, c = cands[i]
+            eng.set_cell(field, r, c, paint_color)
+            idx.append(i)
+            # 必須：塗り替え直後に消えない → この先の組み合わせは全部ダメ
+            erased = eng.erases_at(field, r, c)
+            if erased:
+                idx.pop()
+                eng.set_cell(field, r, c, base_field[r][c])
+                n_skip = min(rank + sub, hi) - max(rank, lo)
+                skipped += n_skip
+                if counts is not None:
+                    counts["recolor_rejected"] += n_skip
+                rank += sub
+                i += 1
+                continue
+
+            if len(idx) == k:
+                yield tuple(cands[j] for j in idx), rank, skipped
+                skipped = 0
+                rank += 1
+                idx.pop()
+                eng.set_cell(field, r, c, base_field[r][c])
+            i += 1
+            continue
+
+        # 戻る
+        if not idx:
+            break
+        j = idx.pop()
+        r, c = cands[j]
+        eng.set_cell(field, r, c, base_field[r][c])
+        i = j + 1
+
+    # 途中で抜けたときも盤面は元に戻す
+    for j in idx:
+        r, c = cands[j]
+        eng.set_cell(field, r, c, base_field[r][c])
+
+    if skipped:
+        yield None, rank, skipped
+
+# =========================================================
+# 上位の管理
+#   best は (order, 結果) のリスト。order = (k, rank) は直列探索での出現順。
+#   同点なら先に見つかった方（order が小さい方）を上にする。
+#   探索中は TopK（件数上限つきのヒープ）に貯め、並べたリストは必要なときだけ作る。
+# =========================================================
+def result_key(res):
+    return (res["score"], res["chains"], res["maxsim"])
+
+def merge_best(best, entries, limit=TOP_N):
+    merged = best + list(entries)
+    merged.sort(key=lambda e: (-e[1]["score"], -e[1]["chains"], -e[1]["maxsim"], e[0]))
+    return merged[:limit]
+
+
+class TopK:
+    # 先頭（heap[0]）が上位 k 件のうち一番下。入れ替えは O(log k)
+    # key は結果の比べ方（大きいほど上。既定は得点・連鎖・同時最大）
+    def __init__(self, k, entries=(), key=result_key):
+        self.k = k
+        self.key = key
+        self.heap = []
+        self.version = 0   # 中身が変わるたびに増える
+        for order, res in entries:
+            self.push(order, res)
+
+    def push(self, order, res):
+        # 大きいほど上：得点・連鎖・同時最大が大きく、order が小さい
+        item = (self.key(res), tuple(-x for x in order), order, res)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, item)
+        else:
+            return False
+        self.version += 1
+        return True
+
+    # push したら入るか（入れはしない）
+    def accepts(self, order, res):
+        return len(self.heap) < self.k or (self.key(res), tuple(-x for x in order)) > self.heap[0][:2]
+
+    def best(self):
+        return [(order, res) for _, _, order, res in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
+
+# シャードごとの集計（置換表・同値類など）を足し合わせる
+def merge_stats(total, stats):
+    for key, value in stats.items():
+        if key == "tt":
+            total["tt"] = merge_tt_stats(total.get("tt"), value)
+        else:
+            acc = total.setdefault(key, {})
+            for name, n in value.items():
+                acc[name] = acc.get(name, 0) + n
+    return total
+
+# 塗り替えマスとその上下左右（盤内）を、元の実装が near に足す順で
+def near_cells(pos):
+    r, c = pos
+    cells = [(r, c)]
+    for dr, dc in DIR4:
+        nr, nc = r + dr, c + dc
+        if 0 <= nr < ROWS and 0 <= nc < COLS:
+            cells.append((nr, nc))
+    return tuple(cells)
+
+# 起点候補：ベース＋塗り替え近傍で増える分
+# （near は元の実装と同じ順で足す。起点の順＝同点時の並びが変わらないように）
+def combination_starts(eng, ctx, field, changed):
+    start_cands = list(ctx.base_start_cands)
+    near = set()
+    for pos in changed:
+        near.update(ctx.near_cells[pos])
+
+    base_set = ctx.base_start_set
+    start_cands += eng.filter_start_candidates(
+        field, [pos for pos in near if pos not in base_set]
+    )
+    return start_cands
+
+# =========================================================
+# 1組み合わせの評価（起点候補をすべて試す）
+# =========================================================
+#   stats があれば、同値類で省いたシミュレーション（"dedup"）を足し込む。
+#   戻り値: (その組み合わせの最良, 起点候補数)
+def evaluate_combination(eng, ctx, field, combi, tt=None, stats=None):
+    changed = set(combi)
+    start_cands = combination_starts(eng, ctx, field, changed)
+    if not start_cands:
+        return None, 0
+
+    recolored_set = eng.cells_mask(changed)
+
+    # numpy 以外：ネクスト落下・下詰めは組み合わせごとに1回だけ
+    batch = hasattr(eng, "simulate_starts")
+    prep = None if batch else eng.prepare_start_trials(field, ctx.nexts)
+
+    starts = start_cands
+    if batch:
+        # 全起点をまとめて1回で
+        sims = eng.simulate_starts(field, ctx.nexts, recolored_set, starts)
+    elif hasattr(eng, "simulate_start_classes"):
+        # 起点消し後の盤面が同じ起点は連鎖を1回だけ
+        sims, n_classes = eng.simulate_start_classes(prep, recolored_set, starts, tt)
+        if stats is not None:
+            dedup = stats["dedup"]
+            dedup["classes"] += n_classes
+            dedup["saved_sims"] += sum(1 for res in sims if res[3]) - n_classes
+    else:
+        sims = (eng.simulate_prepared(prep, recolored_set, sp) for sp in starts)
+
+    best_local = None
+
+    for sp, (chains, score, maxsim, ok) in zip(starts, sims):
+        if not ok:
+            continue
+
+        # 条件：連鎖が1以上
+        if chains >= 1:
+            cand = {
+                "chains": chains,
+                "score": score,
+                "maxsim": maxsim,
+                "recolor": tuple(sorted(changed)),
+                "start": sp,
+            }
+            if (best_local is None) or result_key(cand) > result_key(best_local):
+                best_local = cand
+
+    return best_local, len(start_cands)
+
+# =========================================================
+# 時間制限つき探索（anytime）用の候補の並べ替え
+#   見込みのある塗り替え候補を前に置き、そこを含む組み合わせから先に調べる：
+#   同色の塊につながる（ただし塗った直後に4個以上にはならない）マス、
+#   起点候補の隣のマスほど前。順位（同点時の並び）は元の候補順で付け直すので、
+#   最後まで探索できれば結果は全探索と同じ。
+# =========================================================
+def recolor_priority(board, paint_color, pos, start_mask):
+    b = bitboard.pos_bit(pos)
+    around = bitboard.neighbors(b)
+    joined = 0
+    if paint_color in bitboard.COLOR_INDEX:
+        same = board[bitboard.COLOR_INDEX[paint_color]]
+        joined = bitboard.flood(around & same, same).bit_count()
+    if joined + 1 >= 4:
+        # 塗った直後に消える → この候補を含む組み合わせはすぐ枝刈りされる
+        return -1
+    return 2 * joined + (around & start_mask).bit_count()
+
+
+def order_recolor_candidates(base_field, paint_color, recolor_cands, base_start_cands):
+    board = bitboard.encode(base_field)
+    start_mask = bitboard.cells_mask(base_start_cands)
+    prio = [recolor_priority(board, paint_color, pos, start_mask) for pos in recolor_cands]
+    order = sorted(range(len(recolor_cands)), key=lambda i: -prio[i])
+    return [recolor_cands[i] for i in order]
+
+
+def combination_rank(indices, n):
+    # 昇順の indices が combinations(range(n), k) で何番目か
+    k = len(indices)
+    rank = comb(n, k) - 1
+    for i, j in enumerate(indices):
+        rank -= comb(n - 1 - j, k - i)
+    return rank
+
+# =========================================================
+# 塗り替え候補の絞り込み（影響範囲）
+#   どの組み合わせ・どの起点でも中身が変わりうるマス（影響範囲）を先に求め、
+#   その外の塗り替え候補は列挙から外す（外した候補を spare と呼ぶ）。
+#   影響範囲は次を増えなくなるまで足したもの：
+#     ・起点になりうるマス、ネクストが落ちるマス、穴のある列
+#     ・影響範囲のマスより上に積もったマス（落ちてくる）
+#     ・同じ色になりうる（元の色か塗る色）範囲外のマスの塊で、影響範囲に接するもの
+#       （連鎖で消える塊は、初めからある4個未満の塊に動いたマスがつながったもの）
+#     ・影響範囲に接するハート（またはハートに塗りうるマス）
+#   範囲外のマスは連鎖中ずっと動かず消えないので、spare を塗っても塗らなくても
+#   得点・連鎖・同時最大は変わらない（塗った直後に消える組み合わせは無効のまま）。
+#   同点の並びを全探索と同じにするため、結果が上位に入るたびに spare を足した
+#   組み合わせも順位（元の候補順）を付けて入れる（expand_spare）。
+# =========================================================
+def possible_start_cells(base_start_cands):
+    # 起点候補は base_start_cands ＋ 塗り替えマスの近くで is_good_start_candidate を
+    # 満たすマス。後者は隣に4つ以上の塊が要るが、塗り替え直後に消える組み合わせは
+    # 除くので塗り替え後の盤面にそんな塊は無い → 増えない。起点の判定を変えたら見直すこと。
+    # （確定盤面も消えないので、今の判定では base_start_cands も空になる。
+    #   空でないのは run_search に base= で起点候補を渡したときだけ）
+    return set(base_start_cands)
+
+
+def influence_region(base_field, nexts, paint_color, recolor_cands, starts):
+    cand_set = set(recolor_cands)
+    paint_normal = paint_color in NORMAL_COLORS
+
+    def colors_of(pos):
+        r, c = pos
+        v = base_field[r][c]
+        out = {v} if v in NORMAL_COLORS else set()
+        if paint_normal and pos in cand_set:
+            out.add(paint_color)
+        return out
+
+    def can_be_heart(pos):
+        r, c = pos
+        return base_field[r][c] == "ハート" or (paint_color == "ハート" and pos in cand_set)
+
+    # arrives[(r, c)]：(r, c) に後から来うるマスの色（上のマスとネクスト）
+    arrives = {}
+    for c in range(COLS):
+        seen_colors = {nexts[c]}
+        for r in range(ROWS):
+            seen_colors = seen_colors | colors_of((r, c))
+            arrives[(r, c)] = seen_colors
+
+    region = set(starts)
+    for c in range(COLS):
+        top = next((r for r in range(ROWS) if base_field[r][c] != "空"), ROWS)
+        holes = [r for r in range(top, ROWS) if base_field[r][c] == "空"]
+        if holes:
+            # 穴あり：ネクスト落下後の下詰めで一番下の穴から上が動く
+            region.update((r, c) for r in range(holes[-1] + 1))
+        elif top > 0:
+            # ネクストが落ちるマス
+            region.add((top - 1, c))
+
+    # 範囲外のマスの color の塊が、color のマスが来うる範囲のマスに接するか
+    def touches(pos, color):
+        return any(n in region and color in arrives[n] for n in in_board_neighbors(*pos))
+
+    static = {
+        (r, c) for r in range(ROWS) for c in range(COLS) if base_field[r][c] != "空"
+    } - region
+    grown = True
+    while grown:
+        before = len(region)
+
+        for c in range(COLS):
+            lowest = max((r for r in range(ROWS) if (r, c) in region), default=-1)
+            region.update((r, c) for r in range(lowest) if (r, c) in static)
+        static -= region
+
+        for color in NORMAL_COLORS:
+            seen = set()
+            for pos in static:
+                if pos in seen or color not in colors_of(pos):
+                    continue
+                seen.add(pos)
+                comp = [pos]
+                for cell in comp:
+                    for n in in_board_neighbors(*cell):
+                        if n in static and n not in seen and color in colors_of(n):
+                            seen.add(n)
+                            comp.append(n)
+                if any(touches(cell, color) for cell in comp):
+                    region.update(comp)
+            static -= region
+
+        # ハートは隣が消えると消える
+        region.update(
+            pos for pos in static
+            if can_be_heart(pos) and any(n in region for n in in_board_neighbors(*pos))
+        )
+        static -= region
+
+        grown = len(region) != before
+    return region
+
+
+def prune_recolor_candidates(base_field, nexts, paint_color, recolor_cands, base_start_cands):
+    # 戻り値: (列挙する候補, 外した候補 spare)。どちらも元の候補順
+    starts = possible_start_cells(base_start_cands)
+    if not starts:
+        # 起点が無ければどの組み合わせも結果なし
+        return [], list(recolor_cands)
+    region = influence_region(base_field, nexts, paint_color, recolor_cands, starts)
+    return (
+        [pos for pos in recolor_cands if pos in region],
+        [pos for pos in recolor_cands if pos not in region],
+    )
+
+
+def combination_order(ctx, combi):
+    # 全探索（元の候補順）での (k, rank)
+    idx = sorted(ctx.orig_index[pos] for pos in combi)
+    return len(idx), combination_rank(idx, ctx.orig_count)
+
+
+def expand_spare(eng, ctx, field, top, combi, res, tt=None):
+    # combi（塗り済み）の結果 res を入れ、spare を昇順に足した組み合わせも入れる。
+    # 足した組み合わせは得点などが同じで順位だけ後ろなので、入らなかったら
+    # その先（さらに足したもの）も入らない。min_k 未満の組み合わせは入れず、
+    # そこから min_k まで足した一番前の組み合わせで見込みを判定する。
+    key_res = res
+    spare = ctx.spare
+
+    def visit(combi, res, j):
+        k = len(combi)
+        if k >= ctx.min_k:
+            if not top.push(combination_order(ctx, combi), res):
+                return
+        else:
+            need = ctx.min_k - k
+            if j + need > len(spare):
+                return
+            first = combi + tuple(spare[j:j + need])
+            if not top.accepts(combination_order(ctx, first), key_res):
+                return
+        if k == ctx.paint_count:
+            return
+
+        for i in range(j, len(spare)):
+            r, c = spare[i]
+            eng.set_cell(field, r, c, ctx.paint_color)
+            if not eng.erases_at(field, r, c):
+                wider = combi + (spare[i],)
+                wider_res = res
+                if k + 1 >= ctx.min_k:
+                    # 起点の順（同点時の起点）は組み合わせで変わりうるので評価し直す
+                    wider_res, _ = evaluate_combination(eng, ctx, field, wider, tt)
+                if wider_res is not None:
+                    visit(wider, wider_res, i + 1)
+            eng.set_cell(field, r, c, ctx.base_field[r][c])
+
+    visit(tuple(combi), res, 0)
+
+# =========================================================
+# 1シャード（k と順位範囲 [lo, hi)）の探索
+#   並列時はワーカープロセスで動くので、モジュール直下に置く。
+#   tick(パターン増分, 試行増分, 途中の上位) は組み合わせごとに呼ばれる（直列時の進捗用）。
+#   置換表はワーカープロセス内で同じ探索のシャード間で使い回す。
+#   ctx.deadline（time.time() の値）を過ぎたら途中で打ち切る。
+#   プロセスプールの中では、プールの止め合図（stop_executor で立つ）でも打ち切る。
+# =========================================================
+_process_tt = (None, None)
+_pool_stop = None
+
+def init_pool_worker(stop):
+    global _pool_stop
+    _pool_stop = stop
+
+def process_tt(ctx):
+    global _process_tt
+    search_id, tt = _process_tt
+    if search_id != ctx.search_id:
+        tt = TranspositionTable(ctx.tt_size)
+        _process_tt = (ctx.search_id, tt)
+    return tt
+
+def search_shard(ctx, k, lo, hi, tick=None, tt=None, best=None):
+    eng = get_engine(ctx.engine)
+    field = eng.encode(ctx.base_field)
+
+    counters = None
+    if ctx.profile:
+        counters = new_counters()
+        eng = profiled_engine(eng, counters)
+        t_shard = time.perf_counter()
+
+    if tt is None and ctx.tt_size:
+        tt = process_tt(ctx)
+    tt_before = tt.stats() if tt is not None else None
+
+    # 直列では呼び出し側の TopK をそのまま使い、k をまたいで貯める
+    top = best if isinstance(best, TopK) else TopK(ctx.top_k, best or [])
+    done_patterns = 0
+    done_trials = 0
+    stats = {}
+    if hasattr(eng, "simulate_start_classes") and not hasattr(eng, "simulate_starts"):
+        stats["dedup"] = {"classes": 0, "saved_sims": 0}
+
+    for combi, rank, skipped in iter_recolor_combinations(
+        eng, field, ctx.base_field, ctx.recolor_cands, k, ctx.paint_color, lo, hi, counters
+    ):
+        patterns = skipped
+        trials = 0
+        if combi is not None:
+            best_local, trials = evaluate_combination(eng, ctx, field, combi, tt, stats)
+            if best_local is not None:
+                if ctx.spare:
+                    expand_spare(eng, ctx, field, top, combi, best_local, tt)
+                elif ctx.orig_index is not None:
+                    # 並べ替え済みの候補 → 元の候補順での順位
+                    top.push(combination_order(ctx, combi), best_local)
+                else:
+                    top.push((k, rank), best_local)
+            patterns += 1
+            if counters is not None:
+                counters["combinations"] += 1
+                counters["start_candidates"] += trials
+
+        done_patterns += patterns
+        done_trials += trials
+        if tick is not None:
+            tick(patterns, trials, top)
+        if ctx.deadline is not None and time.time() >= ctx.deadline:
+            break
+        if _pool_stop is not None and _pool_stop.is_set():
+            break
+
+    if tt is not None:
+        tt_stats = tt.stats()
+        for key in ("hits", "misses", "collisions", "evictions"):
+            tt_stats[key] -= tt_before[key]
+        stats["tt"] = tt_stats
+
+    if counters is not None:
+        counters["total.calls"] += 1
+        counters["total.seconds"] += time.perf_counter() - t_shard
+        stats["profile"] = counters
+
+    return top.best(), done_patterns, done_trials, stats
+
+def new_executor(workers):
+    # Streamlit のサーバースレッドから fork しないよう spawn で起動する
+    mp = multiprocessing.get_context("spawn")
+    stop = mp.Event()
+    ex = ProcessPoolExecutor(max_workers=workers, mp_context=mp,
+                             initializer=init_pool_worker, initargs=(stop,))
+    ex.stop = stop
+    return ex
+
+
+# 中断・エラーで抜けたとき（finished=False）は、走っているシャードにも止め合図を送る
+# （cancel_futures では始まっていないシャードしか取り消せず、走っているシャードは
+# 最後まで回り続ける）。シャードは次の組み合わせで戻るので、プロセスが終わるまで待つ
+def stop_executor(ex, finished):
+    if not finished:
+        ex.stop.set()
+    ex.shutdown(wait=True, cancel_futures=True)
+
+#   anytime=True なら k ごとに細かく分け、大きい k から順に k をまたいで
+#   1切れずつ回す（時間切れでも全 k を少しずつ見られるように）。
+def plan_shards(n, min_k, paint_count, workers, anytime=False):
+    per_k = []
+    for k in range(min_k, paint_count + 1):
+        if k > n:
+            continue
+        total = comb(n, k)
+        if workers <= 1:
+            parts = 1
+        else:
+            parts = max(1, min(workers * SHARDS_PER_WORKER, total // MIN_SHARD_PATTERNS))
+        if anytime:
+            parts = max(parts, min(ANYTIME_SLICES_PER_K, total))
+        step = -(-total // parts)
+        per_k.append([(k, lo, min(total, lo + step)) for lo in range(0, total, step)])
+
+    if not anytime:
+        return [shard for shards in per_k for shard in shards]
+
+    shards = []
+    per_k.reverse()
+    for i in range(max((len(p) for p in per_k), default=0)):
+        for p in per_k:
+            if i < len(p):
+                shards.append(p[i])
+    return shards
+
+# =========================================================
+# 探索本体
+#   workers > 1 なら組み合わせ空間を (k, 順位範囲) で分けてプロセス並列にする。
+#   結果はワーカー数によらず直列と同じ。
+#   tt_size > 0 なら起点消し後の連鎖結果を置換表に貯める（bitboard のみ）。
+#   profile=True なら工程ごとの回数・時間を info["profile"] に入れる（少し遅くなる）。
+#   on_progress(done_patterns, total_patterns, done_trials, est_total_trials, elapsed)
+#   top_k は返す上位の件数（既定 TOP_N = 3）。
+#   on_best(途中の上位 top_k 件) は上位が変わるたびに呼ばれる。
+#   cancel（is_set() を持つもの、threading.Event など）が立つと途中で打ち切り、
+#   そこまでの上位を返す（info["cancelled"] = True）。
+#   time_budget（秒）を指定すると時間制限つき探索：見込みのある候補から順に調べ、
+#   時間切れならそこまでの上位を返す（info["budget_expired"] = True）。
+#   info["coverage"] は調べ終えた組み合わせの割合（0～1）。
+#   cache（resultcache.ResultCache）を渡すと、保存済みならそれを返し
+#   （info["cached"] = True）、最後まで探索したら結果を保存する。
+#   base（analyze_base の戻り値）は run_sweep が色をまたいで使い回すためのもの。
+#   cluster（cluster.Coordinator）を渡すと、シャードをプロセスプールの代わりに
+#   つないできたワーカー（別のマシンでもよい）へ配る（info["cluster"] に配った数など）。
+# =========================================================
+def analyze_base(base_field):
+    # 塗る色によらない確定盤面の下調べ
+    erase = has_any_erase_global(base_field)
+    return SimpleNamespace(
+        erase=erase,
+        start_cands=[] if erase else compute_start_candidates(base_field),
+    )
+
+
+def check_options(engine, tt_size):
+    if tt_size and engine != "bitboard":
+        raise ValueError("置換表（tt_size）は bitboard エンジンでのみ使えます")
+
+
+# 1色ぶんの探索の準備。探索するまでもなければ plan.ctx は None（理由は plan.info）
+#   prune=True なら影響範囲の外の塗り替え候補を外して列挙する（結果は同じ）。
+#   そのとき info["patterns"] / info["coverage"] は列挙した（絞り込み後の）組み合わせで数え、
+#   絞り込み無しの組み合わせ数は info["full_patterns"] に入れる。
+#   起点になりうるマスが無ければ列挙せずに返す（絞り込み無しでも結果は無い）。
+def prepare_search(base_field, nexts, paint_color, paint_count, min_k, base,
+                   engine, workers, tt_size, profile, time_budget, top_k, t0, prune=False):
+    plan = SimpleNamespace(ctx=None, info=None, shards=[], total_patterns=0, est_total_trials=0)
+
+    if base.erase:
+        plan.info = {
+            "reason": "確定盤面の時点で4つ以上が成立して消える状態です（塗り替え前に消える）",
+            "recolor_candidates": None,
+            "start_candidates": None,
+        }
+        return plan
+
+    recolor_cands = compute_recolor_candidates(base_field, paint_color)
+    base_start_cands = base.start_cands
+
+    plan.info = {
+        "reason": None,
+        "recolor_candidates": len(recolor_cands),
+        "start_candidates": len(base_start_cands),
+    }
+
+    if len(recolor_cands) == 0:
+        plan.info["reason"] = "塗り替え候補が0マスでした"
+        return plan
+
+    orig_count = len(recolor_cands)
+    orig_index = {pos: i for i, pos in enumerate(recolor_cands)}
+    spare = []
+    if prune:
+        plan.info["full_patterns"] = count_patterns(orig_count, min_k, paint_count)
+        if not possible_start_cells(base_start_cands):
+            plan.info["pruned_candidates"] = orig_count
+            plan.info["reason"] = "起点になりうるマスがありません（どの組み合わせからも連鎖しない）"
+            return plan
+        recolor_cands, spare = prune_recolor_candidates(
+            base_field, nexts, paint_color, recolor_cands, base_start_cands
+        )
+        plan.info["pruned_candidates"] = len(spare)
+
+    # spare を足して min_k 以上になる組み合わせも列挙する
+    k_lo = max(0, min_k - len(spare))
+    total_patterns = count_patterns(len(recolor_cands), k_lo, paint_count)
+
+    if total_patterns == 0:
+        plan.info["reason"] = "探索パターン数が0になりました"
+        return plan
+
+    plan.total_patterns = total_patterns
+    plan.est_total_trials = total_patterns * max(1, len(base_start_cands))
+
+    anytime = time_budget is not None
+
+    if anytime:
+        recolor_cands = order_recolor_candidates(
+            base_field, paint_color, recolor_cands, base_start_cands
+        )
+
+    plan.ctx = SimpleNamespace(
+        base_field=copy_field(base_field),
+        nexts=list(nexts),
+        paint_color=paint_color,
+        engine=engine,
+        recolor_cands=recolor_cands,
+        orig_index=orig_index if anytime or spare else None,
+        orig_count=orig_count,
+        spare=spare,
+        min_k=min_k,
+        paint_count=paint_count,
+        prune=prune,
+        deadline=t0 + time_budget if anytime else None,
+        base_start_cands=base_start_cands,
+        base_start_set=set(base_start_cands),
+        near_cells={pos: near_cells(pos) for pos in recolor_cands + spare},
+        tt_size=tt_size,
+        search_id=uuid.uuid4().hex,
+        profile=profile,
+        top_k=top_k,
+    )
+    plan.shards = plan_shards(len(recolor_cands), k_lo, paint_count, workers, anytime)
+    return plan
+
+
+# 探索後の info の仕上げ（集計・理由）。戻り値は結果のリスト
+def finish_search(plan, best, stats, done_patterns, done_trials, t0):
+    info = plan.info
+    if "profile" in stats:
+        stats["profile"] = profile_summary(stats["profile"])
+    info.update(stats)
+    info["patterns"] = done_patterns
+    info["trials"] = done_trials
+    info["elapsed"] = time.time() - t0
+    info["coverage"] = done_patterns / plan.total_patterns
+    anytime = plan.ctx.deadline is not None
+    if anytime and done_patterns < plan.total_patterns and not info.get("cancelled"):
+        info["budget_expired"] = True
+
+    if info.get("cancelled"):
+        info["reason"] = "中断しました（ここまでの上位を表示）"
+    elif info.get("budget_expired"):
+        info["reason"] = (
+            f"時間切れ（探索済み {info['coverage']:.2%}）。ここまでの上位を表示"
+            if best else f"時間切れ（探索済み {info['coverage']:.2%}）。条件を満たす結果は未発見"
+        )
+    elif not best:
+        info["reason"] = "条件を満たす結果が見つからなかった（塗り替え直後に消えない＆起点から連鎖が起きない）"
+
+    return [res for _, res in best]
+
+
+# シャードをプロセスプールで回す。jobs は (タグ, ctx, k, lo, hi) の列。
+# 終わったシャードごとに on_done(タグ, search_shard の戻り値) を呼ぶ。
+# check_cancel が例外を投げたら、まだ始まっていないシャードを取り消して抜ける。
+def run_shards(ex, jobs, on_done, check_cancel, deadline=None):
+    pending = {ex.submit(search_shard, ctx, k, lo, hi): tag for tag, ctx, k, lo, hi in jobs}
+    try:
+        while pending:
+            check_cancel()
+            if deadline is not None and time.time() >= deadline:
+                # 時間切れ：まだ始まっていないシャードは取り消す
+                # （走っているシャードは deadline を見てすぐ戻る）
+                for fut in pending:
+                    fut.cancel()
+            done, _ = wait(pending, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+            for fut in done:
+                tag = pending.pop(fut)
+                if not fut.cancelled():
+                    on_done(tag, fut.result())
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+# 絞り込みの検証：最後まで探索できたときだけ、絞り込み無しの探索 unpruned() の上位と比べる
+def verify_pruning(results, info, unpruned):
+    if info.get("cancelled") or info.get("budget_expired"):
+        return
+    expected, expected_info = unpruned()
+    if expected_info.get("cancelled"):
+        return
+    if results != expected:
+        raise AssertionError(
+            f"塗り替え候補の絞り込みで上位が変わりました（絞り込みあり {results} / 無し {expected}）"
+        )
+    info["verified"] = True
+
+
+#   prune=True なら影響範囲の外の塗り替え候補を外して列挙する（既定は全部列挙。
+#   今の起点の判定では、base= で起点候補を渡さない限り起点になりうるマスが無い）。
+#   verify=True なら絞り込み無しでも探索し、上位が同じか確かめる（違えば AssertionError）。
+def run_search(base_field, nexts, paint_color, paint_count, min_k,
+               engine="bitboard", workers=1, on_progress=None, tt_size=0,
+               profile=False, on_best=None, cancel=None, time_budget=None, cache=None,
+               base=None, top_k=TOP_N, prune=False, verify=False, cluster=None):
+    check_options(engine, tt_size)
+    if cluster is not None:
+        workers = max(workers, cluster.shard_workers())
+
+    if verify and prune:
+        # 検証では保存済みの結果は使わない
+        results, info = run_search(
+            base_field, nexts, paint_color, paint_count, min_k,
+            engine=engine, workers=workers, on_progress=on_progress, tt_size=tt_size,
+            profile=profile, on_best=on_best, cancel=cancel, time_budget=time_budget,
+            base=base, top_k=top_k, prune=True, cluster=cluster,
+        )
+        verify_pruning(results, info, lambda: run_search(
+            base_field, nexts, paint_color, paint_count, min_k,
+            engine=engine, workers=workers, tt_size=tt_size, cancel=cancel,
+            base=base, top_k=top_k, prune=False, cluster=cluster,
+        ))
+        return results, info
+
+    if base is None:
+        base = analyze_base(base_field)
+
+    key = None
+    if cache is not None:
+        key = cache_key(base_field, nexts, paint_color, paint_count, min_k, top_k, base.start_cands)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+
+    t0 = time.time()
+    plan = prepare_search(
+        base_field, nexts, paint_color, paint_count, min_k, base,
+        engine, workers, tt_size, profile, time_budget, top_k, t0, prune,
+    )
+    ctx = plan.ctx
+    info = plan.info
+    if ctx is None:
+        return [], info
+
+    total_patterns = plan.total_patterns
+    est_total_trials = plan.est_total_trials
+
+    top = TopK(top_k)
+    done_patterns = 0
+    done_trials = 0
+
+    last_update = 0.0
+    last_pct = -1
+
+    seen_version = 0
+
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled
+
+    # 進捗（0.5秒ごと）。上位は変わったときだけ並べて on_best に渡す
+    def tick(patterns, trials, top):
+        nonlocal done_patterns, done_trials, last_update, last_pct, seen_version
+        done_patterns += patterns
+        done_trials += trials
+        if top.version != seen_version:
+            seen_version = top.version
+            if on_best is not None:
+                on_best([res for _, res in top.best()])
+        check_cancel()
+        if on_progress is None:
+            return
+        now = time.time()
+        pct = int(done_patterns / total_patterns * 100)
+        if now - last_update >= 0.5 and pct != last_pct:
+            on_progress(done_patterns, total_patterns, done_trials, est_total_trials, now - t0)
+            last_update = now
+            last_pct = pct
+
+    stats = {}
+
+    try:
+        if workers <= 1 and cluster is None:
+            tt = TranspositionTable(tt_size) if tt_size else None
+            try:
+                for k, lo, hi in plan.shards:
+                    # 直列ではしきい値を k をまたいで引き継ぐ
+                    _, _, _, shard_stats = search_shard(ctx, k, lo, hi, tick, tt, top)
+                    merge_stats(stats, {key: v for key, v in shard_stats.items() if key != "tt"})
+                    if ctx.deadline is not None and time.time() >= ctx.deadline:
+                        break
+            finally:
+                if tt is not None:
+                    stats["tt"] = tt.stats()
+        else:
+            def on_done(_, out):
+                shard_best, patterns, trials, shard_stats = out
+                for order, res in shard_best:
+                    top.push(order, res)
+                merge_stats(stats, shard_stats)
+                tick(patterns, trials, top)
+
+            jobs = [(None, ctx, k, lo, hi) for k, lo, hi in plan.shards]
+            if cluster is not None:
+                stats["cluster"] = cluster.run_shards(jobs, on_done, check_cancel, ctx.deadline)
+            else:
+                ex = new_executor(workers)
+                finished = False
+                try:
+                    run_shards(ex, jobs, on_done, check_cancel, ctx.deadline)
+                    finished = True
+                finally:
+                    stop_executor(ex, finished)
+    except SearchCancelled:
+        info["cancelled"] = True
+
+    results = finish_search(plan, top.best(), stats, done_patterns, done_trials, t0)
+    if key is not None and info["coverage"] == 1:
+        cache.put(key, results, info)
+    return results, info
+
+# =========================================================
+# 全色スイープ（塗る色をまとめて探索。確定盤面の下調べとプロセスプールは共通）
+#   戻り値: (全色まとめた上位 top_k 件, info)。各結果には "paint_color" が付き、
+#   同点なら paint_colors で先の色が上。
+#   info["per_color"][色] = {"results": その色の上位 top_k 件, "info": その色の info}
+#   workers > 1 なら全色のシャードを色を交互にして1つのプールに積む
+#   （色ごとに最後のシャードを待って手の空くワーカーが出ない）。
+#   time_budget は直列なら残り時間を残りの色数で割って1色ずつに配り、
+#   並列なら全色で同じ締め切りにする。
+#   on_progress は全色合計の数で呼ぶ。on_best には全色まとめた途中の上位を渡す。
+#   cluster を渡すと全色のシャードをつないできたワーカーへ配る（run_search と同じ）。
+#   base（analyze_base の戻り値）を渡すと、確定盤面の下調べの代わりに全色で使う。
+# =========================================================
+def tag_color(i, color, results):
+    return [((i, j), {**res, "paint_color": color}) for j, res in enumerate(results)]
+
+
+def run_sweep(base_field, nexts, paint_colors, paint_count, min_k,
+              engine="bitboard", workers=1, on_progress=None, tt_size=0,
+              profile=False, on_best=None, cancel=None, time_budget=None, cache=None,
+              base=None, top_k=TOP_N, prune=False, verify=False, cluster=None):
+    check_options(engine, tt_size)
+    if cluster is not None:
+        workers = max(workers, cluster.shard_workers())
+
+    t0 = time.time()
+    if base is None:
+        base = analyze_base(base_field)
+    colors = list(paint_colors)
+    per_color = {}
+    info = {"reason": None, "paint_colors": colors}
+
+    def combined():
+        best = []
+        for i, color in enumerate(colors):
+            if color in per_color:
+                best = merge_best(best, tag_color(i, color, per_color[color]["results"]), top_k)
+        return best
+
+    if workers <= 1 and cluster is None:
+        for i, color in enumerate(colors):
+            budget = None
+            if time_budget is not None:
+                remaining = max(0.0, time_budget - (time.time() - t0))
+                budget = remaining / (len(colors) - i)
+
+            if on_best is None:
+                color_best = None
+            else:
+                def color_best(results, i=i, color=color):
+                    on_best([res for _, res in merge_best(combined(), tag_color(i, color, results), top_k)])
+
+            results, color_info = run_search(
+                base_field, nexts, color, paint_count, min_k,
+                engine=engine, workers=1, on_progress=on_progress, tt_size=tt_size,
+                profile=profile, on_best=color_best, cancel=cancel,
+                time_budget=budget, cache=cache, base=base, top_k=top_k,
+                prune=prune, verify=verify,
+            )
+            per_color[color] = {"results": results, "info": color_info}
+            if color_info.get("cancelled"):
+                info["cancelled"] = True
+                break
+    else:
+        sweep_parallel(
+            base_field, nexts, colors, paint_count, min_k, base, per_color, info,
+            engine, workers, on_progress, tt_size, profile, on_best, cancel,
+            time_budget, cache, top_k, t0, combined, prune, verify, cluster,
+        )
+
+    infos = [entry["info"] for entry in per_color.values()]
+    info["per_color"] = per_color
+    info["patterns"] = sum(x.get("patterns", 0) for x in infos)
+    info["trials"] = sum(x.get("trials", 0) for x in infos)
+    info["elapsed"] = time.time() - t0
+    if any(x.get("budget_expired") for x in infos):
+        info["budget_expired"] = True
+
+    best = combined()
+    if info.get("cancelled"):
+        info["reason"] = "中断しました（ここまでの上位を表示）"
+    elif base.erase and infos:
+        info["reason"] = infos[0]["reason"]
+    elif info.get("budget_expired"):
+        info["reason"] = (
+            "時間切れ。ここまでの上位を表示" if best else "時間切れ。条件を満たす結果は未発見"
+        )
+    elif not best:
+        info["reason"] = "どの色でも条件を満たす結果が見つからなかった"
+
+    return [res for _, res in best], info
+
+
+def sweep_parallel(base_field, nexts, colors, paint_count, min_k, base, per_color, info,
+                   engine, workers, on_progress, tt_size, profile, on_best, cancel,
+                   time_budget, cache, top_k, t0, combined, prune, verify, cluster=None):
+    if verify and prune:
+        # 検証では保存済みの結果は使わない
+        cache = None
+
+    plans = {}
+    keys = {}
+    for color in colors:
+        if cache is not None:
+            keys[color] = cache_key(base_field, nexts, color, paint_count, min_k, top_k, base.start_cands)
+            hit = cache.get(keys[color])
+            if hit is not None:
+                per_color[color] = {"results": hit[0], "info": hit[1]}
+                continue
+        plan = prepare_search(
+            base_field, nexts, color, paint_count, min_k, base,
+            engine, workers, tt_size, profile, time_budget, top_k, t0, prune,
+        )
+        if plan.ctx is None:
+            per_color[color] = {"results": [], "info": plan.info}
+            continue
+        plan.top = TopK(top_k)
+        plan.stats = {}
+        plan.done_patterns = 0
+        plan.done_trials = 0
+        plans[color] = plan
+        per_color[color] = {"results": [], "info": plan.info}
+
+    if not plans:
+        return
+
+    total_patterns = sum(plan.total_patterns for plan in plans.values())
+    est_total_trials = sum(plan.est_total_trials for plan in plans.values())
+    done_patterns = 0
+    done_trials = 0
+    last_update = 0.0
+    last_pct = -1
+
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled
+
+    def on_done(color, out):
+        nonlocal done_patterns, done_trials, last_update, last_pct
+        plan = plans[color]
+        shard_best, patterns, trials, shard_stats = out
+        version = plan.top.version
+        for order, res in shard_best:
+            plan.top.push(order, res)
+        merge_stats(plan.stats, shard_stats)
+        plan.done_patterns += patterns
+        plan.done_trials += trials
+        done_patterns += patterns
+        done_trials += trials
+        if plan.top.version != version:
+            per_color[color]["results"] = [res for _, res in plan.top.best()]
+            if on_best is not None:
+                on_best([res for _, res in combined()])
+        check_cancel()
+        if on_progress is None:
+            return
+        now = time.time()
+        pct = int(done_patterns / total_patterns * 100)
+        if now - last_update >= 0.5 and pct != last_pct:
+            on_progress(done_patterns, total_patterns, done_trials, est_total_trials, now - t0)
+            last_update = now
+            last_pct = pct
+
+    # 色を交互に積む（時間制限つきでも全色を少しずつ見られるように）
+    queues = [[(color, plan.ctx, k, lo, hi) for k, lo, hi in plan.shards] for color, plan in plans.items()]
+    jobs = [job for row in zip_longest(*queues) for job in row if job is not None]
+    deadline = t0 + time_budget if time_budget is not None else None
+
+    if cluster is not None:
+        try:
+            info["cluster"] = cluster.run_shards(jobs, on_done, check_cancel, deadline)
+        except SearchCancelled:
+            info["cancelled"] = True
+    else:
+        ex = new_executor(workers)
+        finished = False
+        try:
+            run_shards(ex, jobs, on_done, check_cancel, deadline)
+            finished = True
+        except SearchCancelled:
+            info["cancelled"] = True
+        finally:
+            stop_executor(ex, finished)
+
+    for color, plan in plans.items():
+        if info.get("cancelled"):
+            plan.info["cancelled"] = True
+        results = finish_search(plan, plan.top.best(), plan.stats, plan.done_patterns, plan.done_trials, t0)
+        per_color[color] = {"results": results, "info": plan.info}
+        if cache is not None and plan.info["coverage"] == 1:
+            cache.put(keys[color], results, plan.info)
+        if verify and prune:
+            verify_pruning(results, plan.info, lambda color=color: run_search(
+                base_field, nexts, color, paint_count, min_k,
+                engine=engine, workers=workers, tt_size=tt_size, cancel=cancel,
+                base=base, top_k=top_k, prune=False, cluster=cluster,
+            ))
+
+
+# =========================================================
+# 上位の逐次取り出し（ジェネレーター版）
+#   for results, info in stream_search(base_field, nexts, ...): ...
+#   上位 top_k 件が変わるたびに (その時点の上位, None) を、最後に (結果, info) を返す。
+#   探索は別スレッドで走り、途中でジェネレーターを閉じると探索も中断する。
+#   search=run_sweep なら全色スイープを同じように取り出せる。ほかの引数はそのまま渡す。
+# =========================================================
+def stream_search(*args, search=run_search, cancel=None, **kwargs):
+    events = queue.Queue()
+    stop = threading.Event()
+    stopped = SimpleNamespace(
+        is_set=lambda: stop.is_set() or (cancel is not None and cancel.is_set())
+    )
+
+    def on_best(results):
+        events.put((list(results), None))
+
+    def run():
+        try:
+            events.put(search(*args, on_best=on_best, cancel=stopped, **kwargs))
+        except Exception as e:
+            events.put(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = events.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            if item[1] is not None:
+                return
+    finally:
+        stop.set()
+        thread.join()
+
+# =========================================================
+# 探索前の見積もり（解析開始の前に所要時間を出す）
+#   k ごとに組み合わせを最大 samples 個（少なければ全部）実際に試し、
+#   塗り替え直後に消えない組み合わせの割合・起点候補数・1組み合わせの評価時間を測る。
+#   そこから全探索の有効パターン数・試行数・所要時間を見積もる（時間はこのマシンでの実測）。
+#   k は 0 ～ paint_count をすべて測るので、塗り替え数を減らしたときの見積もりにも使える。
+#   置換表なしの時間なので、置換表を使うと実際はもっと速い。
+# =========================================================
+PREFLIGHT_SAMPLES = 200
+
+
+def sample_combinations(n, k, samples, rng):
+    if comb(n, k) <= samples:
+        return list(combinations(range(n), k))
+    picks = set()
+    while len(picks) < samples:
+        picks.add(tuple(sorted(rng.sample(range(n), k))))
+    return sorted(picks)
+
+
+def estimate_search(base_field, nexts, paint_color, paint_count, min_k,
+                    engine="bitboard", workers=1, samples=PREFLIGHT_SAMPLES, seed=0, prune=False):
+    if has_any_erase_global(base_field):
+        return None
+
+    recolor_cands = compute_recolor_candidates(base_field, paint_color)
+    base_start_cands = compute_start_candidates(base_field)
+    spare = []
+    if prune:
+        # 探索と同じく影響範囲の外の候補は列挙しない
+        recolor_cands, spare = prune_recolor_candidates(
+            base_field, nexts, paint_color, recolor_cands, base_start_cands
+        )
+    n = len(recolor_cands)
+
+    ctx = SimpleNamespace(
+        nexts=list(nexts),
+        base_start_cands=base_start_cands,
+        base_start_set=set(base_start_cands),
+        near_cells={pos: near_cells(pos) for pos in recolor_cands},
+    )
+    eng = get_engine(engine)
+    field = eng.encode(base_field)
+    rng = random.Random(seed)
+
+    per_k = {}
+    for k in range(0, min(paint_count, n) + 1):
+        picks = sample_combinations(n, k, samples, rng)
+        valid = 0
+        trials = 0
+        seconds = 0.0
+        for idx in picks:
+            # 列挙と同じく候補順に塗り、塗った直後に消えたらその組み合わせは無効
+            painted = []
+            erased = False
+            for i in idx:
+                r, c = recolor_cands[i]
+                eng.set_cell(field, r, c, paint_color)
+                painted.append((r, c))
+                if eng.erases_at(field, r, c):
+                    erased = True
+                    break
+            if not erased:
+                t = time.perf_counter()
+                _, n_starts = evaluate_combination(
+                    eng, ctx, field, tuple(recolor_cands[i] for i in idx)
+                )
+                seconds += time.perf_counter() - t
+                valid += 1
+                trials += n_starts
+            for r, c in painted:
+                eng.set_cell(field, r, c, base_field[r][c])
+
+        total = comb(n, k)
+        per_k[k] = {
+            "patterns": total,
+            "valid_patterns": round(total * valid / len(picks)),
+            "trials": round(total * trials / len(picks)),
+            "seconds": total * seconds / len(picks),
+            "exact": total <= samples,
+        }
+
+    return {
+        "recolor_candidates": n + len(spare),
+        "start_candidates": len(base_start_cands),
+        "pruned_candidates": len(spare),
+        "per_k": per_k,
+        **summarize_estimate(per_k, min_k, paint_count, workers, len(spare)),
+    }
+
+
+# pruned：外した候補の数（それを足して min_k 以上になる組み合わせも列挙する）
+def summarize_estimate(per_k, min_k, paint_count, workers=1, pruned=0):
+    ks = [k for k in per_k if max(0, min_k - pruned) <= k <= paint_count]
+    patterns = sum(per_k[k]["patterns"] for k in ks)
+    valid = sum(per_k[k]["valid_patterns"] for k in ks)
+    trials = sum(per_k[k]["trials"] for k in ks)
+    return {
+        "patterns": patterns,
+        "valid_patterns": valid,
+        "trials": trials,
+        "trials_per_pattern": trials / valid if valid else 0.0,
+        # 並列は理想的に割れたとして
+        "seconds": sum(per_k[k]["seconds"] for k in ks) / max(1, workers),
+    }
+
+
+# 全色スイープの見積もり：色ごとの見積もり（per_color）と、その合計
+#   確定盤面の時点で消えるなら None（塗る色によらない）
+def estimate_sweep(base_field, nexts, paint_colors, paint_count, min_k,
+                   engine="bitboard", workers=1, samples=PREFLIGHT_SAMPLES, seed=0, prune=False):
+    per_color = {}
+    for color in paint_colors:
+        est = estimate_search(
+            base_field, nexts, color, paint_count, min_k, engine, workers, samples, seed, prune
+        )
+        if est is None:
+            return None
+        per_color[color] = est
+
+    total = {
+        key: sum(est[key] for est in per_color.values())
+        for key in ("patterns", "valid_patterns", "trials", "seconds")
+    }
+    total["trials_per_pattern"] = (
+        total["trials"] / total["valid_patterns"] if total["valid_patterns"] else 0.0
+    )
+    return {"per_color": per_color, **total}
+
+
+# 見積もりが limit 秒に収まる、いちばん大きい塗り替え数（無ければ None）
+#   estimate は estimate_search か estimate_sweep の戻り値（スイープなら全色の合計で見る）
+def suggest_paint_count(estimate, paint_count, limit, workers=1):
+    parts = list(estimate["per_color"].values()) if "per_color" in estimate else [estimate]
+    for count in range(paint_count - 1, -1, -1):
+        seconds = sum(
+            summarize_estimate(
+                est["per_k"], default_min_k(count), count, workers, est["pruned_candidates"]
+            )["seconds"]
+            for est in parts
+        )
+        if seconds <= limit:
+            return count
+    return None
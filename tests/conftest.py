@@ -0,0 +1,36 @@
+# =========================================================
+# テスト共通（リポジトリ直下のモジュールを import できるようにする＋盤面づくり）
+# =========================================================
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import bench
+from engine import COLS, NORMAL_COLORS, ROWS
+
+
+# 下詰め済みのランダム盤面（列ごとの高さ・ハートの割合は rng で）
+def random_field(rng, min_height=1, max_height=ROWS, heart_rate=0.1):
+    return bench.random_board(rng, min_height, max_height, heart_rate)
+
+
+def random_nexts(rng):
+    return [rng.choice(NORMAL_COLORS) for _ in range(COLS)]
+
+
+def occupied_cells(field):
+    return [(r, c) for r in range(ROWS) for c in range(COLS) if field[r][c] != "空"]
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    return bench.load_corpus()
+
+
+@pytest.fixture
+def rng():
+    return random.Random(12345)
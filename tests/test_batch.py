@@ -0,0 +1,122 @@
+# =========================================================
+# バッチ解析 CLI（入力チェック・1行ずつの出力）
+# =========================================================
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import batch
+from batch import parse_request, solve_lines
+from search import run_search, run_sweep
+from test_search import PAINT_COLORS
+
+
+def request(item, **fields):
+    obj = {"id": item["id"], "board": item["board"], "nexts": item["nexts"],
+           "paint_color": item["paint_color"], "paint_count": 2}
+    obj.update(fields)
+    return obj
+
+
+def run_lines(objs, **kwargs):
+    out = io.StringIO()
+    lines = [obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False) for obj in objs]
+    solve_lines(lines, out, **kwargs)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_parse_request_accepts_valid_lines(corpus):
+    item = corpus[0]
+    board, nexts, color, count, min_k, mc = parse_request(request(item))
+    assert (board, nexts, color, count, mc) == (item["board"], item["nexts"], item["paint_color"], 2, None)
+    assert min_k == batch.default_min_k(2)
+
+    _, _, color, _, _, _ = parse_request(request(item, paint_color=PAINT_COLORS))
+    assert color == PAINT_COLORS
+    mc = parse_request(request(item, nexts=[None] + item["nexts"][1:], samples=10, seed=3))[5]
+    assert mc == {"samples": 10, "seed": 3}
+
+
+@pytest.mark.parametrize("fields", [
+    {"paint_count": True},
+    {"paint_count": False},
+    {"paint_count": 2.0},
+    {"paint_count": 13},
+    {"min_k": True},
+    {"min_k": 3},
+    {"paint_color": "空"},
+    {"paint_color": []},
+    {"board": [["赤"] * 8] * 5},
+    {"board": [["橙"] * 8] * 6},
+    {"nexts": ["赤"] * 7},
+    {"nexts": ["ハート"] * 8},
+    {"nexts": [None] * 8, "samples": True},
+    {"nexts": [None] * 8, "samples": 0},
+    {"nexts": [None] * 8, "seed": False},
+    {"nexts": [None] * 8, "paint_color": ["赤", "青"]},
+])
+def test_parse_request_rejects_bad_fields(corpus, fields):
+    with pytest.raises(ValueError):
+        parse_request(request(corpus[0], **fields))
+
+
+def test_solve_lines_matches_searches(corpus):
+    objs = [request(item) for item in corpus[:4]]
+    objs += ["", "{broken", "[1, 2]", request(corpus[0], paint_count=True)]
+    objs.append(request(corpus[1], paint_color=PAINT_COLORS, paint_count=1, min_k=0))
+    records = run_lines(objs, top_k=5)
+
+    assert [r["line"] for r in records] == [1, 2, 3, 4, 6, 7, 8, 9]
+    for item, record in zip(corpus, records[:4]):
+        assert record["id"] == item["id"]
+        expected, info = run_search(item["board"], item["nexts"], item["paint_color"], 2,
+                                    batch.default_min_k(2), top_k=5)
+        # JSON を通るので座標は list になる
+        assert record["results"] == json.loads(json.dumps(expected))
+        assert record["info"]["patterns"] == info["patterns"]
+    assert all("error" in r and "results" not in r for r in records[4:7])
+    assert records[6]["id"] == corpus[0]["id"]
+
+    expected, _ = run_sweep(corpus[1]["board"], corpus[1]["nexts"], PAINT_COLORS, 1, 0, top_k=5)
+    assert records[7]["results"] == json.loads(json.dumps(expected))
+
+
+def test_stream_and_cache(tmp_path, corpus):
+    objs = [request(item) for item in corpus[:3]]
+    streamed = run_lines(objs, stream=True)
+    final = [r for r in streamed if "best" not in r]
+    assert len(final) == 3
+
+    cache = batch.ResultCache(str(tmp_path / "cache.sqlite3"))
+    first = run_lines(objs, cache=cache)
+    second = run_lines(objs, cache=cache)
+    assert [r["results"] for r in first] == [r["results"] for r in final]
+    assert [r["results"] for r in second] == [r["results"] for r in first]
+    assert all(r["info"].get("cached") for r in second)
+
+
+def test_main_reads_and_writes_files(tmp_path, corpus):
+    src = tmp_path / "in.jsonl"
+    dst = tmp_path / "out.jsonl"
+    src.write_text("\n".join(json.dumps(request(item), ensure_ascii=False) for item in corpus[:2]),
+                   encoding="utf-8")
+    batch.main([str(src), "-o", str(dst), "--top-k", "5", "--tt-size", "100"])
+    records = [json.loads(line) for line in dst.read_text(encoding="utf-8").splitlines()]
+    assert [r["id"] for r in records] == [item["id"] for item in corpus[:2]]
+
+    with pytest.raises(SystemExit):
+        batch.main([str(src), "--verify-prune"])
+    with pytest.raises(SystemExit):
+        batch.main([str(src), "--engine", "list", "--tt-size", "100"])
+
+
+def test_import_does_not_load_numpy():
+    # numpy は numpy エンジンを使うときだけ読む（CLI の起動を重くしない）
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, batch; print('numpy' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
@@ -0,0 +1,93 @@
+# =========================================================
+# 盤面の詰めた表現・共有コード・Undo 差分
+# =========================================================
+import random
+
+import pytest
+
+import boardcode
+from boardcode import (
+    CELLS,
+    apply_diff,
+    board_from_code,
+    board_to_code,
+    decode_board,
+    encode_board,
+    filled_board,
+    set_board_cell,
+    undo_diff,
+)
+from conftest import random_field
+from engine import COLORS, COLS, ROWS
+
+
+def random_boards(seed, n=100):
+    rng = random.Random(seed)
+    boards = [filled_board(color) for color in COLORS]
+    boards += [encode_board(random_field(rng, 0, ROWS, rng.random())) for _ in range(n)]
+    return boards
+
+
+def test_board_round_trip():
+    rng = random.Random(1)
+    for _ in range(100):
+        field = random_field(rng, 0, ROWS, 0.3)
+        data = encode_board(field)
+        assert len(data) == CELLS
+        assert decode_board(data) == field
+    for color in COLORS:
+        assert decode_board(filled_board(color)) == [[color] * COLS for _ in range(ROWS)]
+
+
+def test_share_code_round_trip():
+    for data in random_boards(2):
+        code = board_to_code(data)
+        assert len(code) == 24
+        assert board_from_code(code) == data
+        # 前後の空白は無視する
+        assert board_from_code(" %s\n" % code) == data
+
+
+@pytest.mark.parametrize("code", ["", "!!!!", "A" * 20, "A" * 28, "あ" * 24])
+def test_bad_share_code_is_rejected(code):
+    with pytest.raises(ValueError):
+        board_from_code(code)
+
+
+def test_unknown_color_in_share_code_is_rejected():
+    # 3ビットに収まるが COLORS に無い値
+    assert len(COLORS) < 1 << boardcode.CODE_BITS
+    n = len(COLORS)
+    raw = n.to_bytes(boardcode.CODE_BYTES, "little")
+    code = boardcode.base64.urlsafe_b64encode(raw).decode("ascii")
+    with pytest.raises(ValueError):
+        board_from_code(code)
+
+
+def test_set_cell_and_undo_diff():
+    rng = random.Random(3)
+    data = filled_board("空")
+    history = []
+    for _ in range(300):
+        r, c = rng.randrange(ROWS), rng.randrange(COLS)
+        new = set_board_cell(data, r, c, rng.choice(COLORS))
+        expected = decode_board(data)
+        expected[r][c] = COLORS[new[r * COLS + c]]
+        assert decode_board(new) == expected
+        history.append((data, undo_diff(data, new)))
+        data = new
+
+    # 差分を逆順に当てると元の盤面に戻っていく
+    for old, diff in reversed(history):
+        assert len(diff) <= 1
+        data = apply_diff(data, diff)
+        assert data == old
+    assert data == filled_board("空")
+
+
+def test_undo_diff_between_arbitrary_boards():
+    boards = random_boards(4, 30)
+    for old, new in zip(boards, boards[1:]):
+        diff = undo_diff(old, new)
+        assert apply_diff(new, diff) == old
+        assert len(diff) == sum(a != b for a, b in zip(old, new))
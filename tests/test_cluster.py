@@ -0,0 +1,100 @@
+# =========================================================
+# 複数マシンでの探索（ワーカーは同じプロセスのスレッドでつなぐ）
+# =========================================================
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import bench
+from cluster import Coordinator, build_ctx, read_messages, run_worker, send_message, shard_spec
+from resultcache import ENGINE_VERSION
+from search import prepare_search, run_search, run_sweep
+from test_search import PAINT_COLORS, PRUNE_CASES, search_args
+
+
+def start_thread_workers(coord, n, token=None):
+    for i in range(n):
+        threading.Thread(target=run_worker, args=(coord.address, f"t{i}", token), daemon=True).start()
+
+
+def wait_for_workers(coord, n):
+    deadline = time.time() + 10
+    while coord.size() < n:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cluster():
+    with Coordinator() as coord:
+        start_thread_workers(coord, 2)
+        wait_for_workers(coord, 2)
+        yield coord
+
+
+def test_spec_rebuilds_same_ctx(corpus):
+    item = corpus[3]
+    base = bench.bench_base(item["board"])
+    plan = prepare_search(*search_args(item, 2), base, "bitboard", 1, 100, False, None, 5,
+                          time.time())
+    ctx = build_ctx(shard_spec(plan.ctx))
+    assert ctx.recolor_cands == plan.ctx.recolor_cands
+    assert ctx.base_start_cands == plan.ctx.base_start_cands
+    assert (ctx.tt_size, ctx.top_k) == (100, 5)
+
+
+@pytest.mark.parametrize("options", [{}, {"tt_size": 1000}, {"time_budget": 600}])
+def test_search_matches_serial(cluster, corpus, options):
+    for item in corpus[::3]:
+        base = bench.bench_base(item["board"])
+        serial, serial_info = run_search(*search_args(item, 2), base=base, top_k=10)
+        results, info = run_search(*search_args(item, 2), base=base, top_k=10, cluster=cluster, **options)
+        assert results == serial, item["id"]
+        assert info["patterns"] == serial_info["patterns"]
+        assert info["cluster"]["shards"] >= 1
+
+
+def test_prune_and_sweep_match_serial(cluster):
+    case = PRUNE_CASES[0]
+    base = SimpleNamespace(erase=False, start_cands=case["starts"])
+    args = (case["board"], case["nexts"], case["paint_color"], 2, 0)
+    serial, _ = run_search(*args, base=base, top_k=10)
+    results, info = run_search(*args, base=base, top_k=10, prune=True, verify=True, cluster=cluster)
+    assert results == serial and info["verified"]
+
+    args = (case["board"], case["nexts"], PAINT_COLORS, 1, 0)
+    serial, _ = run_sweep(*args, base=base, top_k=5)
+    assert run_sweep(*args, base=base, top_k=5, cluster=cluster)[0] == serial
+
+
+def test_lost_worker_shard_is_reassigned(corpus):
+    item = corpus[3]
+    base = bench.bench_base(item["board"])
+    serial, _ = run_search(*search_args(item, 2), base=base)
+
+    with Coordinator() as coord:
+        # 最初のシャードを受け取ったところで切れるワーカー
+        def flaky():
+            sock = socket.create_connection(coord.address)
+            send_message(sock, {"type": "hello", "name": "flaky", "version": ENGINE_VERSION})
+            messages = read_messages(sock)
+            assert next(messages)["type"] == "welcome"
+            assert next(messages)["type"] == "job"
+            sock.close()
+            start_thread_workers(coord, 1)
+
+        threading.Thread(target=flaky, daemon=True).start()
+        wait_for_workers(coord, 1)
+        results, info = run_search(*search_args(item, 2), base=base, cluster=coord)
+    assert results == serial
+    assert info["cluster"]["reassigned"] >= 1
+
+
+def test_wrong_token_is_rejected():
+    with Coordinator(token="secret") as coord:
+        with pytest.raises(RuntimeError):
+            run_worker(coord.address, "w", token="nope")
+        assert coord.size() == 0
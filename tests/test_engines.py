@@ -0,0 +1,129 @@
+# =========================================================
+# エンジンの突き合わせ（bitboard / colboard / npsim を engine.py と比べる）
+# =========================================================
+import random
+
+import pytest
+
+import bitboard
+import colboard
+import engine
+from conftest import occupied_cells, random_field, random_nexts
+from engine import COLS, ROWS
+
+PAINT_COLORS = engine.NORMAL_COLORS + ["ハート"]
+
+
+# ランダム盤面（消える盤面も混ぜる）×起点×塗り替え扱いのマス
+def sim_cases(seed=1, boards=60, starts=6):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(boards):
+        field = random_field(rng, 1, ROWS, rng.choice([0.0, 0.1, 0.4]))
+        nexts = random_nexts(rng)
+        cells = occupied_cells(field)
+        for sp in rng.sample(cells, min(starts, len(cells))) + [(0, rng.randrange(COLS))]:
+            recolored = set(rng.sample(cells, min(len(cells), rng.randint(0, 3))))
+            cases.append((field, nexts, recolored, sp))
+    return cases
+
+
+CASES = sim_cases()
+
+
+def test_cases_have_chains():
+    # 連鎖の起きるケースが無いと突き合わせにならない
+    chained = sum(
+        engine.simulate_with_start_scoring(f, nexts, rec, sp)[0] >= 1 for f, nexts, rec, sp in CASES
+    )
+    assert chained >= len(CASES) // 10
+
+
+def test_encode_round_trip():
+    rng = random.Random(2)
+    for _ in range(50):
+        field = random_field(rng, 0, ROWS, 0.3)
+        assert bitboard.decode(bitboard.encode(field)) == field
+        assert colboard.decode(colboard.encode(field)) == field
+
+
+def test_bitboard_simulate_matches_engine():
+    for f, nexts, rec, sp in CASES:
+        expected = engine.simulate_with_start_scoring(f, nexts, rec, sp)
+        board = bitboard.encode(f)
+        mask = bitboard.cells_mask(rec)
+        assert bitboard.simulate_with_start_scoring(board, nexts, mask, sp) == expected
+        prep = bitboard.prepare_start_trials(board, nexts)
+        assert bitboard.simulate_prepared(prep, mask, sp) == expected
+
+
+def test_colboard_simulate_matches_engine():
+    for f, nexts, rec, sp in CASES:
+        expected = engine.simulate_with_start_scoring(f, nexts, rec, sp)
+        cols = colboard.encode(f)
+        assert colboard.simulate_with_start_scoring(cols, nexts, rec, sp) == expected
+        prep = colboard.prepare_start_trials(cols, nexts)
+        assert colboard.simulate_prepared(prep, rec, sp) == expected
+
+
+def test_start_classes_and_tt_match_single_trials():
+    from ttable import TranspositionTable
+
+    tt = TranspositionTable(64)
+    rng = random.Random(3)
+    for _ in range(40):
+        f = random_field(rng, 2, ROWS, 0.1)
+        nexts = random_nexts(rng)
+        board = bitboard.encode(f)
+        prep = bitboard.prepare_start_trials(board, nexts)
+        starts = occupied_cells(f) + [(0, 0)]
+        mask = bitboard.cells_mask(occupied_cells(f)[:2])
+        expected = [bitboard.simulate_prepared(prep, mask, sp) for sp in starts]
+        sims, n_classes = bitboard.simulate_start_classes(prep, mask, starts)
+        assert sims == expected
+        assert n_classes <= len(starts)
+        assert bitboard.simulate_start_classes(prep, mask, starts, tt)[0] == expected
+        assert [bitboard.simulate_with_tt(prep, mask, sp, tt) for sp in starts] == expected
+    assert tt.hits > 0 and tt.evictions > 0
+
+
+def test_numpy_simulate_matches_engine():
+    np = pytest.importorskip("numpy")
+    import npsim
+
+    boards = npsim.encode_fields([f for f, _, _, _ in CASES])
+    nexts = np.stack([npsim.encode_colors(n) for _, n, _, _ in CASES])
+    recolored = np.stack([npsim.mask_to_array(bitboard.cells_mask(rec)) for _, _, rec, _ in CASES])
+    res = npsim.simulate_batch(boards, nexts, [sp for _, _, _, sp in CASES], recolored)
+    got = list(zip(*(a.tolist() for a in res)))
+    for (f, n, rec, sp), sim in zip(CASES, got):
+        chains, score, maxsim, ok = engine.simulate_with_start_scoring(f, n, rec, sp)
+        assert sim == (chains, score, maxsim, ok)
+
+
+def test_candidates_match_engine():
+    rng = random.Random(4)
+    for _ in range(60):
+        f = random_field(rng, 1, ROWS, rng.choice([0.0, 0.2]))
+        board = bitboard.encode(f)
+        erase = engine.has_any_erase_global(f)
+        assert bitboard.has_any_erase_global(board) == erase
+        assert bitboard.compute_start_candidates(board) == engine.compute_start_candidates(f)
+        for color in PAINT_COLORS:
+            expected = engine.compute_recolor_candidates(f, color)
+            assert bitboard.compute_recolor_candidates(board, color) == expected
+
+
+def test_component_index_follows_edits():
+    rng = random.Random(5)
+    f = random_field(rng, 3, ROWS, 0.1)
+    index = engine.ComponentIndex(f)
+    for _ in range(200):
+        r, c = rng.randrange(ROWS), rng.randrange(COLS)
+        color = rng.choice(PAINT_COLORS)
+        f[r][c] = color
+        index.set_cell(r, c, color)
+        assert index.erases_at(r, c) == engine.erases_at(f, r, c)
+        pos = (rng.randrange(ROWS), rng.randrange(COLS))
+        assert index.is_good_start_candidate(pos) == engine.is_good_start_candidate(f, pos)
+
@@ -0,0 +1,124 @@
+# =========================================================
+# バックグラウンド探索（SearchJob）
+# =========================================================
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import bench
+import jobs
+from jobs import SearchJob
+from search import run_search, run_sweep
+from test_search import PAINT_COLORS, search_args
+
+
+def wait(job):
+    job.thread.join(60)
+    assert job.finished
+
+
+def test_job_returns_run_search_result(corpus):
+    item = corpus[3]
+    base = bench.bench_base(item["board"])
+    job = SearchJob(*search_args(item, 2), base=base, top_k=5).start()
+    wait(job)
+    assert job.status == "done" and job.error is None
+    expected, info = run_search(*search_args(item, 2), base=base, top_k=5)
+    assert job.results == expected
+    assert job.best == expected
+    assert job.info["patterns"] == info["patterns"]
+
+
+def test_job_runs_sweep(corpus):
+    item = corpus[1]
+    args = (item["board"], item["nexts"], PAINT_COLORS, 1, 0)
+    base = bench.bench_base(item["board"])
+    job = SearchJob(*args, search=run_sweep, base=base).start()
+    wait(job)
+    assert job.status == "done"
+    assert job.results == run_sweep(*args, base=base)[0]
+
+
+def test_cancel_while_running(corpus):
+    item = corpus[3]
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_search(*args, cancel=None, **kwargs):
+        started.set()
+        release.wait(10)
+        return run_search(*args, cancel=cancel, **kwargs)
+
+    job = SearchJob(*search_args(item, 2), search=slow_search, base=bench.bench_base(item["board"])).start()
+    assert started.wait(10)
+    assert job.status == "running"
+    job.cancel()
+    release.set()
+    wait(job)
+    assert job.status == "cancelled" and job.info["cancelled"]
+
+
+def test_queued_job_waits_for_a_slot_and_can_be_cancelled(corpus, monkeypatch):
+    monkeypatch.setattr(jobs, "_search_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(jobs, "QUEUE_POLL", 0.01)
+    release = threading.Event()
+
+    def blocking_search(*args, **kwargs):
+        release.wait(10)
+        return [], {}
+
+    first = SearchJob(search=blocking_search).start()
+    second = SearchJob(search=blocking_search).start()
+    second.thread.join(0.1)
+    assert second.status == "queued"
+    second.cancel()
+    wait(second)
+    assert second.status == "cancelled" and second.results == []
+
+    third = SearchJob(search=blocking_search).start()
+    release.set()
+    wait(first)
+    wait(third)
+    assert first.status == third.status == "done"
+
+
+def test_error_is_kept(corpus):
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    job = SearchJob(search=broken).start()
+    wait(job)
+    assert job.status == "error" and str(job.error) == "boom"
+    # 枠は返っている
+    assert jobs._search_slots.acquire(timeout=1)
+    jobs._search_slots.release()
+
+
+@pytest.mark.parametrize("status, finished", [
+    ("queued", False), ("running", False), ("done", True), ("cancelled", True), ("error", True),
+])
+def test_finished(status, finished):
+    job = SearchJob()
+    job.status = status
+    assert job.finished == finished
+
+
+@pytest.mark.parametrize("search", [run_search, run_sweep])
+def test_cancel_stops_worker_processes(corpus, search):
+    # 並列探索を中断したら、走っていたシャードのプロセスも残らない
+    item = corpus[3]
+    color = PAINT_COLORS if search is run_sweep else item["paint_color"]
+    job = SearchJob(item["board"], item["nexts"], color, 8, 0, search=search, workers=2,
+                    base=bench.bench_base(item["board"])).start()
+    deadline = time.time() + 60
+    while not multiprocessing.active_children():
+        assert time.time() < deadline
+        time.sleep(0.05)
+    time.sleep(1.0)
+    assert not job.finished
+    job.cancel()
+    wait(job)
+    assert job.status == "cancelled"
+    assert multiprocessing.active_children() == []
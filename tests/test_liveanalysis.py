@@ -0,0 +1,67 @@
+# =========================================================
+# 編集中の盤面の下調べ（LiveAnalysis を作り直した結果と比べる）
+# =========================================================
+import random
+
+import engine
+from boardcode import decode_board, encode_board, filled_board, set_board_cell
+from conftest import random_field
+from engine import COLORS, COLS, ROWS
+from liveanalysis import REBUILD_CELLS, LiveAnalysis
+
+PAINT_COLORS = engine.NORMAL_COLORS + ["ハート"]
+
+
+def check(live, data):
+    field = decode_board(data)
+    erase = engine.has_any_erase_global(field)
+    assert live.erase == erase
+    if erase:
+        assert live.start_count() is None
+        assert all(live.recolor_count(color) is None for color in PAINT_COLORS)
+        return
+    assert live.start == set(engine.compute_start_candidates(field))
+    for color in PAINT_COLORS:
+        assert live.recolor[color] == set(engine.compute_recolor_candidates(field, color))
+
+
+def test_single_cell_edits_match_full_count():
+    rng = random.Random(1)
+    for seed in range(5):
+        data = encode_board(random_field(random.Random(seed), 0, ROWS, 0.1))
+        live = LiveAnalysis(data, PAINT_COLORS)
+        check(live, data)
+        for _ in range(150):
+            r, c = rng.randrange(ROWS), rng.randrange(COLS)
+            # 空マスを多めにして消える／消えないを行き来させる
+            color = rng.choice(COLORS + ["空"] * 2)
+            data = set_board_cell(data, r, c, color)
+            live.update(data)
+            check(live, data)
+
+
+def test_bulk_changes_rebuild():
+    rng = random.Random(2)
+    data = filled_board("空")
+    live = LiveAnalysis(data, PAINT_COLORS)
+    check(live, data)
+    for n in (REBUILD_CELLS, REBUILD_CELLS + 1, 30):
+        for _ in range(10):
+            buf = bytearray(data)
+            for i in rng.sample(range(ROWS * COLS), n):
+                buf[i] = rng.randrange(len(COLORS))
+            data = bytes(buf)
+            live.update(data)
+            check(live, data)
+        live.update(filled_board("空"))
+        data = filled_board("空")
+        check(live, data)
+
+
+def test_unchanged_board_is_noop():
+    data = encode_board(random_field(random.Random(3), 2, ROWS, 0.1))
+    live = LiveAnalysis(data, PAINT_COLORS)
+    index = live.index
+    live.update(data)
+    assert live.index is index
+    check(live, data)
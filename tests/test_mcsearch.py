@@ -0,0 +1,145 @@
+# =========================================================
+# 期待値探索（run_mc_search をサンプルごとの素朴なシミュレーションと比べる）
+#   起点候補は test_search と同じく base= で渡す。
+# =========================================================
+from itertools import combinations
+import random
+import threading
+
+import pytest
+
+import bench
+import engine
+from colboard import CODE_COLORS
+from conftest import random_field, random_nexts
+from engine import COLS, ROWS
+from mcsearch import mc_key, run_mc_search, sample_nexts
+from search import run_search
+
+PAINT_COLORS = engine.NORMAL_COLORS + ["ハート"]
+
+
+# 組み合わせ・起点の並びは bench.reference_search と同じ
+def reference_mc(base_field, nexts, paint_color, paint_count, min_k, samples, seed,
+                 base_start_cands, top_k):
+    unknown, draws = sample_nexts(nexts, samples, seed)
+    recolor_cands = engine.compute_recolor_candidates(base_field, paint_color)
+    best = []
+    for k in range(min_k, paint_count + 1):
+        for combi in combinations(recolor_cands, k):
+            field = engine.copy_field(base_field)
+            changed = set(combi)
+            for r, c in combi:
+                field[r][c] = paint_color
+            if engine.local_has_erase_after_recolor(field, changed):
+                continue
+
+            near = set()
+            for r, c in changed:
+                near.add((r, c))
+                near.update(
+                    (r + dr, c + dc) for dr, dc in engine.DIR4
+                    if 0 <= r + dr < ROWS and 0 <= c + dc < COLS
+                )
+            starts = list(base_start_cands) + [
+                pos for pos in near
+                if pos not in base_start_cands and engine.is_good_start_candidate(field, pos)
+            ]
+
+            best_local = None
+            for sp in starts:
+                s1 = s2 = c1 = chain_w = 0
+                for draw, w in draws:
+                    full = list(nexts)
+                    for c, v in zip(unknown, draw):
+                        full[c] = CODE_COLORS[v]
+                    chains, score, _, ok = engine.simulate_with_start_scoring(field, full, changed, sp)
+                    if not ok:
+                        break
+                    s1 += w * score
+                    s2 += w * score * score
+                    c1 += w * chains
+                    chain_w += w if chains >= 1 else 0
+                if not chain_w:
+                    continue
+                cand = {
+                    "mean_score": s1 / samples,
+                    "score_var": (samples * s2 - s1 * s1) / (samples * samples),
+                    "chain_prob": chain_w / samples,
+                    "mean_chains": c1 / samples,
+                    "recolor": tuple(sorted(changed)),
+                    "start": sp,
+                }
+                if best_local is None or mc_key(cand) > mc_key(best_local):
+                    best_local = cand
+            if best_local is not None:
+                best.append(best_local)
+    return sorted(best, key=mc_key, reverse=True)[:top_k]
+
+
+def mc_cases(seed=1, n=12):
+    rng = random.Random(seed)
+    cases = []
+    while len(cases) < n:
+        field = random_field(rng, 2, ROWS, 0.1)
+        if engine.has_any_erase_global(field):
+            continue
+        nexts = random_nexts(rng)
+        for c in rng.sample(range(COLS), rng.randint(1, COLS)):
+            nexts[c] = None
+        cases.append((field, nexts, rng.choice(PAINT_COLORS)))
+    return cases
+
+
+@pytest.mark.parametrize("case", mc_cases())
+def test_matches_per_sample_simulation(case):
+    field, nexts, color = case
+    base = bench.bench_base(field)
+    expected = reference_mc(field, nexts, color, 1, 0, 30, 5, base.start_cands, 10)
+    results, info = run_mc_search(field, nexts, color, 1, 0, samples=30, seed=5, base=base, top_k=10)
+    assert results == expected
+    assert info["coverage"] == 1
+    mc = info["mc"]
+    assert mc["samples"] == 30 and mc["distinct"] <= 30
+
+
+def test_cases_have_results_and_shared_draws():
+    found = shared = 0
+    for field, nexts, color in mc_cases():
+        results, info = run_mc_search(field, nexts, color, 1, 0, samples=30, seed=5,
+                                      base=bench.bench_base(field))
+        found += bool(results)
+        shared += info["mc"]["shared_draws"]
+    assert found >= 6 and shared > 0
+
+
+def test_known_nexts_match_run_search(corpus):
+    # ネクストがすべて分かっていれば1通りだけで、得点は run_search と同じ
+    for item in corpus[:6]:
+        base = bench.bench_base(item["board"])
+        args = (item["board"], item["nexts"], item["paint_color"], 2, 0)
+        results, info = run_mc_search(*args, samples=50, base=base, top_k=100)
+        plain, _ = run_search(*args, base=base, top_k=100)
+        assert info["mc"]["distinct"] == 1
+        assert [r["mean_score"] for r in results] == [r["score"] for r in plain]
+        assert all(r["chain_prob"] == 1 and r["score_var"] == 0 for r in results)
+
+
+def test_sampling_is_seeded():
+    nexts = [None, "赤", None, "青", None, None, "緑", None]
+    assert sample_nexts(nexts, 100, seed=3) == sample_nexts(nexts, 100, seed=3)
+    unknown, draws = sample_nexts(nexts, 100, seed=3)
+    assert unknown == [0, 2, 4, 5, 7]
+    assert sum(w for _, w in draws) == 100
+    assert sample_nexts(["赤"] * COLS, 100)[1] == [((), 100)]
+
+
+def test_bad_samples_and_cancel():
+    field, nexts, color = mc_cases(n=1)[0]
+    with pytest.raises(ValueError):
+        run_mc_search(field, nexts, color, 1, 0, samples=0)
+    cancel = threading.Event()
+    cancel.set()
+    _, info = run_mc_search(field, nexts, color, 2, 0, samples=10, cancel=cancel,
+                            base=bench.bench_base(field))
+    assert info["cancelled"] and info["coverage"] < 1
@@ -0,0 +1,114 @@
+# =========================================================
+# 探索結果の保存（ResultCache）
+# =========================================================
+from types import SimpleNamespace
+
+import pytest
+
+import bench
+import resultcache
+from resultcache import ResultCache, cache_key
+from search import default_min_k, run_search, run_sweep
+from test_search import PAINT_COLORS
+
+
+def search_key(item, top_k=3):
+    return cache_key(item["board"], item["nexts"], item["paint_color"], 2, default_min_k(2), top_k,
+                     bench.bench_base(item["board"]).start_cands)
+
+
+def test_round_trip_matches_run_search(tmp_path, corpus):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    stored = 0
+    for item in corpus:
+        results, info = run_search(item["board"], item["nexts"], item["paint_color"], 2,
+                                   default_min_k(2), base=bench.bench_base(item["board"]),
+                                   profile=True)
+        key = search_key(item)
+        assert cache.get(key) is None
+        cache.put(key, results, info)
+        stored += bool(results)
+
+        got, got_info = cache.get(key)
+        # 座標は tuple に戻る
+        assert got == results
+        assert got_info.pop("cached") is True
+        assert got_info == {name: info[name] for name in resultcache.INFO_KEYS if name in info}
+        assert "profile" not in got_info
+    assert stored
+
+    # 別の接続（再起動後）からも読める
+    reopened = ResultCache(cache.path)
+    assert reopened.get(search_key(corpus[0])) is not None
+
+
+def test_key_distinguishes_inputs(corpus):
+    item = corpus[0]
+    key = search_key(item)
+    assert key == search_key(dict(item))
+    assert key != search_key(item, top_k=10)
+    starts = bench.bench_base(item["board"]).start_cands
+    assert key != cache_key(item["board"], item["nexts"], "ハート", 2, default_min_k(2), 3, starts)
+    assert key != cache_key(item["board"], item["nexts"][::-1], item["paint_color"], 2,
+                            default_min_k(2), 3, starts)
+    assert key != cache_key(item["board"], item["nexts"], item["paint_color"], 2,
+                            default_min_k(2), 3, starts[::-1])
+    assert key != cache_key(item["board"], item["nexts"], item["paint_color"], 2,
+                            default_min_k(2), 3, [])
+
+
+@pytest.mark.parametrize("search", [run_search, run_sweep])
+def test_different_start_candidates_are_cached_apart(tmp_path, corpus, search):
+    # 同じ盤面でも base= の起点候補が違えば、別の探索として保存する
+    item = corpus[3]
+    color = PAINT_COLORS if search is run_sweep else item["paint_color"]
+    args = (item["board"], item["nexts"], color, 2, 0)
+    starts = bench.bench_base(item["board"]).start_cands
+    bases = [SimpleNamespace(erase=False, start_cands=starts[:3]),
+             SimpleNamespace(erase=False, start_cands=starts[3:])]
+    expected = [search(*args, base=base, top_k=5)[0] for base in bases]
+    assert expected[0] != expected[1]
+
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    for _ in range(2):
+        for base, results in zip(bases, expected):
+            assert search(*args, base=base, top_k=5, cache=cache)[0] == results
+    for base in bases:
+        info = search(*args, base=base, top_k=5, cache=cache)[1]
+        cached = [x["info"] for x in info["per_color"].values()] if search is run_sweep else [info]
+        assert all(x.get("cached") for x in cached)
+    # base= 無し（盤面から求めた起点候補）の保存とも混ざらない
+    assert search(*args, top_k=5, cache=cache)[0] == search(*args, top_k=5)[0]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    info = {"reason": None, "patterns": 1}
+    cache.put("a", [], info)
+    cache.put("b", [], info)
+    assert cache.get("a") is not None   # a を使ったので b が一番古い
+    cache.put("c", [], info)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_other_engine_version_is_ignored(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("a", [], {"patterns": 1})
+    monkeypatch.setattr(resultcache, "ENGINE_VERSION", resultcache.ENGINE_VERSION + 1)
+    assert cache.get("a") is None
+    cache.put("b", [], {"patterns": 2})
+    monkeypatch.undo()
+    # 新しい版で保存したときに古い行は消えている
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize("top_k", [3, 10])
+def test_cached_results_keep_order(tmp_path, corpus, top_k):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    item = corpus[3]
+    results, info = run_search(item["board"], item["nexts"], item["paint_color"], 2,
+                               default_min_k(2), base=bench.bench_base(item["board"]), top_k=top_k)
+    assert len(results) > 1
+    cache.put(search_key(item, top_k), results, info)
+    assert cache.get(search_key(item, top_k))[0] == results
@@ -0,0 +1,310 @@
+# =========================================================
+# 探索の突き合わせ（元の実装 bench.reference_search と比べる）
+#   今の起点の判定では消えない盤面に起点候補が無いので、起点候補は
+#   base= で渡す（bench.bench_base と同じ）。
+# =========================================================
+from itertools import combinations
+from types import SimpleNamespace
+import random
+import threading
+
+import pytest
+
+import bench
+import engine
+import search
+from conftest import random_field, random_nexts
+from search import (
+    ENGINES,
+    TopK,
+    default_min_k,
+    iter_recolor_combinations,
+    merge_best,
+    run_search,
+    run_sweep,
+)
+
+PAINT_COLORS = engine.NORMAL_COLORS + ["ハート"]
+
+# 影響範囲の外の候補（spare）が出る盤面（ランダム盤面から拾ったもの）
+PRUNE_CASES = [
+    {
+        "board": [
+            ["空", "空", "空", "黄", "紫", "空", "紫", "紫"],
+            ["黄", "青", "緑", "紫", "黄", "緑", "ハート", "ハート"],
+            ["紫", "ハート", "青", "黄", "紫", "赤", "紫", "紫"],
+            ["紫", "赤", "黄", "黄", "紫", "黄", "ハート", "紫"],
+            ["黄", "黄", "赤", "青", "緑", "赤", "赤", "青"],
+            ["紫", "青", "紫", "ハート", "ハート", "赤", "青", "青"],
+        ],
+        "nexts": ["緑", "青", "赤", "赤", "赤", "黄", "緑", "緑"],
+        "paint_color": "赤",
+        "starts": [(5, 4), (2, 6)],
+    },
+    {
+        "board": [
+            ["赤", "空", "黄", "空", "空", "空", "空", "空"],
+            ["緑", "黄", "赤", "紫", "緑", "黄", "ハート", "ハート"],
+            ["黄", "緑", "黄", "青", "黄", "青", "紫", "紫"],
+            ["青", "緑", "赤", "青", "赤", "黄", "黄", "赤"],
+            ["紫", "赤", "赤", "黄", "赤", "赤", "青", "赤"],
+            ["緑", "紫", "ハート", "青", "青", "緑", "紫", "赤"],
+        ],
+        "nexts": ["青", "緑", "赤", "青", "赤", "赤", "赤", "赤"],
+        "paint_color": "赤",
+        "starts": [(5, 3), (1, 3)],
+    },
+]
+
+
+def search_args(item, paint_count):
+    return (item["board"], item["nexts"], item["paint_color"], paint_count, default_min_k(paint_count))
+
+
+def expected_top(item, paint_count):
+    base = bench.bench_base(item["board"])
+    return bench.reference_search(*search_args(item, paint_count), base_start_cands=base.start_cands)
+
+# =========================================================
+# 組み合わせの列挙
+# =========================================================
+def test_recolor_combinations_match_itertools():
+    rng = random.Random(1)
+    eng = ENGINES["bitboard"]
+    for _ in range(30):
+        field = random_field(rng, 2, engine.ROWS, 0.1)
+        if engine.has_any_erase_global(field):
+            continue
+        color = rng.choice(PAINT_COLORS)
+        cands = engine.compute_recolor_candidates(field, color)[:12]
+        for k in range(4):
+            expected = []
+            for rank, combi in enumerate(combinations(cands, k)):
+                f = engine.copy_field(field)
+                for r, c in combi:
+                    f[r][c] = color
+                if not engine.local_has_erase_after_recolor(f, set(combi)):
+                    expected.append((combi, rank))
+
+            board = eng.encode(field)
+            got = []
+            skipped = 0
+            for combi, rank, n_skip in iter_recolor_combinations(eng, board, field, cands, k, color):
+                skipped += n_skip
+                if combi is not None:
+                    got.append((combi, rank))
+            assert got == expected
+            assert len(got) + skipped == len(list(combinations(cands, k)))
+            # 列挙し終えたら盤面は元のまま
+            assert eng.decode(board) == field
+
+            # 順位範囲で分けても同じ
+            total = len(list(combinations(cands, k)))
+            parts = []
+            for lo in range(0, total, 7):
+                parts += [
+                    (combi, rank)
+                    for combi, rank, _ in iter_recolor_combinations(
+                        eng, board, field, cands, k, color, lo, min(total, lo + 7)
+                    )
+                    if combi is not None
+                ]
+            assert parts == expected
+
+# =========================================================
+# 元の実装との突き合わせ
+# =========================================================
+@pytest.mark.parametrize("paint_count", [1, 2])
+@pytest.mark.parametrize("engine_name", ["bitboard", "list", "column"])
+def test_engines_match_reference(corpus, engine_name, paint_count):
+    found = 0
+    for item in corpus:
+        expected = expected_top(item, paint_count)
+        found += bool(expected)
+        results, info = run_search(
+            *search_args(item, paint_count), engine=engine_name, base=bench.bench_base(item["board"])
+        )
+        assert results == expected, item["id"]
+        assert info["coverage"] == 1
+    assert found >= len(corpus) // 2
+
+
+def test_numpy_engine_matches_reference(corpus):
+    pytest.importorskip("numpy")
+    for item in corpus:
+        results, _ = run_search(*search_args(item, 2), engine="numpy", base=bench.bench_base(item["board"]))
+        assert results == expected_top(item, 2), item["id"]
+
+
+@pytest.mark.parametrize("options", [
+    {"tt_size": 1000},
+    {"tt_size": 8},
+    {"tt_size": 1000, "profile": True},
+    {"time_budget": 600},
+    {"time_budget": 600, "tt_size": 1000},
+])
+def test_options_match_reference(corpus, options):
+    for item in corpus:
+        results, info = run_search(*search_args(item, 2), base=bench.bench_base(item["board"]), **options)
+        assert results == expected_top(item, 2), item["id"]
+        assert not info.get("budget_expired")
+
+
+def test_larger_top_k_extends_top_3(corpus):
+    for item in corpus[::2]:
+        base = bench.bench_base(item["board"])
+        results, _ = run_search(*search_args(item, 2), base=base, top_k=20)
+        assert results[:3] == expected_top(item, 2)
+        assert run_search(*search_args(item, 2), base=base, top_k=20, tt_size=1000)[0] == results
+        assert run_search(*search_args(item, 2), base=base, top_k=20, engine="column")[0] == results
+
+
+def test_workers_match_serial(corpus):
+    # プロセスプール（spawn）は重いので盤面を絞る
+    for item in corpus[::4]:
+        base = bench.bench_base(item["board"])
+        serial, serial_info = run_search(*search_args(item, 2), base=base, top_k=10)
+        for options in ({}, {"tt_size": 1000}, {"time_budget": 600}):
+            results, info = run_search(*search_args(item, 2), base=base, top_k=10, workers=2, **options)
+            assert results == serial, (item["id"], options)
+            assert info["patterns"] == serial_info["patterns"]
+            assert info["trials"] == serial_info["trials"]
+
+# =========================================================
+# 影響範囲の絞り込み
+# =========================================================
+@pytest.mark.parametrize("case", PRUNE_CASES)
+def test_prune_matches_full_search(case):
+    base = SimpleNamespace(erase=False, start_cands=case["starts"])
+    args = (case["board"], case["nexts"], case["paint_color"], 2, 0)
+    cands = engine.compute_recolor_candidates(case["board"], case["paint_color"])
+    keep, spare = search.prune_recolor_candidates(
+        case["board"], case["nexts"], case["paint_color"], cands, case["starts"]
+    )
+    assert spare and len(keep) + len(spare) == len(cands)
+
+    full, full_info = run_search(*args, base=base, top_k=10)
+    assert full
+    for options in ({}, {"tt_size": 100}, {"time_budget": 600}, {"engine": "column"}):
+        results, info = run_search(*args, base=base, top_k=10, prune=True, **options)
+        assert results == full, options
+        assert info["pruned_candidates"] == len(spare)
+        assert info["full_patterns"] == full_info["patterns"]
+        assert info["patterns"] < info["full_patterns"]
+        assert info["coverage"] == 1
+
+    results, info = run_search(*args, base=base, top_k=10, prune=True, verify=True)
+    assert results == full and info["verified"]
+
+
+def test_prune_without_possible_starts_stops_early(corpus):
+    item = corpus[0]
+    results, info = run_search(*search_args(item, 2), prune=True)
+    assert results == [] and info["start_candidates"] == 0
+    assert info["pruned_candidates"] == info["recolor_candidates"]
+    assert "patterns" not in info
+    assert run_search(*search_args(item, 2))[0] == []
+
+
+def test_verify_catches_a_bad_region(monkeypatch):
+    case = PRUNE_CASES[0]
+    base = SimpleNamespace(erase=False, start_cands=case["starts"])
+    # 影響範囲を起点だけにすると上位が変わる → 検証で AssertionError
+    monkeypatch.setattr(search, "influence_region", lambda *a: set(a[-1]))
+    with pytest.raises(AssertionError):
+        run_search(case["board"], case["nexts"], case["paint_color"], 2, 0,
+                   base=base, top_k=10, prune=True, verify=True)
+
+# =========================================================
+# 時間制限・中断・逐次取り出し
+# =========================================================
+def test_time_budget_expires_with_partial_coverage(corpus):
+    item = corpus[3]
+    results, info = run_search(*search_args(item, 3), base=bench.bench_base(item["board"]),
+                               time_budget=1e-9)
+    assert info["budget_expired"]
+    assert 0 <= info["coverage"] < 1
+    assert len(results) <= search.TOP_N
+
+
+def test_cancel_returns_partial_results(corpus):
+    item = corpus[3]
+    cancel = threading.Event()
+    cancel.set()
+    _, info = run_search(*search_args(item, 2), base=bench.bench_base(item["board"]), cancel=cancel)
+    assert info["cancelled"] and info["coverage"] < 1
+
+
+def test_stream_search_ends_with_run_search_result(corpus):
+    item = corpus[4]
+    base = bench.bench_base(item["board"])
+    events = list(search.stream_search(*search_args(item, 2), base=base, top_k=5))
+    final, info = events[-1]
+    assert info is not None and all(i is None for _, i in events[:-1])
+    assert final == run_search(*search_args(item, 2), base=base, top_k=5)[0]
+    assert events[-2][0] == final
+
+# =========================================================
+# 上位の管理（TopK）
+# =========================================================
+@pytest.mark.parametrize("k", [1, 3, 100])
+def test_topk_matches_merge_best(k):
+    rng = random.Random(k)
+    top = TopK(k)
+    best = []
+    for i in range(2000):
+        order = (rng.randint(0, 3), i)
+        res = {"score": rng.randint(0, 10), "chains": rng.randint(1, 3), "maxsim": rng.randint(4, 6)}
+        accepted = top.accepts(order, res)
+        assert top.push(order, res) == accepted
+        best = merge_best(best, [(order, res)], k)
+        assert top.best() == best
+
+# =========================================================
+# 全色スイープ・見積もり
+# =========================================================
+def test_sweep_matches_per_color_searches(corpus):
+    for item in corpus[1::4]:
+        base = bench.bench_base(item["board"])
+        args = (item["board"], item["nexts"], PAINT_COLORS, 2, 0)
+        results, info = run_sweep(*args, base=base, top_k=5)
+
+        best = []
+        for i, color in enumerate(PAINT_COLORS):
+            per, _ = run_search(item["board"], item["nexts"], color, 2, 0, base=base, top_k=5)
+            assert info["per_color"][color]["results"] == per
+            best = merge_best(best, search.tag_color(i, color, per), 5)
+        assert results == [res for _, res in best]
+
+        parallel, parallel_info = run_sweep(*args, base=base, top_k=5, workers=2)
+        assert parallel == results
+        assert parallel_info["patterns"] == info["patterns"]
+
+
+def test_estimate_is_exact_for_small_searches(corpus):
+    item = corpus[0]
+    est = search.estimate_search(*search_args(item, 2), samples=10_000)
+    _, info = run_search(*search_args(item, 2))
+    assert est["patterns"] == info["patterns"]
+    assert all(entry["exact"] for entry in est["per_k"].values())
+
+    sweep = search.estimate_sweep(item["board"], item["nexts"], PAINT_COLORS, 2, 0)
+    assert sweep["patterns"] == sum(e["patterns"] for e in sweep["per_color"].values())
+    assert search.suggest_paint_count(sweep, 2, float("inf")) == 1
+    assert search.suggest_paint_count(sweep, 2, -1) is None
+
+
+def test_random_boards_match_reference():
+    rng = random.Random(9)
+    done = 0
+    while done < 15:
+        field = random_field(rng, 1, 4, 0.1)
+        if engine.has_any_erase_global(field):
+            continue
+        nexts = random_nexts(rng)
+        color = rng.choice(PAINT_COLORS)
+        base = bench.bench_base(field, 10)
+        expected = bench.reference_search(field, nexts, color, 2, 0, base_start_cands=base.start_cands)
+        for engine_name in ("bitboard", "list", "column"):
+            assert run_search(field, nexts, color, 2, 0, engine=engine_name, base=base)[0] == expected
+        done += 1
@@ -0,0 +1,56 @@
+# =========================================================
+# 置換表（起点消し後の盤面 → 連鎖結果）
+#   キーは Zobrist ハッシュ。衝突に備えて盤面そのものも持ち、照合する。
+#   件数上限を超えたら一番古く使われたものから捨てる（LRU）。
+# =========================================================
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.evictions = 0
+
+    def get(self, key, board):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_board, value = entry
+        if stored_board != board:
+            # 別盤面が同じハッシュ（まず起きないが、結果は変えない）
+            self.collisions += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, board, value):
+        self.entries[key] = (board, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
+
+
+def merge_tt_stats(total, stats):
+    # 並列時のワーカーごとの集計を足し合わせる（size は最大値）
+    if total is None:
+        return dict(stats)
+    out = {k: total[k] + stats[k] for k in ("hits", "misses", "collisions", "evictions")}
+    out["size"] = max(total["size"], stats["size"])
+    return out